@@ -0,0 +1,4 @@
+from webstore.asgi import create_asgi_app
+
+# ASGI entry point: `uvicorn asgi:app` (async catalogue/cart reads, Flask WSGI for the rest)
+app = create_asgi_app()
@@ -0,0 +1,94 @@
+"""Requests/sec for the async (ASGI) read paths vs the sync Flask views.
+
+Both apps run in-process against a throwaway copy of store.db:
+  - async: N concurrent coroutines calling the ASGI app directly
+  - sync:  a thread pool of N workers calling the WSGI app (Flask test client)
+
+Usage:
+    python benchmarks/asgi_vs_wsgi.py [--requests 2000] [--concurrency 64] [--path /products]
+"""
+import argparse
+import asyncio
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from webstore import create_app  # noqa: E402
+from webstore.asgi import AsyncStorefront  # noqa: E402
+
+
+async def _asgi_get(app, path):
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": [],
+             "http_version": "1.1", "scheme": "http", "server": ("bench", 80), "client": ("127.0.0.1", 0)}
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def bench_async(app, path, total, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    await app.pool.start()
+
+    async def one():
+        async with sem:
+            return await _asgi_get(app, path)
+
+    t0 = time.perf_counter()
+    statuses = await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - t0
+    await app.pool.close()
+    return elapsed, statuses
+
+
+def bench_sync(flask_app, path, total, concurrency):
+    def worker(n):
+        client = flask_app.test_client()
+        return [client.get(path).status_code for _ in range(n)]
+
+    per = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        statuses = [s for chunk in ex.map(worker, per) for s in chunk]
+    return time.perf_counter() - t0, statuses
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--path", default="/products")
+    p.add_argument("--pool-size", type=int, default=8)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        shutil.copy(ROOT / "store.db", db_path)
+        flask_app = create_app({"DB_PATH": db_path, "LOG_LEVEL": "WARNING"})
+        asgi_app = AsyncStorefront(flask_app, pool_size=args.pool_size)
+
+        sync_elapsed, sync_status = bench_sync(flask_app, args.path, args.requests, args.concurrency)
+        async_elapsed, async_status = asyncio.run(bench_async(asgi_app, args.path, args.requests, args.concurrency))
+
+    for label, elapsed, statuses in (("sync WSGI", sync_elapsed, sync_status), ("async ASGI", async_elapsed, async_status)):
+        errors = sum(1 for s in statuses if s != 200)
+        print(f"{label:<11} {args.path}: {len(statuses) / elapsed:8.1f} req/s "
+              f"({len(statuses)} requests, concurrency {args.concurrency}, {errors} non-200)")
+
+
+if __name__ == "__main__":
+    main()
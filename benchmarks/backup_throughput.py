@@ -0,0 +1,143 @@
+"""Online backup throughput on a large DB, and what it costs concurrent checkout writers.
+
+Seeds a throwaway DB (WAL mode, like the app) with --orders synthetic orders
+(2M orders is roughly 3 GB), or reuses --db. Then:
+  1. baseline: a writer thread commits small checkout-like transactions for --baseline seconds
+  2. backup: the same writer keeps committing while webstore.backup.create_snapshot runs
+  3. restore: the snapshot is restored into a fresh file (checksums + quick_check)
+and reports backup MB/s, compression ratio, restarts, writer commit p50/p99/max in
+both phases, and restore MB/s.
+
+Usage:
+    python benchmarks/backup_throughput.py [--orders 2000000] [--db big.db] [--workdir DIR]
+                                           [--step-pages 1024] [--step-pause-ms 2] [--level 1]
+                                           [--baseline 10] [--out backup-results.json]
+"""
+import argparse
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import harness
+from webstore import backup  # noqa: E402 (path set up by harness)
+from webstore.db import ensure_schema  # noqa: E402
+
+
+class Writer(threading.Thread):
+    """Commits one small order + stock update per iteration until stopped; records commit latency."""
+
+    def __init__(self, db_path):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.latencies = []
+        self.stop = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        try:
+            while not self.stop.is_set():
+                t0 = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("UPDATE products SET stock = stock - 1 WHERE id = 1")
+                conn.execute("INSERT INTO orders (customer_id, total, status, created_at) "
+                             "VALUES (1, 10.0, 'placed', strftime('%Y-%m-%dT%H:%M:%f', 'now'))")
+                conn.execute("COMMIT")
+                self.latencies.append(time.perf_counter() - t0)
+                time.sleep(0.002)
+        finally:
+            conn.close()
+
+    def finish(self):
+        self.stop.set()
+        self.join()
+        return self.latencies
+
+
+def writer_stats(latencies, elapsed):
+    s = harness.summarize(latencies, elapsed, [], len(latencies))
+    return {k: s[k] for k in ("iterations", "throughput_per_s", "p50_ms", "p99_ms", "max_ms")}
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--orders", type=int, default=2_000_000)
+    p.add_argument("--db", type=Path, help="existing DB to back up (a copy is never made; it is written to)")
+    p.add_argument("--workdir", type=Path, help="where to put the seeded DB and backups (default: temp dir)")
+    p.add_argument("--step-pages", type=int, default=backup.BACKUP_STEP_PAGES)
+    p.add_argument("--step-pause-ms", type=float, default=backup.BACKUP_STEP_PAUSE * 1000)
+    p.add_argument("--level", type=int, default=backup.COMPRESS_LEVEL)
+    p.add_argument("--baseline", type=float, default=10, help="seconds of writer-only baseline")
+    p.add_argument("--out", default="backup-results.json")
+    args = p.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="webstore-backup-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    db_path = args.db or workdir / "bench.db"
+    if not db_path.exists():
+        print(f"seeding {args.orders:,} orders into {db_path} ...", file=sys.stderr)
+        t0 = time.perf_counter()
+        harness.seed_database(db_path, orders=args.orders, customers=max(args.orders // 5, 1000))
+        print(f"seeded in {time.perf_counter() - t0:.0f}s", file=sys.stderr)
+    ensure_schema(db_path, journal_mode="wal")
+    backup_dir = workdir / "backups"
+    try:
+        writer = Writer(db_path)
+        t0 = time.perf_counter()
+        writer.start()
+        time.sleep(args.baseline)
+        baseline = writer_stats(writer.finish(), time.perf_counter() - t0)
+
+        writer = Writer(db_path)
+        t0 = time.perf_counter()
+        writer.start()
+        snapshot_dir, manifest = backup.create_snapshot(
+            db_path, backup_dir, step_pages=args.step_pages, pause=args.step_pause_ms / 1000,
+            level=args.level, progress=lambda msg: print(msg, file=sys.stderr))
+        during = writer_stats(writer.finish(), time.perf_counter() - t0)
+        info = manifest["databases"]["store"]
+
+        target = workdir / "restored" / "store.db"
+        t0 = time.perf_counter()
+        backup.restore_snapshot(backup_dir, target)
+        restore_seconds = time.perf_counter() - t0
+
+        results = {
+            "revision": harness.git_revision(),
+            "db_bytes": info["bytes"],
+            "settings": {"step_pages": args.step_pages, "step_pause_ms": args.step_pause_ms, "level": args.level},
+            "backup": {
+                "seconds": manifest["seconds"],
+                "copy_seconds": info["copy_seconds"],
+                "compress_seconds": info["compress_seconds"],
+                "mb_per_s": info["mb_per_s"],
+                "compressed_bytes": info["gz_bytes"],
+                "compression_ratio": round(info["bytes"] / info["gz_bytes"], 2),
+                "restarts": info["restarts"],
+            },
+            "writer_baseline": baseline,
+            "writer_during_backup": during,
+            "restore": {"seconds": round(restore_seconds, 2),
+                        "mb_per_s": round(info["bytes"] / 1e6 / restore_seconds, 1)},
+        }
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            shutil.rmtree(backup_dir, ignore_errors=True)
+
+    harness.write_json(args.out, results)
+    b = results["backup"]
+    print(f"DB {info['bytes'] / 1e9:.2f} GB: backup {b['seconds']:.1f}s ({b['mb_per_s']} MB/s, "
+          f"copy {b['copy_seconds']:.1f}s + compress {b['compress_seconds']:.1f}s), "
+          f"ratio {b['compression_ratio']}x, restarts {b['restarts']}")
+    for label, s in (("writer baseline", baseline), ("writer during backup", during)):
+        print(f"{label:>21}: {s['iterations']:,} commits, p50 {s['p50_ms']} ms, p99 {s['p99_ms']} ms, max {s['max_ms']} ms")
+    print(f"restore {results['restore']['seconds']:.1f}s ({results['restore']['mb_per_s']} MB/s); written {args.out}")
+
+
+if __name__ == "__main__":
+    main()
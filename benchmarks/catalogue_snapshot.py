@@ -0,0 +1,117 @@
+"""Cart pricing: the array-backed catalogue snapshot vs a dict per product row, at 100k SKUs.
+
+Seeds a throwaway DB with --skus products, then for carts of 10/100/500 lines compares
+  - rows:     fetch the cart's products (json_each query), dict(r) per row, price in a loop
+              (what cart_view/checkout did before webstore/catalogue.py)
+  - snapshot: catalogue version check + CatalogueSnapshot.price_cart
+and reports memory of the whole catalogue held as dict-per-row vs as a snapshot.
+
+Usage:
+    python benchmarks/catalogue_snapshot.py [--skus 100000] [--repeat 200] [--out catalogue-results.json]
+"""
+import argparse
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import harness
+from webstore.catalogue import CatalogueSnapshot, read_version  # noqa: E402 (path set up by harness)
+from webstore.repos import PRODUCTS_BY_SKUS_SQL, PRODUCTS_LIST_SQL, sku_set_param  # noqa: E402
+
+CART_SIZES = (10, 100, 500)
+
+
+def price_rows(conn, cart):
+    """The previous per-request approach, kept here as the baseline."""
+    rows = conn.execute(PRODUCTS_BY_SKUS_SQL, (sku_set_param(cart.keys()),)).fetchall()
+    prod_map = {r["sku"]: dict(r) for r in rows}
+    items, total = [], 0.0
+    for sku, qty in cart.items():
+        p = prod_map.get(sku)
+        if not p:
+            continue
+        q = int(qty)
+        subtotal = (p["price"] or 0.0) * q
+        total += subtotal
+        items.append({"sku": sku, "id": p["id"], "name": p["name"], "price": p["price"] or 0.0, "qty": q,
+                      "stock": p["stock"] or 0, "subtotal": subtotal, "image": p["image"]})
+    return items, total
+
+
+def price_snapshot(conn, snapshot, cart):
+    if read_version(conn) != snapshot.version:  # the per-request freshness check catalogue.current() does
+        raise RuntimeError("catalogue changed during the benchmark")
+    pricing = snapshot.price_cart(cart)
+    return pricing.lines, pricing.total
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return {"p50_ms": round(harness.percentile(times, 50) * 1000, 3),
+            "p99_ms": round(harness.percentile(times, 99) * 1000, 3)}
+
+
+def traced(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--skus", type=int, default=100_000)
+    p.add_argument("--repeat", type=int, default=200)
+    p.add_argument("--out", default="catalogue-results.json")
+    args = p.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="webstore-catalogue-"))
+    try:
+        skus = harness.seed_database(workdir / "bench.db", products=args.skus, customers=100, orders=100)
+        conn = sqlite3.connect(f"file:{workdir / 'bench.db'}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+
+        t0 = time.perf_counter()
+        snapshot = CatalogueSnapshot.load(conn)
+        build_seconds = time.perf_counter() - t0
+        _, snapshot_bytes = traced(lambda: CatalogueSnapshot.load(conn))
+        _, dict_bytes = traced(lambda: {r["sku"]: dict(r) for r in conn.execute(PRODUCTS_LIST_SQL, (-1,))})
+
+        rng = random.Random(1)
+        results = {"revision": harness.git_revision(), "skus": len(snapshot),
+                   "memory": {"snapshot_bytes": snapshot_bytes, "dict_per_row_bytes": dict_bytes,
+                              "ratio": round(dict_bytes / snapshot_bytes, 1)},
+                   "snapshot_build_seconds": round(build_seconds, 3), "carts": {}}
+        for size in CART_SIZES:
+            cart = {sku: rng.randint(1, 5) for sku in rng.sample(skus, size)}
+            expected = price_rows(conn, cart)[1]
+            assert abs(price_snapshot(conn, snapshot, cart)[1] - expected) <= 1e-9 * max(1.0, expected)
+            results["carts"][size] = {"rows": measure(lambda: price_rows(conn, cart), args.repeat),
+                                      "snapshot": measure(lambda: price_snapshot(conn, snapshot, cart), args.repeat)}
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    harness.write_json(args.out, results)
+    m = results["memory"]
+    print(f"{results['skus']:,} SKUs: snapshot {m['snapshot_bytes'] / 1e6:.1f} MB (built in "
+          f"{results['snapshot_build_seconds']:.2f}s) vs dict-per-row {m['dict_per_row_bytes'] / 1e6:.1f} MB ({m['ratio']}x)")
+    for size, r in results["carts"].items():
+        print(f"cart of {size:>3} lines: rows p50 {r['rows']['p50_ms']} ms / p99 {r['rows']['p99_ms']} ms, "
+              f"snapshot p50 {r['snapshot']['p50_ms']} ms / p99 {r['snapshot']['p99_ms']} ms")
+    print(f"written {args.out}")
+
+
+if __name__ == "__main__":
+    main()
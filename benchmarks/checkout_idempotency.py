@@ -0,0 +1,145 @@
+"""Duplicate checkout submissions against a real multi-worker server.
+
+For each round, one customer fills a cart, loads /checkout for its submission key and
+then sends --duplicates identical POSTs at once (double-clicks, retries, replays) from
+--duplicates threads, spread over the server's worker processes. Checks that:
+  - exactly one order (and one set of uploaded documents) exists per round,
+  - every response redirects to that order's order_success page, directly or (when the
+    original was still running) through the /checkout/submitted/ status page, which is
+    polled until it redirects,
+  - stock was decremented once.
+
+Usage:
+    python benchmarks/checkout_idempotency.py [--rounds 20] [--duplicates 8] [--workers 4]
+"""
+import argparse
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import harness
+from run import _bench_key, _free_port, _wait_for
+
+KEY_RE = re.compile(r'name="idempotency_key" value="([^"]+)"')
+FORM = {
+    "agency": "Department of Benchmarks",
+    "authorized_officer": "Bench Officer",
+    "po_number": "PO-1",
+    "contract_reference": "CR-1",
+    "payment_method": "invoice",
+    "declaration": "on",
+}
+
+
+def fetch(driver, path):
+    with driver.opener.open(driver.base_url + path, timeout=60) as resp:
+        return resp.read().decode()
+
+
+def submit(driver, fields):
+    body, content_type = harness.encode_multipart(
+        fields, {"auth_doc": ("auth.pdf", harness.PDF_BYTES), "digital_signature": ("sig.pdf", harness.PDF_BYTES)})
+    req = urllib.request.Request(driver.base_url + "/checkout", data=body, headers={"Content-Type": content_type})
+    try:
+        with driver.opener.open(req, timeout=60) as resp:
+            return resp.status, resp.headers.get("Location")
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("Location")
+
+
+def follow_status(driver, location, timeout=30):
+    """Poll a /checkout/submitted/ page until it redirects; returns where to (others as they are)."""
+    deadline = time.monotonic() + timeout
+    while location and "/checkout/submitted/" in location and time.monotonic() < deadline:
+        req = urllib.request.Request(driver.base_url + location.replace(driver.base_url, ""))
+        try:
+            with driver.opener.open(req, timeout=60) as resp:
+                resp.read()  # still being placed: the page refreshes itself every second
+            time.sleep(0.1)
+        except urllib.error.HTTPError as e:
+            location = e.headers.get("Location") if e.code == 302 else None
+    return location
+
+
+def run_round(base, db_path, n, duplicates, sku):
+    driver = harness.prepare_driver(harness.HttpDriver(base), "checkout", n)
+    driver.post("/cart/add", {"sku": sku, "qty": "1"})
+    match = KEY_RE.search(fetch(driver, "/checkout"))
+    if not match:
+        raise RuntimeError("checkout form has no idempotency_key field")
+    fields = dict(FORM, official_email=driver.email, idempotency_key=match.group(1))
+    # every thread sends the same form with the same session cookie, as a browser retry would
+    with ThreadPoolExecutor(max_workers=duplicates) as ex:
+        responses = list(ex.map(lambda _: submit(driver, fields), range(duplicates)))
+    pending = sum(1 for _, loc in responses if loc and "/checkout/submitted/" in loc)
+    responses = [(status, follow_status(driver, loc)) for status, loc in responses]
+    with sqlite3.connect(db_path) as conn:
+        orders = conn.execute("SELECT id FROM orders WHERE official_email = ?", (driver.email,)).fetchall()
+    return responses, [r[0] for r in orders], pending
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rounds", type=int, default=20)
+    p.add_argument("--duplicates", type=int, default=8)
+    p.add_argument("--workers", type=int, default=4)
+    args = p.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="webstore-idempotency-"))
+    db_path = workdir / "bench.db"
+    uploads = workdir / "uploads"
+    harness.seed_database(db_path, products=10, customers=10, orders=10)
+    with sqlite3.connect(db_path) as conn:
+        sku, stock_before = conn.execute("SELECT sku, stock FROM products ORDER BY id LIMIT 1").fetchone()
+
+    port = _free_port()
+    env = dict(os.environ, DATA_ENC_KEY=_bench_key())
+    proc = subprocess.Popen(
+        [sys.executable, str(Path(__file__).with_name("serve.py")), "--db", str(db_path),
+         "--uploads", str(uploads), "--port", str(port), "--workers", str(args.workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    failures, pending = [], 0
+    try:
+        _wait_for(base)
+        for n in range(args.rounds):
+            responses, orders, waited = run_round(base, db_path, n, args.duplicates, sku)
+            pending += waited
+            expected = {f"/order/success/{orders[0]}"} if len(orders) == 1 else set()
+            locations = {loc and loc.replace(base, "") for _, loc in responses}
+            if len(orders) != 1 or locations != expected or {s for s, _ in responses} != {302}:
+                failures.append({"round": n, "orders": orders, "responses": responses})
+        with sqlite3.connect(db_path) as conn:
+            stock_after = conn.execute("SELECT stock FROM products WHERE sku = ?", (sku,)).fetchone()[0]
+        # saved names are second + filename, so rounds within one second share files: at most 2 per round
+        uploaded = sum(1 for _ in uploads.iterdir()) if uploads.exists() else 0
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if stock_before - stock_after != args.rounds:
+        failures.append({"stock_decrements": stock_before - stock_after, "expected": args.rounds})
+    if uploaded > 2 * args.rounds:
+        failures.append({"uploaded_files": uploaded, "expected_at_most": 2 * args.rounds})
+    print(f"{args.rounds} rounds x {args.duplicates} duplicate POSTs over {args.workers} workers: "
+          f"{args.rounds - len([f for f in failures if 'round' in f])} rounds placed exactly one order; "
+          f"stock -{stock_before - stock_after}, {uploaded} uploaded files; "
+          f"{pending} duplicates answered with the status page")
+    for f in failures:
+        print("FAIL", f)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
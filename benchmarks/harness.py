@@ -0,0 +1,248 @@
+"""Shared pieces for the storefront benchmarks: throwaway DB seeding (SQLite, optionally
+copied into PostgreSQL), HTTP and test-client drivers, the scripted scenarios and
+latency statistics."""
+import http.cookiejar
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import setup_db  # noqa: E402
+from webstore.db import ensure_schema  # noqa: E402
+from webstore.storage import PostgresStorage  # noqa: E402
+
+BENCH_PASSWORD = "Benchmark123"
+PDF_BYTES = b"%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n"
+
+
+# --- throwaway database -----------------------------------------------------
+
+def seed_database(db_path, products=100, customers=1000, orders=5000, seed=1, database_url=None):
+    """
+    Create a fresh store DB at db_path with the given row counts (deterministic for a seed).
+    With database_url, it is then copied into that PostgreSQL database, replacing its contents.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        setup_db.create_schema_and_seed(conn)
+        conn.commit()
+        ensure_schema(db_path)
+        setup_db.generate_scale(conn, orders, customers, max(products - len(setup_db.PRODUCTS), 1), seed=seed,
+                                key=os.environ.get("DATA_ENC_KEY"), blind_index_key=os.environ.get("BLIND_INDEX_KEY"))
+        # plenty of stock so checkout scenarios never run out
+        conn.execute("UPDATE products SET stock = 1000000000")
+        conn.commit()
+        skus = [r[0] for r in conn.execute("SELECT sku FROM products ORDER BY id")]
+    finally:
+        conn.close()
+    if database_url:
+        from webstore.migrate_postgres import copy_sqlite_to_postgres
+        copy_sqlite_to_postgres(db_path, database_url, truncate=True)
+    return skus
+
+
+_pg_storages = {}
+
+
+@contextmanager
+def connect(db_path, database_url=None):
+    """A connection to the benchmark DB (the SQLite file, or PostgreSQL); commits and closes on exit."""
+    if database_url:
+        storage = _pg_storages.get(database_url)
+        if storage is None:
+            storage = _pg_storages[database_url] = PostgresStorage({"DATABASE_URL": database_url, "PG_POOL_MIN_SIZE": 1})
+        conn = storage.connect()
+    else:
+        conn = sqlite3.connect(db_path)
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# --- drivers ----------------------------------------------------------------
+
+class ClientDriver:
+    """Drives the app in-process through the Flask test client (one per virtual user)."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data, files=None):
+        payload = dict(data)
+        for field, (filename, content) in (files or {}).items():
+            payload[field] = (io.BytesIO(content), filename)
+        return self.client.post(path, data=payload, content_type="multipart/form-data" if files else None).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    """Drives a real server over HTTP with its own cookie jar (one per virtual user)."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def _open(self, req):
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data, files=None):
+        if files:
+            body, content_type = encode_multipart(data, files)
+        else:
+            body, content_type = urllib.parse.urlencode(data).encode(), "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=body, headers={"Content-Type": content_type})
+        return self._open(req)
+
+
+def encode_multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    out = io.BytesIO()
+    for name, value in fields.items():
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                  f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        out.write(content)
+        out.write(b"\r\n")
+    out.write(f"--{boundary}--\r\n".encode())
+    return out.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+# --- scenarios --------------------------------------------------------------
+# setup(driver, user_no) runs once per virtual user; step(driver, rng, skus) is one timed
+# iteration and returns the HTTP status codes it saw.
+
+def _login_customer(driver, user_no):
+    email = f"bench-user{user_no}-{uuid.uuid4().hex[:8]}@agency.gov"
+    driver.post("/register", {"name": f"Bench {user_no}", "email": email, "password": BENCH_PASSWORD})
+    return email
+
+
+def _login_admin(driver, user_no):
+    driver.post("/admin/login", {"username": "admin", "password": "password"})
+
+
+def browse(driver, rng, skus):
+    return [driver.get("/products")]
+
+
+def product_detail(driver, rng, skus):
+    return [driver.get(f"/product/{rng.choice(skus)}")]
+
+
+def cart(driver, rng, skus):
+    return [driver.post("/cart/add", {"sku": rng.choice(skus), "qty": "1"}), driver.get("/cart")]
+
+
+def checkout(driver, rng, skus):
+    codes = [driver.post("/cart/add", {"sku": rng.choice(skus), "qty": "1"}), driver.get("/checkout")]
+    codes.append(driver.post("/checkout", {
+        "official_email": driver.email,
+        "agency": "Department of Benchmarks",
+        "authorized_officer": "Bench Officer",
+        "po_number": f"PO-{rng.randint(1, 10**9)}",
+        "contract_reference": "CR-1",
+        "payment_method": "invoice",
+        "declaration": "on",
+        # one submission per iteration (a browser gets this key from the checkout form)
+        "idempotency_key": uuid.uuid4().hex,
+    }, files={"auth_doc": ("auth.pdf", PDF_BYTES), "digital_signature": ("sig.pdf", PDF_BYTES)}))
+    return codes
+
+
+def admin_orders(driver, rng, skus):
+    return [driver.get("/admin/orders" if rng.random() < 0.5 else "/admin/orders?filter=previous")]
+
+
+SCENARIOS = {
+    "browse": (None, browse),
+    "product_detail": (None, product_detail),
+    "cart": (None, cart),
+    "checkout": (_login_customer, checkout),
+    "admin_orders": (_login_admin, admin_orders),
+}
+
+
+def prepare_driver(driver, scenario, user_no):
+    setup, _ = SCENARIOS[scenario]
+    driver.email = setup(driver, user_no) if setup else None
+    return driver
+
+
+# --- statistics -------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(latencies, elapsed, statuses, requests, sql_statements=None):
+    lat = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None  # noqa: E731
+    out = {
+        "iterations": len(lat),
+        "requests": requests,
+        "errors": sum(1 for s in statuses if s >= 400),
+        "throughput_per_s": round(len(lat) / elapsed, 2) if elapsed else None,
+        "mean_ms": ms(sum(lat) / len(lat)) if lat else None,
+        "p50_ms": ms(percentile(lat, 50)),
+        "p95_ms": ms(percentile(lat, 95)),
+        "p99_ms": ms(percentile(lat, 99)),
+        "max_ms": ms(lat[-1]) if lat else None,
+    }
+    if sql_statements is not None:
+        out["sql_statements_total"] = sql_statements
+        out["sql_per_iteration"] = round(sql_statements / len(lat), 2) if lat else None
+    return out
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t0, result
+
+
+def git_revision():
+    try:
+        import subprocess
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT),
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def write_json(path, data):
+    Path(path).write_text(json.dumps(data, indent=2))
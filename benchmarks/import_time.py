@@ -0,0 +1,96 @@
+"""Cold-start benchmark: how long does `import webstore; create_app()` take?
+
+Runs a fresh interpreter with `python -X importtime` several times and reports
+the total self/cumulative import time plus the slowest modules. Also checks
+that heavy modules (SMTP, cryptography) are NOT imported at startup.
+
+Usage:
+    python benchmarks/import_time.py [--runs 5] [--top 15] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SNIPPET = "import webstore; webstore.create_app({'LOG_LEVEL': 'WARNING'})"
+
+# modules that should only be loaded on first use (ssl/email are already
+# pulled in by Werkzeug itself, so only our own heavy imports are checked)
+DEFERRED_MODULES = ("smtplib", "cryptography", "cryptography.fernet")
+
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us)} from `-X importtime` output."""
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            _, rest = line.split(":", 1)
+            self_us, cum_us, name = (p.strip() for p in rest.split("|", 2))
+            out[name.strip()] = (int(self_us), int(cum_us))
+        except ValueError:
+            continue
+    return out
+
+
+def run_once():
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SNIPPET],
+        cwd=str(ROOT), env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr)
+    return wall, parse_importtime(proc.stderr)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--top", type=int, default=15)
+    p.add_argument("--json", help="write results to this file")
+    args = p.parse_args()
+
+    walls, totals, last = [], [], {}
+    for _ in range(args.runs):
+        wall, mods = run_once()
+        walls.append(wall)
+        totals.append(sum(s for s, _ in mods.values()))
+        last = mods
+
+    loaded_heavy = [m for m in DEFERRED_MODULES if m in last]
+    result = {
+        "runs": args.runs,
+        "wall_ms_median": round(statistics.median(walls) * 1000, 1),
+        "import_ms_median": round(statistics.median(totals) / 1000, 1),
+        "modules": len(last),
+        "deferred_modules_loaded": loaded_heavy,
+        "top": [
+            {"module": name, "self_ms": round(s / 1000, 2), "cumulative_ms": round(c / 1000, 2)}
+            for name, (s, c) in sorted(last.items(), key=lambda kv: kv[1][1], reverse=True)[:args.top]
+        ],
+    }
+
+    print(f"interpreter + create_app (median of {args.runs}): {result['wall_ms_median']} ms")
+    print(f"sum of import self-times: {result['import_ms_median']} ms across {result['modules']} modules")
+    for row in result["top"]:
+        print(f"  {row['cumulative_ms']:>8.2f} ms  {row['module']}")
+    if loaded_heavy:
+        print("WARNING: imported at startup:", ", ".join(loaded_heavy))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+    return 1 if loaded_heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
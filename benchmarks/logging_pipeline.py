@@ -0,0 +1,143 @@
+"""Request latency under heavy log volume: logging on the request thread vs the queue pipeline.
+
+Adds a /bench/log route that emits --records log lines per request (message args plus
+`extra=` fields, like the app's own logging) and drives it from --concurrency threads
+through the Flask test client, with the output going to a temp file whose writes take
+--sink-delay-us each (a slow disk or log shipper; 0 = plain file). Modes:
+  - sync:  the output handler sits directly on the root logger, as logging.basicConfig
+           set things up before webstore/log.py: formatting and writes on the request thread
+  - queue: webstore/log.py (QueueHandler on the request thread, QueueListener writing)
+Both use the same JSON formatter and request-id filter. Reports p50/p95/p99 per mode, and
+for the queue mode how long the listener took to drain afterwards and how many records
+the bounded queue dropped.
+
+Usage:
+    python benchmarks/logging_pipeline.py [--requests 2000] [--records 20] [--concurrency 8]
+                                          [--sink-delay-us 20] [--queue-size 10000] [--out log-results.json]
+"""
+import argparse
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import harness
+from webstore import create_app, log  # noqa: E402 (path set up by harness)
+
+
+class SlowFile:
+    """A text file whose every write takes `delay` seconds longer."""
+
+    def __init__(self, path, delay):
+        self.f = open(path, "a", encoding="utf-8")
+        self.delay = delay
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        self.f.write(text)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def make_app(workdir, records):
+    app = create_app({
+        "DB_PATH": workdir / "bench.db",
+        "PRIVATE_UPLOADS": workdir / "uploads",
+        "WEBSTORE_ENV": "production",
+        "LOG_SAMPLING": "",
+        "STOCK_HOLD_SWEEP_SECONDS": 0,
+    })
+    bench_log = logging.getLogger("webstore.bench")
+
+    @app.route("/bench/log")
+    def bench_log_view():
+        for n in range(records):
+            bench_log.info("Priced cart line %d of %d for %s", n, records, "SKU-123",
+                           extra={"sku": "SKU-123", "qty": n, "subtotal": n * 9.95})
+        return "ok"
+
+    return app
+
+
+def drive(app, requests, concurrency):
+    clients = threading.local()
+
+    def one(_):
+        if not hasattr(clients, "c"):
+            clients.c = app.test_client()
+        elapsed, resp = harness.timed(clients.c.get, "/bench/log")
+        return elapsed, resp.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    return [r[0] for r in results], [r[1] for r in results], time.perf_counter() - started
+
+
+def run_mode(mode, workdir, args):
+    settings = {"level": "INFO", "format": "json", "sampling": {}, "file": None, "queue_size": args.queue_size}
+    sink_path = workdir / f"{mode}.log"
+    target = log.build_handler(settings, stream=SlowFile(sink_path, args.sink_delay_us / 1e6))
+    app = make_app(workdir, args.records)
+    root = logging.getLogger()
+    if mode == "sync":
+        log.shutdown()
+        target.addFilter(log.RequestContextFilter())
+        root.addHandler(target)
+        root.setLevel(logging.INFO)
+    else:
+        handler = log.install(settings, target)
+    try:
+        latencies, statuses, elapsed = drive(app, args.requests, args.concurrency)
+        result = harness.summarize(latencies, elapsed, statuses, args.requests)
+        if mode == "queue":
+            dropped = handler.dropped_total
+            drain_started = time.perf_counter()
+            log.shutdown()
+            result["drain_after_run_ms"] = round((time.perf_counter() - drain_started) * 1000, 1)
+            result["dropped_records"] = dropped
+    finally:
+        if mode == "sync":
+            root.removeHandler(target)
+            target.close()
+        log.shutdown()
+    result["records_written"] = sum(1 for _ in open(sink_path, encoding="utf-8"))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--records", type=int, default=20, help="log lines per request")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sink-delay-us", type=float, default=20, help="extra time per write to the log file")
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--out", default="log-results.json")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="webstore-logbench-"))
+    try:
+        harness.seed_database(workdir / "bench.db", products=20, customers=10, orders=10)
+        results = {"git": harness.git_revision(), "params": vars(args), "modes": {}}
+        for mode in ("sync", "queue"):
+            results["modes"][mode] = r = run_mode(mode, workdir, args)
+            extra = (f"  drain {r['drain_after_run_ms']} ms, dropped {r['dropped_records']}"
+                     if mode == "queue" else "")
+            print(f"{mode:>5}: p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms  "
+                  f"{r['throughput_per_s']} req/s  {r['records_written']} lines written{extra}")
+        harness.write_json(args.out, results)
+        print(f"wrote {args.out}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Reproducible storefront load test.
+
+Seeds a throwaway SQLite DB (copied into PostgreSQL with --database-url), then runs the
+scripted scenarios (browse, product_detail, cart, checkout with uploads, admin_orders)
+either in-process through the Flask test client or over HTTP against a real multi-worker
+server (benchmarks/serve.py), and writes p50/p95/p99 latency, throughput and SQL
+statement counts per scenario to JSON.
+
+Usage:
+    python benchmarks/run.py [--mode client|server|both] [--products 100] [--customers 1000]
+                             [--orders 5000] [--iterations 200] [--concurrency 8] [--workers 4]
+                             [--scenarios browse,checkout] [--out results.json] [--compare old.json]
+                             [--database-url postgresql://localhost/webstore_bench]
+
+Latency is per scenario iteration (e.g. one cart iteration = add + view). SQL counts
+come from the connections' trace callback and are only available in client mode.
+--database-url runs the app on the PostgreSQL backend; everything in that database is
+replaced by the seeded data.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import harness
+from webstore import create_app  # noqa: E402 (path set up by harness)
+
+
+def _bench_key():
+    key = os.environ.get("DATA_ENC_KEY")
+    if key:
+        return key
+    from cryptography.fernet import Fernet
+    return Fernet.generate_key().decode()
+
+
+def run_client(workdir, skus, scenarios, iterations, seed, database_url=None):
+    """Sequential in-process run; also counts SQL statements per scenario."""
+    counter = {"n": 0}
+
+    def count_statements(conn):
+        conn.set_trace_callback(lambda _sql: counter.__setitem__("n", counter["n"] + 1))
+
+    app = create_app({
+        "DB_PATH": workdir / "bench.db",
+        "DATABASE_URL": database_url,
+        "PRIVATE_UPLOADS": workdir / "uploads",
+        "READ_SNAPSHOT_PATH": workdir / "bench.snapshot.db",
+        "LOG_LEVEL": "WARNING",
+        "METRICS_ENABLED": False,
+        # every virtual user logs in from 127.0.0.1: don't let the login throttle skew results
+        "LOGIN_ATTEMPTS_PER_EMAIL": 0,
+        "LOGIN_ATTEMPTS_PER_IP": 0,
+    })
+    app.extensions["webstore"].setdefault("connection_hooks", []).append(count_statements)
+
+    results = {}
+    for name in scenarios:
+        _, step = harness.SCENARIOS[name]
+        rng = random.Random(seed)
+        driver = harness.prepare_driver(harness.ClientDriver(app), name, 0)
+        step(driver, rng, skus)  # warm-up (template compile, statement cache)
+        counter["n"] = 0
+        latencies, statuses = [], []
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            dt, codes = harness.timed(step, driver, rng, skus)
+            latencies.append(dt)
+            statuses.extend(codes)
+        elapsed = time.perf_counter() - t0
+        results[name] = harness.summarize(latencies, elapsed, statuses, len(statuses), counter["n"])
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            harness.HttpDriver(url).get("/about")
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server at {url} did not come up")
+
+
+def run_server(workdir, skus, scenarios, iterations, concurrency, workers, seed, database_url=None):
+    """Concurrent run over HTTP against benchmarks/serve.py (Werkzeug forking server)."""
+    port = _free_port()
+    env = dict(os.environ, DATA_ENC_KEY=os.environ["DATA_ENC_KEY"])
+    cmd = [sys.executable, str(Path(__file__).with_name("serve.py")), "--db", str(workdir / "bench.db"),
+           "--uploads", str(workdir / "uploads"), "--port", str(port), "--workers", str(workers)]
+    if database_url:
+        cmd += ["--database-url", database_url]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        _wait_for(base)
+        results = {}
+        for name in scenarios:
+            _, step = harness.SCENARIOS[name]
+            drivers = [harness.prepare_driver(harness.HttpDriver(base), name, n) for n in range(concurrency)]
+            lock = threading.Lock()
+            latencies, statuses = [], []
+            per_user = max(1, iterations // concurrency)
+
+            def user(n):
+                rng = random.Random(seed + n)
+                step(drivers[n], rng, skus)  # warm-up
+                mine, codes = [], []
+                for _ in range(per_user):
+                    dt, c = harness.timed(step, drivers[n], rng, skus)
+                    mine.append(dt)
+                    codes.extend(c)
+                with lock:
+                    latencies.extend(mine)
+                    statuses.extend(codes)
+
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as ex:
+                list(ex.map(user, range(concurrency)))
+            elapsed = time.perf_counter() - t0
+            results[name] = harness.summarize(latencies, elapsed, statuses, len(statuses))
+        return results
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def compare(current, baseline_path):
+    """Print p95/throughput deltas against a previous results file."""
+    baseline = json.loads(Path(baseline_path).read_text())
+    for mode, scenarios in current["results"].items():
+        for name, cur in scenarios.items():
+            old = baseline.get("results", {}).get(mode, {}).get(name)
+            if not old or not old.get("p95_ms") or not cur.get("p95_ms"):
+                continue
+            p95 = (cur["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+            tput = (cur["throughput_per_s"] - old["throughput_per_s"]) / old["throughput_per_s"] * 100
+            print(f"{mode:6} {name:15} p95 {old['p95_ms']:>9.2f} -> {cur['p95_ms']:>9.2f} ms ({p95:+.1f}%)"
+                  f"  throughput {tput:+.1f}%")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--mode", choices=("client", "server", "both"), default="client")
+    p.add_argument("--products", type=int, default=100)
+    p.add_argument("--customers", type=int, default=1000)
+    p.add_argument("--orders", type=int, default=5000)
+    p.add_argument("--iterations", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--scenarios", default=",".join(harness.SCENARIOS))
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default="benchmark-results.json")
+    p.add_argument("--compare", help="previous results JSON to diff against")
+    p.add_argument("--database-url", help="run against this PostgreSQL database (its contents are replaced)")
+    args = p.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(harness.SCENARIOS)
+    if unknown:
+        p.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    os.environ["DATA_ENC_KEY"] = _bench_key()
+
+    with tempfile.TemporaryDirectory(prefix="webstore-bench-") as tmp:
+        workdir = Path(tmp)
+        (workdir / "uploads").mkdir()
+        t0 = time.perf_counter()
+        skus = harness.seed_database(workdir / "bench.db", args.products, args.customers, args.orders, args.seed,
+                                     database_url=args.database_url)
+        seeded_in = time.perf_counter() - t0
+
+        report = {
+            "revision": harness.git_revision(),
+            "python": sys.version.split()[0],
+            "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "database_url")},
+            "backend": "postgres" if args.database_url else "sqlite",
+            "seed_seconds": round(seeded_in, 3),
+            "results": {},
+        }
+        if args.mode in ("client", "both"):
+            report["results"]["client"] = run_client(workdir, skus, scenarios, args.iterations, args.seed,
+                                                     args.database_url)
+        if args.mode in ("server", "both"):
+            report["results"]["server"] = run_server(workdir, skus, scenarios, args.iterations,
+                                                     args.concurrency, args.workers, args.seed, args.database_url)
+
+    harness.write_json(args.out, report)
+    for mode, scenarios_out in report["results"].items():
+        for name, r in scenarios_out.items():
+            sql = f"  sql/iter {r['sql_per_iteration']}" if "sql_per_iteration" in r else ""
+            print(f"{mode:6} {name:15} p50 {r['p50_ms']:>8} p95 {r['p95_ms']:>8} p99 {r['p99_ms']:>8} ms"
+                  f"  {r['throughput_per_s']:>8}/s  errors {r['errors']}{sql}")
+    print(f"wrote {args.out}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
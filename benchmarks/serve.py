@@ -0,0 +1,104 @@
+"""Run the app with N long-lived worker processes (used by run.py --mode server).
+
+    python benchmarks/serve.py --db /tmp/bench.db --uploads /tmp/uploads --port 5055 --workers 4
+                               [--database-url postgresql://...]
+
+Uses gunicorn when it is installed; otherwise pre-forks N Werkzeug servers sharing one
+listening socket (POSIX only; elsewhere falls back to Werkzeug's fork-per-request mode).
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore import create_app  # noqa: E402
+from webstore.catalogue import preload  # noqa: E402
+
+
+def build_app(db, uploads, database_url=None):
+    return create_app({
+        "DB_PATH": Path(db),
+        "DATABASE_URL": database_url,
+        "PRIVATE_UPLOADS": Path(uploads),
+        "READ_SNAPSHOT_PATH": Path(db).with_suffix(".snapshot.db"),
+        "LOG_LEVEL": "WARNING",
+        # compiled here, before the fork, like the catalogue snapshot below
+        "TEMPLATE_PRECOMPILE": True,
+        # every virtual user logs in from 127.0.0.1: don't let the login throttle skew results
+        "LOGIN_ATTEMPTS_PER_EMAIL": 0,
+        "LOGIN_ATTEMPTS_PER_IP": 0,
+    })
+
+
+def serve_gunicorn(app, host, port, workers):
+    from gunicorn.app.base import BaseApplication
+
+    class _App(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("loglevel", "warning")
+
+        def load(self):
+            return app
+
+    _App().run()
+
+
+def serve_prefork(app, host, port, workers):
+    from werkzeug.serving import make_server
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            make_server(host, port, app, fd=sock.fileno()).serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop(*_):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in children:
+        os.wait()
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", required=True)
+    p.add_argument("--uploads", required=True)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=5055)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--database-url", help="serve from PostgreSQL instead of --db")
+    args = p.parse_args()
+
+    app = build_app(args.db, args.uploads, args.database_url)
+    # built once here, so forked workers share its pages instead of each loading the catalogue
+    preload(app)
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        if hasattr(os, "fork"):
+            serve_prefork(app, args.host, args.port, args.workers)
+        else:
+            from werkzeug.serving import run_simple
+            run_simple(args.host, args.port, app, threaded=False, processes=args.workers, use_reloader=False)
+        return
+    serve_gunicorn(app, args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Many shoppers racing for a scarce SKU (B2, one unit by default) on a multi-worker server.
+
+Phase 1: --users shoppers add B2 to their carts at the same moment. Stock holds must let
+exactly --units of them hold it. Phase 2: all of them submit checkout at once; exactly
+--units orders may contain B2, stock must end at 0, and the shoppers who lost are sent
+back to their cart before any upload/encryption work (their latency is reported next to
+the winners').
+
+Usage:
+    python benchmarks/stock_hold_contention.py [--users 16] [--units 1] [--workers 4] [--rounds 5]
+                                               [--database-url postgresql://...]
+
+--database-url serves from PostgreSQL (row locks instead of SQLite's write lock); its
+contents are replaced by the seeded data.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import harness
+from checkout_idempotency import FORM, KEY_RE, submit
+from run import _bench_key, _free_port, _wait_for
+
+SKU = "B2"
+
+
+def checkout(driver):
+    """GET /checkout then POST it; returns (seconds for the POST, redirect path)."""
+    try:
+        with driver.opener.open(driver.base_url + "/checkout", timeout=60) as resp:
+            match = KEY_RE.search(resp.read().decode())
+    except urllib.error.HTTPError as e:  # redirected straight back: nothing (left) to buy
+        return 0.0, e.headers.get("Location")
+    t0 = time.perf_counter()
+    _, location = submit(driver, dict(FORM, official_email=driver.email, idempotency_key=match.group(1)))
+    return time.perf_counter() - t0, location
+
+
+def run_round(base, db_path, database_url, users, units, n):
+    with harness.connect(db_path, database_url) as conn:
+        conn.execute("UPDATE products SET stock = ? WHERE sku = ?", (units, SKU))
+        conn.execute("DELETE FROM stock_holds")
+    drivers = [harness.prepare_driver(harness.HttpDriver(base), "checkout", n * users + i) for i in range(users)]
+    start = threading.Barrier(users)
+
+    def add(driver):
+        start.wait()
+        driver.post("/cart/add", {"sku": SKU, "qty": "1"})
+
+    with ThreadPoolExecutor(max_workers=users) as ex:
+        list(ex.map(add, drivers))
+    with harness.connect(db_path, database_url) as conn:
+        holders = conn.execute("SELECT COUNT(*), COALESCE(SUM(qty), 0) FROM stock_holds h JOIN products p "
+                               "ON p.id = h.product_id WHERE p.sku = ?", (SKU,)).fetchone()
+
+    with ThreadPoolExecutor(max_workers=users) as ex:
+        outcomes = list(ex.map(checkout, drivers))
+    with harness.connect(db_path, database_url) as conn:
+        stock = conn.execute("SELECT stock FROM products WHERE sku = ?", (SKU,)).fetchone()[0]
+        emails = [d.email for d in drivers]
+        sold = conn.execute(
+            "SELECT COALESCE(SUM(oi.quantity), 0) FROM orders o JOIN order_items oi ON oi.order_id = o.id "
+            "JOIN products p ON p.id = oi.product_id WHERE p.sku = ? AND o.official_email IN "
+            "(SELECT value FROM json_each(?))", (SKU, json.dumps(emails))).fetchone()[0]
+    won = [dt for dt, loc in outcomes if loc and "/order/success/" in loc]
+    lost = [dt for dt, loc in outcomes if not (loc and "/order/success/" in loc)]
+    return {"holders": holders[0], "held_units": holders[1], "sold": sold, "stock_left": stock,
+            "winners": len(won), "winner_ms": won, "loser_ms": lost}
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--users", type=int, default=16)
+    p.add_argument("--units", type=int, default=1)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--rounds", type=int, default=5)
+    p.add_argument("--database-url", help="serve from this PostgreSQL database (its contents are replaced)")
+    args = p.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="webstore-holds-"))
+    db_path = workdir / "bench.db"
+    harness.seed_database(db_path, products=10, customers=10, orders=10, database_url=args.database_url)
+    port = _free_port()
+    env = dict(os.environ, DATA_ENC_KEY=_bench_key())
+    cmd = [sys.executable, str(Path(__file__).with_name("serve.py")), "--db", str(db_path),
+           "--uploads", str(workdir / "uploads"), "--port", str(port), "--workers", str(args.workers)]
+    if args.database_url:
+        cmd += ["--database-url", args.database_url]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    failures, winners, losers = [], [], []
+    try:
+        _wait_for(base)
+        for n in range(args.rounds):
+            r = run_round(base, db_path, args.database_url, args.users, args.units, n)
+            winners += r.pop("winner_ms")
+            losers += [dt for dt in r.pop("loser_ms") if dt]
+            ok = (r["held_units"] == args.units and r["sold"] == args.units
+                  and r["stock_left"] == 0 and r["winners"] == args.units)
+            print(f"round {n}: {'ok  ' if ok else 'FAIL'} {r}")
+            if not ok:
+                failures.append(r)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    def ms(values):
+        return f"{1000 * sum(values) / len(values):.1f} ms" if values else "n/a"
+
+    print(f"{args.users} shoppers x {args.rounds} rounds for {args.units} unit(s) of {SKU}: "
+          f"{len(failures)} failed rounds; checkout POST mean {ms(winners)} (won) vs {ms(losers)} (lost "
+          f"after reaching the form; most losers are turned away at the checkout GET)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
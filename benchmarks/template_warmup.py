@@ -0,0 +1,118 @@
+"""First-request latency in a freshly forked worker: template compilation on first use vs cached.
+
+For each mode a new interpreter builds the app the way a pre-fork server does, forks,
+and the child times the first request to each page in --pages (as a logged-in customer
+with a cart and an admin, so /checkout and /admin/orders render fully). Modes:
+  - cold:        no bytecode cache, nothing precompiled (every template compiled on first use)
+  - bytecode:    TEMPLATE_CACHE_DIR already populated (templates loaded from the cache)
+  - precompiled: TEMPLATE_PRECOMPILE in the parent before the fork (templates already in memory)
+Everything else (DB connections, the catalogue snapshot, lazy imports) is the same in
+all modes. Each mode runs --runs times; the median per page is reported.
+
+Usage:
+    python benchmarks/template_warmup.py [--runs 5] [--pages /,/products,...] [--out warmup-results.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import harness
+
+MODES = ("cold", "bytecode", "precompiled")
+PAGES = ("/", "/products", "/product/F35", "/cart", "/checkout", "/account/orders", "/admin/orders", "/about")
+
+
+def child(mode, db, cache_dir, pages):
+    """Runs in the per-mode interpreter: build the app, fork, time the first requests in the child."""
+    from webstore import create_app
+    app = create_app({
+        "DB_PATH": Path(db),
+        "PRIVATE_UPLOADS": Path(db).parent / "uploads",
+        "READ_SNAPSHOT_PATH": Path(db).with_suffix(".snapshot.db"),
+        "WEBSTORE_ENV": "test",
+        "STOCK_HOLD_SWEEP_SECONDS": 0,
+        "TEMPLATE_CACHE_DIR": cache_dir if mode != "cold" else "",
+        "TEMPLATE_PRECOMPILE": mode == "precompiled",
+    })
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid:
+        os.close(write)
+        with os.fdopen(read) as f:
+            out = f.read()
+        os.waitpid(pid, 0)
+        print(out)
+        return
+    os.close(read)
+    client = app.test_client()
+    now = time.time()
+    with client.session_transaction() as sess:
+        sess.update(customer_id=1, customer_name="Bench", cart={"F35": 1}, is_admin=True,
+                    last_active=now, created_at=now)
+    timings = {}
+    for page in pages:
+        elapsed, resp = harness.timed(client.get, page)
+        timings[page] = (round(elapsed * 1000, 3), resp.status_code)
+    with os.fdopen(write, "w") as f:
+        f.write(json.dumps(timings))
+    os._exit(0)
+
+
+def run(mode, db, cache_dir, pages):
+    cmd = [sys.executable, __file__, "--child", mode, "--db", str(db), "--cache-dir", str(cache_dir),
+           "--pages", ",".join(pages)]
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"))
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--pages", default=",".join(PAGES))
+    p.add_argument("--out", default="warmup-results.json")
+    p.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    p.add_argument("--db", help=argparse.SUPPRESS)
+    p.add_argument("--cache-dir", help=argparse.SUPPRESS)
+    args = p.parse_args()
+    pages = args.pages.split(",")
+    if args.child:
+        return child(args.child, args.db, args.cache_dir, pages)
+
+    workdir = Path(tempfile.mkdtemp(prefix="webstore-warmup-"))
+    try:
+        db = workdir / "bench.db"
+        harness.seed_database(db, products=100, customers=100, orders=500)
+        cache_dir = workdir / "template_cache"
+        run("bytecode", db, cache_dir, pages)  # populate the bytecode cache once
+        results = {"git": harness.git_revision(), "runs": args.runs, "modes": {}}
+        for mode in MODES:
+            samples = [run(mode, db, cache_dir, pages) for _ in range(args.runs)]
+            bad = {page: status for s in samples for page, (_, status) in s.items() if status >= 400}
+            if bad:
+                raise SystemExit(f"{mode}: error responses {bad}")
+            per_page = {page: statistics.median(s[page][0] for s in samples) for page in pages}
+            total = statistics.median(sum(ms for ms, _ in s.values()) for s in samples)
+            results["modes"][mode] = {"first_request_ms": per_page, "all_pages_ms": round(total, 3)}
+        width = max(map(len, pages))
+        print(f"{'page':<{width}}  " + "  ".join(f"{m:>11}" for m in MODES))
+        for page in pages:
+            print(f"{page:<{width}}  " + "  ".join(f"{results['modes'][m]['first_request_ms'][page]:>8.1f} ms"
+                                                   for m in MODES))
+        print(f"{'total':<{width}}  " + "  ".join(f"{results['modes'][m]['all_pages_ms']:>8.1f} ms" for m in MODES))
+        harness.write_json(args.out, results)
+        print(f"wrote {args.out}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
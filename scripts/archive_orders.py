@@ -0,0 +1,51 @@
+"""Move finished orders older than N days from store.db into the archive DB.
+
+    python scripts/archive_orders.py [--older-than-days 180] [--batch-size 1000] [--vacuum] [--dry-run]
+
+Safe to run while the app is serving (each batch is a short transaction) and to
+re-run after an interruption. --vacuum rewrites store.db afterwards so the file
+itself shrinks (this holds the write lock for the duration).
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore.archive import ARCHIVE_BATCH_SIZE, archive_orders, format_bytes  # noqa: E402
+from webstore.config import load_config  # noqa: E402
+from webstore.db import ensure_schema  # noqa: E402
+
+
+def main():
+    config = load_config()
+    p = argparse.ArgumentParser()
+    p.add_argument("--older-than-days", type=int, default=config["ARCHIVE_AFTER_DAYS"])
+    p.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    p.add_argument("--vacuum", action="store_true", help="VACUUM store.db afterwards to shrink the file")
+    p.add_argument("--dry-run", action="store_true", help="only count what would be archived")
+    p.add_argument("--db", type=Path, default=config["DB_PATH"])
+    p.add_argument("--archive", type=Path, default=config["ARCHIVE_DB_PATH"])
+    args = p.parse_args()
+
+    ensure_schema(args.db)
+    t0 = time.perf_counter()
+    stats = archive_orders(args.db, args.archive, args.older_than_days, batch_size=args.batch_size,
+                           vacuum=args.vacuum, dry_run=args.dry_run,
+                           progress=lambda msg: print(msg, file=sys.stderr))
+    if args.dry_run:
+        print(f"{stats['orders']:,} orders created before {stats['cutoff']} would be archived")
+        return
+    print(f"Archived {stats['orders']:,} orders ({stats['order_items']:,} items) created before {stats['cutoff']} "
+          f"in {time.perf_counter() - t0:.1f}s")
+    if stats["kept"]:
+        print(f"{stats['kept']:,} orders changed while being archived and were left in the hot DB")
+    print(f"Hot DB data: {format_bytes(stats['used_bytes_before'])} -> {format_bytes(stats['used_bytes_after'])}; "
+          f"file: {format_bytes(stats['file_bytes_before'])} -> {format_bytes(stats['file_bytes_after'])}")
+    if not args.vacuum and stats["orders"]:
+        print("(freed pages are reused by new rows; run with --vacuum to shrink the file)")
+
+
+if __name__ == "__main__":
+    main()
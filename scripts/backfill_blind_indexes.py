@@ -0,0 +1,53 @@
+"""Compute the search blind indexes for orders placed before they existed (see webstore/blind_index.py).
+
+    python scripts/backfill_blind_indexes.py [--db store.db] [--batch-size 2000] [--rehash]
+
+Needs DATA_ENC_KEY (env or .env): the searchable fields are decrypted once to hash them,
+under BLIND_INDEX_KEY if set, else a key derived from DATA_ENC_KEY. Runs in short
+batches, so it is safe while the app is serving, and can be interrupted and rerun
+(orders that already have their indexes are skipped). After the index key changes
+(a new BLIND_INDEX_KEY, or a new DATA_ENC_KEY without one), restart the app with the
+new key and run with --rehash to recompute every order's indexes, then
+scripts/rebuild_rollups.py for the agency rollups.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore.blind_index import BACKFILL_BATCH, backfill  # noqa: E402
+from webstore.config import load_config  # noqa: E402
+from webstore.db import ensure_schema  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", type=Path)
+    p.add_argument("--batch-size", type=int, default=BACKFILL_BATCH)
+    p.add_argument("--rehash", action="store_true", help="recompute all indexes (after the index key changed)")
+    args = p.parse_args()
+    config = load_config()
+    if not config["DATA_ENC_KEY"]:
+        sys.exit("Set DATA_ENC_KEY before running this script.")
+    db_path = args.db or config["DB_PATH"]
+    ensure_schema(db_path)
+
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        updated, failed = backfill(conn, config["DATA_ENC_KEY"], batch_size=args.batch_size,
+                                   progress=lambda msg: print(msg, file=sys.stderr),
+                                   blind_index_key=config["BLIND_INDEX_KEY"], rehash=args.rehash)
+    finally:
+        conn.close()
+    print(f"Indexed {updated:,} orders in {time.perf_counter() - t0:.1f}s")
+    if failed:
+        print(f"{failed:,} field values could not be decrypted with DATA_ENC_KEY and were left unindexed",
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Online backups of store.db (+ store.archive.db and referenced uploads) and point-in-time restore.
+
+    python scripts/backup.py create [--every MINUTES] [--keep N]
+    python scripts/backup.py list
+    python scripts/backup.py verify [--at TIME]
+    python scripts/backup.py restore --target restored.db [--at 2025-01-31T18:00] [--uploads-target dir]
+    python scripts/backup.py prune --keep N
+
+Safe while the app is serving: the copy runs in small page steps and never holds
+the write lock. --every keeps running and takes a snapshot every MINUTES (run it
+under a service manager, or set BACKUP_INTERVAL_MINUTES to do the same in-app).
+restore never overwrites: point --target at a fresh file, check it, then swap it in
+with the app stopped. Times are UTC.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore import backup  # noqa: E402
+from webstore.archive import format_bytes  # noqa: E402
+from webstore.config import load_config  # noqa: E402
+
+
+def log(msg):
+    print(msg, file=sys.stderr)
+
+
+def cmd_create(args, config):
+    config = dict(config, DB_PATH=args.db or config["DB_PATH"], BACKUP_DIR=args.backup_dir,
+                  ARCHIVE_DB_PATH=args.archive or (config["ARCHIVE_DB_PATH"] if args.db is None else None))
+    if args.every:
+        log(f"taking a snapshot every {args.every:g} minutes into {args.backup_dir} (Ctrl+C to stop)")
+        while True:
+            try:
+                snapshot_dir = backup.run_due_backup(config, args.every, args.keep, progress=log)
+                if snapshot_dir:
+                    print(f"snapshot {snapshot_dir.name}", flush=True)
+            except Exception as e:  # keep the schedule going; the next run retries
+                log(f"backup failed: {e}")
+            time.sleep(min(60, args.every * 60))
+    snapshot_dir, manifest = backup.create_snapshot(
+        config["DB_PATH"], args.backup_dir, uploads_dir=config["PRIVATE_UPLOADS"],
+        archive_path=config["ARCHIVE_DB_PATH"], step_pages=args.step_pages,
+        pause=args.step_pause_ms / 1000, level=args.level, progress=log)
+    for role, info in manifest["databases"].items():
+        print(f"{role}: {format_bytes(info['bytes'])} -> {format_bytes(info['gz_bytes'])} "
+              f"({info['mb_per_s']} MB/s, sha256 {info['sha256'][:12]})")
+    print(f"Snapshot {snapshot_dir} ({len(manifest['uploads'])} uploads, "
+          f"{len(manifest['missing_uploads'])} missing) in {manifest['seconds']:.1f}s")
+    if args.keep:
+        removed, blobs = backup.prune_snapshots(args.backup_dir, args.keep)
+        if removed or blobs:
+            print(f"Pruned {removed} snapshots, {blobs} unreferenced upload blobs")
+
+
+def cmd_list(args, config):
+    snapshots = backup.list_snapshots(args.backup_dir)
+    if not snapshots:
+        print(f"No snapshots in {args.backup_dir}")
+    for d, m in snapshots:
+        dbs = ", ".join(f"{role} {format_bytes(i['gz_bytes'])}" for role, i in m["databases"].items())
+        print(f"{d.name}  taken {m['taken_at']}  {dbs}  uploads {len(m['uploads'])}")
+
+
+def cmd_verify(args, config):
+    snapshots = [backup.find_snapshot(args.backup_dir, args.at)] if args.at else backup.list_snapshots(args.backup_dir)
+    bad = 0
+    for d, m in snapshots:
+        problems = backup.verify_snapshot(args.backup_dir, d, m)
+        print(f"{d.name}: {'ok' if not problems else '; '.join(problems)}")
+        bad += bool(problems)
+    sys.exit(1 if bad else 0)
+
+
+def cmd_restore(args, config):
+    try:
+        snapshot_dir, manifest = backup.restore_snapshot(
+            args.backup_dir, args.target, at=args.at, archive_target=args.archive_target,
+            uploads_target=args.uploads_target, progress=log)
+    except backup.BackupError as e:
+        sys.exit(f"restore failed: {e}")
+    print(f"Restored snapshot {snapshot_dir.name} (taken {manifest['taken_at']}) to {args.target}")
+
+
+def cmd_prune(args, config):
+    removed, blobs = backup.prune_snapshots(args.backup_dir, args.keep)
+    print(f"Pruned {removed} snapshots, {blobs} unreferenced upload blobs")
+
+
+def main():
+    config = load_config()
+    p = argparse.ArgumentParser()
+    p.add_argument("--backup-dir", type=Path, default=config["BACKUP_DIR"])
+    sub = p.add_subparsers(dest="command", required=True)
+
+    c = sub.add_parser("create", help="take a snapshot now (or every --every minutes)")
+    c.add_argument("--db", type=Path)
+    c.add_argument("--archive", type=Path, help="archive DB (default: ARCHIVE_DB_PATH unless --db is given)")
+    c.add_argument("--every", type=float, help="keep running, one snapshot every MINUTES")
+    c.add_argument("--keep", type=int, help="prune to the newest N snapshots afterwards")
+    c.add_argument("--step-pages", type=int, default=backup.BACKUP_STEP_PAGES)
+    c.add_argument("--step-pause-ms", type=float, default=backup.BACKUP_STEP_PAUSE * 1000)
+    c.add_argument("--level", type=int, default=backup.COMPRESS_LEVEL, help="gzip level 1-9")
+    c.set_defaults(func=cmd_create)
+
+    sub.add_parser("list", help="list snapshots").set_defaults(func=cmd_list)
+
+    v = sub.add_parser("verify", help="re-check snapshot checksums")
+    v.add_argument("--at", help="only the snapshot restore --at would use")
+    v.set_defaults(func=cmd_verify)
+
+    r = sub.add_parser("restore", help="restore into a fresh file")
+    r.add_argument("--target", type=Path, required=True)
+    r.add_argument("--at", help="UTC time (ISO); newest snapshot taken at or before it (default: newest)")
+    r.add_argument("--archive-target", type=Path, help="default: <target>.archive.db")
+    r.add_argument("--uploads-target", type=Path, help="also copy the referenced uploads here")
+    r.set_defaults(func=cmd_restore)
+
+    pr = sub.add_parser("prune", help="keep only the newest N snapshots")
+    pr.add_argument("--keep", type=int, required=True)
+    pr.set_defaults(func=cmd_prune)
+
+    args = p.parse_args()
+    args.func(args, config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Bulk catalogue import/export from the command line.
+
+    python scripts/catalogue.py import products.csv [--format csv|jsonl] [--db store.db]
+    python scripts/catalogue.py export products.jsonl [--format csv|jsonl] [--db store.db]
+
+Import upserts by SKU (rows without a SKU get one generated from the name) and prints
+per-line errors; export streams the catalogue to the file (or stdout with "-").
+"""
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore.catalogue_io import detect_format, export_products, import_products  # noqa: E402
+from webstore.config import BASE_DIR  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("action", choices=("import", "export"))
+    p.add_argument("path", help="file to read/write ('-' for stdin/stdout)")
+    p.add_argument("--format", choices=("csv", "jsonl"))
+    p.add_argument("--db", type=Path, default=BASE_DIR / "store.db")
+    args = p.parse_args()
+    fmt = args.format or detect_format(args.path)
+
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    try:
+        if args.action == "import":
+            f = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8-sig")
+            with f:
+                result = import_products(conn, f, fmt)
+            for err in result["errors"]:
+                print(f"line {err['line']}: {err['error']}", file=sys.stderr)
+            print(f"imported {result['imported']} of {result['rows']} rows ({result['error_count']} errors)")
+            return 1 if result["error_count"] else 0
+        f = sys.stdout if args.path == "-" else open(args.path, "w", newline="", encoding="utf-8")
+        with f:
+            for chunk in export_products(conn, fmt):
+                f.write(chunk)
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""Check the PostgreSQL translation of the repos.py SQL (see webstore/storage.py to_postgres).
+
+    python scripts/check_postgres_sql.py                      # compare with postgres_sql.expected.json
+    python scripts/check_postgres_sql.py --update             # rewrite it after an intended change (review the diff)
+    python scripts/check_postgres_sql.py --database-url postgresql://...   # also PREPARE each one on a server
+
+Three checks:
+  - the rewrite rules (placeholders, json_each, `main.`, RETURNING id, literals, %) on hand-written
+    statements with hand-written expected output;
+  - every *_SQL constant in repos.py against postgres_sql.expected.json, so any change to a statement
+    or to the translator shows up as a diff;
+  - with --database-url, every statement the PostgreSQL backend can run is PREPAREd against the
+    schema (db.POSTGRES_SCHEMA) inside a transaction that is rolled back, so syntax, column names
+    and parameter types are checked by the server. The archive statements are SQLite-only.
+Exits non-zero on any mismatch or server error.
+"""
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore import repos  # noqa: E402
+from webstore.storage import to_postgres  # noqa: E402
+
+EXPECTED_PATH = Path(__file__).with_name("postgres_sql.expected.json")
+
+# (SQLite statement, (PostgreSQL statement, numbered parameters, RETURNING id appended))
+RULES = [
+    ("SELECT * FROM products WHERE id = ?", ("SELECT * FROM products WHERE id = %s", False, False)),
+    ("SELECT * FROM stock_holds WHERE expires_at > ?1 AND holder != ?2 AND ?1 IS NOT NULL",
+     ("SELECT * FROM stock_holds WHERE expires_at > %(p1)s AND holder != %(p2)s AND %(p1)s IS NOT NULL", True, False)),
+    ("SELECT value FROM json_each(?)",
+     ("SELECT value FROM json_array_elements_text(%s::json) AS json_each(value)", False, False)),
+    ("SELECT j.value FROM json_each(?) j JOIN products p ON p.sku = j.value",
+     ("SELECT j.value FROM json_array_elements_text(%s::json) AS j(value) JOIN products p ON p.sku = j.value",
+      False, False)),
+    ("SELECT value FROM json_each(?2) WHERE value > ?1",
+     ("SELECT value FROM json_array_elements_text(%(p2)s::json) AS json_each(value) WHERE value > %(p1)s",
+      True, False)),
+    ("SELECT c.name FROM main.customers c", ("SELECT c.name FROM customers c", False, False)),
+    ("INSERT INTO orders (customer_id, total) VALUES (?, ?)",
+     ("INSERT INTO orders (customer_id, total) VALUES (%s, %s) RETURNING id", False, True)),
+    ("INSERT INTO carts (customer_id, cart) VALUES (?, ?)",
+     ("INSERT INTO carts (customer_id, cart) VALUES (%s, %s)", False, False)),
+    ("INSERT INTO customers (email) VALUES (?) ON CONFLICT(email) DO NOTHING",
+     ("INSERT INTO customers (email) VALUES (%s) ON CONFLICT(email) DO NOTHING", False, False)),
+    ("UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ? RETURNING stock",
+     ("UPDATE products SET stock = stock - %s WHERE id = %s AND stock >= %s RETURNING stock", False, False)),
+    # literals are left alone: no placeholders, json_each or `main.` inside quotes; % is escaped everywhere
+    ("SELECT sku FROM products WHERE name LIKE '%?%' AND note = 'main.x' AND sku = ?",
+     ("SELECT sku FROM products WHERE name LIKE '%%?%%' AND note = 'main.x' AND sku = %s", False, False)),
+    ("SELECT 'it''s ?' AS s, ?", ("SELECT 'it''s ?' AS s, %s", False, False)),
+]
+
+_PARAM = re.compile(r"%%|%\(p(\d+)\)s|%s")
+
+
+def repo_statements():
+    """{constant name: SQL} for every *_SQL string in repos.py."""
+    return {name: value for name, value in sorted(vars(repos).items())
+            if name.endswith("_SQL") and isinstance(value, str)}
+
+
+def translate_all():
+    return {name: dict(zip(("sql", "numbered", "returns_id"), to_postgres(sql)))
+            for name, sql in repo_statements().items()}
+
+
+def server_form(pg_sql):
+    """psycopg placeholders -> $n, as PREPARE takes them."""
+    count = 0
+
+    def sub(m):
+        nonlocal count
+        if m.group(0) == "%%":
+            return "%"
+        if m.group(1):
+            return f"${m.group(1)}"
+        count += 1
+        return f"${count}"
+
+    return _PARAM.sub(sub, pg_sql)
+
+
+def check_rules():
+    failures = []
+    for sql, expected in RULES:
+        got = to_postgres(sql)
+        if got != expected:
+            failures.append(f"rule: {sql}\n  expected {expected}\n  got      {got}")
+    return failures
+
+
+def check_expected(translated):
+    if not EXPECTED_PATH.exists():
+        return [f"{EXPECTED_PATH.name} is missing (run with --update)"]
+    expected = json.loads(EXPECTED_PATH.read_text(encoding="utf-8"))
+    failures = [f"{name}: not in repos.py any more" for name in expected.keys() - translated.keys()]
+    failures += [f"{name}: not in {EXPECTED_PATH.name} (run with --update)" for name in translated.keys() - expected.keys()]
+    for name in sorted(expected.keys() & translated.keys()):
+        if expected[name] != translated[name]:
+            failures.append(f"{name}:\n  expected {expected[name]}\n  got      {translated[name]}")
+    return failures
+
+
+def check_server(translated, database_url):
+    import psycopg
+    from webstore.db import POSTGRES_SCHEMA
+
+    failures, checked = [], 0
+    with psycopg.connect(database_url) as pg:
+        try:
+            pg.execute(POSTGRES_SCHEMA)
+            for name, t in translated.items():
+                if "archive." in t["sql"]:
+                    continue  # the archive database is SQLite-only (attach_archive)
+                pg.execute("SAVEPOINT chk")
+                try:
+                    pg.execute(f"PREPARE webstore_check AS {server_form(t['sql'])}")
+                    pg.execute("DEALLOCATE webstore_check")
+                    checked += 1
+                except psycopg.Error as e:
+                    failures.append(f"{name}: {e}".strip())
+                    pg.execute("ROLLBACK TO SAVEPOINT chk")
+        finally:
+            pg.rollback()
+    return failures, checked
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--update", action="store_true", help=f"rewrite {EXPECTED_PATH.name} from the current output")
+    p.add_argument("--database-url", help="also PREPARE every statement on this PostgreSQL server")
+    args = p.parse_args()
+
+    translated = translate_all()
+    if args.update:
+        EXPECTED_PATH.write_text(json.dumps(translated, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"wrote {EXPECTED_PATH.name} ({len(translated)} statements)")
+
+    failures = check_rules()
+    print(f"rewrite rules: {len(RULES) - len(failures)}/{len(RULES)} ok")
+    expected_failures = check_expected(translated)
+    print(f"repos.py statements: {len(translated) - len(expected_failures)}/{len(translated)} match "
+          f"{EXPECTED_PATH.name}")
+    failures += expected_failures
+    if args.database_url:
+        server_failures, checked = check_server(translated, args.database_url)
+        print(f"server: {checked}/{checked + len(server_failures)} statements prepared")
+        failures += server_failures
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
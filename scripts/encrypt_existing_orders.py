@@ -1,8 +1,13 @@
-import os, sqlite3
+import os, sys
 from cryptography.fernet import Fernet
 
-DB = os.path.join(os.path.dirname(__file__), "..", "store.db")
-KEY = os.environ.get("DATA_ENC_KEY")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from webstore.config import load_config  # noqa: E402
+from webstore.storage import storage_for  # noqa: E402
+
+# store.db by default; the PostgreSQL database when DATABASE_URL is set
+config = load_config()
+KEY = config["DATA_ENC_KEY"]
 if not KEY:
     raise SystemExit("Set DATA_ENC_KEY env var before running this script.")
 
@@ -13,9 +18,8 @@ FIELDS = ["agency","authorized_officer","position_clearance","contact_number","p
 def looks_encrypted(v):
     return isinstance(v, str) and v.startswith("gAAAAA")
 
-conn = sqlite3.connect(DB)
-cur = conn.cursor()
-rows = cur.execute("SELECT id, " + ", ".join(FIELDS) + " FROM orders").fetchall()
+conn = storage_for(config).connect()
+rows = conn.execute("SELECT id, " + ", ".join(FIELDS) + " FROM orders").fetchall()
 for row in rows:
     order_id = row[0]
     updates = {}
@@ -27,7 +31,7 @@ for row in rows:
     if updates:
         set_clause = ", ".join(f"{k} = ?" for k in updates.keys())
         params = list(updates.values()) + [order_id]
-        cur.execute(f"UPDATE orders SET {set_clause} WHERE id = ?", params)
+        conn.execute(f"UPDATE orders SET {set_clause} WHERE id = ?", params)
         print("Encrypted order", order_id, "fields:", ", ".join(updates.keys()))
 conn.commit()
 conn.close()
@@ -0,0 +1,56 @@
+"""Stream orders (with customers and line items) to CSV / JSON Lines / columnar JSON.
+
+    python scripts/export_orders.py orders.csv [--format csv|jsonl|columnar] [--from 2024-01-01]
+                                    [--to 2024-12-31] [--status placed,shipped] [--decrypt] [--workers 4]
+
+--decrypt needs DATA_ENC_KEY (env or .env). Output "-" writes to stdout.
+"""
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore import order_export  # noqa: E402
+from webstore.config import load_config  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("path", help="output file ('-' for stdout)")
+    p.add_argument("--format", choices=tuple(order_export.FORMATS), default="csv")
+    p.add_argument("--from", dest="date_from", help="first day (YYYY-MM-DD, inclusive)")
+    p.add_argument("--to", dest="date_to", help="last day (YYYY-MM-DD, inclusive)")
+    p.add_argument("--status", help="comma-separated statuses (default: all)")
+    p.add_argument("--decrypt", action="store_true", help="decrypt the gov fields with DATA_ENC_KEY")
+    p.add_argument("--workers", type=int, default=4, help="decryption processes")
+    p.add_argument("--db", type=Path)
+    args = p.parse_args()
+
+    config = load_config()
+    try:
+        since, until = order_export.date_range(args.date_from, args.date_to)
+        statuses = order_export.parse_statuses(args.status)
+    except ValueError as e:
+        p.error(str(e))
+    key = None
+    if args.decrypt:
+        key = config["DATA_ENC_KEY"]
+        if not key:
+            p.error("--decrypt needs DATA_ENC_KEY")
+
+    db_path = args.db or config["DB_PATH"]
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        out = sys.stdout if args.path == "-" else open(args.path, "w", newline="", encoding="utf-8")
+        with out:
+            for chunk in order_export.export_orders(conn, args.format, since, until, statuses,
+                                                    decrypt_key=key, workers=args.workers):
+                out.write(chunk)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
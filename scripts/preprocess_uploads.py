@@ -0,0 +1,54 @@
+"""Preprocess checkout uploads that have no preview yet (see webstore/upload_previews.py).
+
+    python scripts/preprocess_uploads.py [--db store.db] [--uploads private_uploads] [--retry-failed]
+
+Uploads made before preprocessing existed (or while the app ran without pypdf) get
+their page count, metadata and preview image. Each file commits on its own, so this is
+safe while the app is serving and can be interrupted and rerun.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore.config import load_config  # noqa: E402
+from webstore.db import ensure_schema  # noqa: E402
+from webstore.repos import UploadPreviewRepo  # noqa: E402
+from webstore.upload_previews import process  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", type=Path)
+    p.add_argument("--uploads", type=Path)
+    p.add_argument("--retry-failed", action="store_true", help="also reprocess uploads that failed before")
+    args = p.parse_args()
+    config = load_config()
+    db_path = args.db or config["DB_PATH"]
+    uploads = args.uploads or config["PRIVATE_UPLOADS"]
+    ensure_schema(db_path)
+
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        repo = UploadPreviewRepo(conn)
+        filenames = repo.unprocessed()
+        if args.retry_failed:
+            filenames += repo.failed()
+        counts = {"done": 0, "failed": 0}
+        for n, filename in enumerate(filenames, 1):
+            counts[process(conn, uploads, filename)] += 1
+            if n % 100 == 0:
+                print(f"processed {n:,}/{len(filenames):,} uploads", file=sys.stderr)
+    finally:
+        conn.close()
+    print(f"Processed {len(filenames):,} uploads in {time.perf_counter() - t0:.1f}s "
+          f"({counts['done']:,} done, {counts['failed']:,} failed)")
+
+
+if __name__ == "__main__":
+    main()
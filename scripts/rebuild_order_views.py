@@ -0,0 +1,65 @@
+"""Check or rebuild the order read model (order_views, see webstore/order_views.py).
+
+    python scripts/rebuild_order_views.py [--db store.db]           # rebuild every view
+    python scripts/rebuild_order_views.py --check [--repair]        # report (and fix) differences
+
+Uses DATA_ENC_KEY (env or .env) to decrypt the gov fields into each view's encrypted
+summary; without it views are written without them. Runs in short batches, so it is safe
+while the app is serving. --check exits with status 1 when any view is missing, stale
+or orphaned (and was not repaired).
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore.config import load_config  # noqa: E402
+from webstore.crypto import make_fernet  # noqa: E402
+from webstore.db import ensure_schema  # noqa: E402
+from webstore.order_views import REBUILD_BATCH, check, rebuild  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", type=Path)
+    p.add_argument("--check", action="store_true", help="compare views with the orders instead of rebuilding")
+    p.add_argument("--repair", action="store_true", help="with --check: rewrite the views found wrong")
+    p.add_argument("--batch-size", type=int, default=REBUILD_BATCH)
+    args = p.parse_args()
+    config = load_config()
+    db_path = args.db or config["DB_PATH"]
+    ensure_schema(db_path)
+    fernet = make_fernet(config["DATA_ENC_KEY"])
+    if fernet is None:
+        print("DATA_ENC_KEY not set: views will not include the encrypted gov fields", file=sys.stderr)
+
+    def progress(msg):
+        print(msg, file=sys.stderr)
+
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        if not args.check:
+            written = rebuild(conn, fernet, batch_size=args.batch_size, progress=progress)
+            print(f"Rebuilt {written:,} order views in {time.perf_counter() - t0:.1f}s")
+            return
+        problems = check(conn, fernet, batch_size=args.batch_size, progress=progress)
+        for kind, ids in problems.items():
+            sample = ", ".join(str(i) for i in ids[:10]) + (" ..." if len(ids) > 10 else "")
+            print(f"{kind}: {len(ids):,}" + (f" ({sample})" if ids else ""))
+        wrong = problems["missing"] + problems["stale"]
+        if args.repair and (wrong or problems["orphaned"]):
+            written = rebuild(conn, fernet, order_ids=wrong, batch_size=args.batch_size)
+            print(f"Repaired {written:,} views, removed {len(problems['orphaned']):,} orphans")
+        elif wrong or problems["orphaned"]:
+            sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
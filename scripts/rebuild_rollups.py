@@ -0,0 +1,44 @@
+"""Recompute the analytics rollup tables from orders (backfill after upgrading, or after manual data fixes).
+
+    python scripts/rebuild_rollups.py [--db store.db]
+
+Uses DATA_ENC_KEY (env or .env) to group orders by agency, hashed like checkout does
+(BLIND_INDEX_KEY if set); without it all orders land under the empty agency. Runs in one transaction, so reports stay consistent.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webstore.analytics import rebuild_rollups  # noqa: E402
+from webstore.config import load_config  # noqa: E402
+from webstore.db import ensure_schema  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", type=Path)
+    p.add_argument("--archive", type=Path, help="archive DB to include (default: ARCHIVE_DB_PATH unless --db is given)")
+    args = p.parse_args()
+    config = load_config()
+    db_path = args.db or config["DB_PATH"]
+    ensure_schema(db_path)
+    if not config["DATA_ENC_KEY"]:
+        print("DATA_ENC_KEY not set: agency rollups will not be broken down", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        rebuild_rollups(conn, config["DATA_ENC_KEY"], progress=lambda msg: print(msg, file=sys.stderr),
+                        archive_path=config["ARCHIVE_DB_PATH"] if args.db is None else args.archive,
+                        blind_index_key=config["BLIND_INDEX_KEY"])
+    finally:
+        conn.close()
+    print(f"Rollups rebuilt in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
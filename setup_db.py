@@ -1,7 +1,11 @@
 import sqlite3
 import argparse
+import json
+import random
+import sys
+import time
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 
 DB_PATH = Path(__file__).parent / "store.db"
 
@@ -88,6 +92,173 @@ def create_schema_and_seed(conn):
               stock=excluded.stock
         """, (sku, name, desc, price, img, stock, now))
 
+# --- synthetic data at scale (--scale) --------------------------------------
+
+SCALE_EPOCH = datetime(2024, 1, 1)
+SCALE_STATUSES = ("placed", "processing", "shipped", "completed", "cancelled")
+SCALE_PASSWORD = "Password123"  # every synthetic customer can log in with this
+# gov fields stored as Fernet tokens (same list as webstore.crypto.ENCRYPTED_ORDER_FIELDS)
+SCALE_ENCRYPTED_FIELDS = ["agency", "authorized_officer", "position_clearance", "contact_number", "po_number",
+                          "contract_reference", "funding_source", "delivery_location", "payment_method"]
+# search blind indexes for those of them that are searchable (webstore.blind_index.BLIND_INDEX_FIELDS)
+SCALE_INDEXED_FIELDS = ["po_number", "contract_reference", "agency", "authorized_officer", "contact_number"]
+SCALE_ORDER_COLUMNS = (["id", "customer_id", "total", "status", "created_at", "official_email", "auth_doc",
+                        "export_license_status", "required_delivery_date", "declaration_agreed"]
+                       + SCALE_ENCRYPTED_FIELDS + [f"{f}_bidx" for f in SCALE_INDEXED_FIELDS])
+# Fernet is ~20us per call, so tokens are drawn from a per-field pool instead of encrypting
+# every row; each token still decrypts to a plausible value with the real key (and comes
+# with that value's blind index).
+SCALE_TOKEN_POOL = 256
+
+
+def _next_id(conn, table):
+    return (conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0] or 0) + 1
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _token_pools(rng, key, blind_index_key=None):
+    """Per SCALE_ENCRYPTED_FIELDS entry, SCALE_TOKEN_POOL (token, blind index or None) pairs."""
+    from cryptography.fernet import Fernet
+    from webstore.blind_index import blind_index
+    from webstore.crypto import index_key
+    fernet = Fernet(key.encode())
+    hash_key = index_key(key, blind_index_key)
+    samples = {
+        "agency": lambda i: f"Department of Synthetic Affairs {i}",
+        "authorized_officer": lambda i: f"Officer {i}",
+        "position_clearance": lambda i: rng.choice(("Secret", "Top Secret", "Confidential")),
+        "contact_number": lambda i: f"+1 555 {rng.randint(1000000, 9999999)}",
+        "po_number": lambda i: f"PO-{rng.randint(100000, 999999)}",
+        "contract_reference": lambda i: f"CR-{rng.randint(1000, 9999)}",
+        "funding_source": lambda i: rng.choice(("FY24 O&M", "FY25 Procurement", "RDT&E")),
+        "delivery_location": lambda i: f"Base {i}",
+        "payment_method": lambda i: rng.choice(("invoice", "purchase_card", "wire")),
+    }
+    pools = []
+    for f in SCALE_ENCRYPTED_FIELDS:
+        values = [samples[f](i) for i in range(SCALE_TOKEN_POOL)]
+        pools.append([(fernet.encrypt(v.encode()).decode(),
+                       blind_index(hash_key, f, v) if f in SCALE_INDEXED_FIELDS else None) for v in values])
+    return pools
+
+
+def generate_scale(conn, orders, customers=None, products=None, carts=None, seed=1, key=None,
+                   batch_size=50_000, progress=None, blind_index_key=None):
+    """
+    Bulk-load synthetic products, customers, orders, order_items and carts.
+
+    Row contents are deterministic for a given seed (Fernet tokens aren't: each has a
+    random IV). Journaling and fsync are switched off for the load and restored after,
+    so only run this against a DB you can recreate. `key` is the DATA_ENC_KEY used for
+    the gov fields (left NULL when not given); the search indexes are hashed under
+    BLIND_INDEX_KEY `blind_index_key` if given, as the app does. Returns a dict of rows inserted per table.
+    """
+    customers = customers if customers is not None else max(orders // 10, 1)
+    products = products if products is not None else max(orders // 10_000, 20)
+    carts = carts if carts is not None else customers // 4
+    progress = progress or (lambda msg: None)
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    def report(table, done, total):
+        elapsed = time.perf_counter() - started
+        progress(f"{table}: {done:,}/{total:,} ({elapsed:.1f}s)")
+
+    prev_journal = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.commit()
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA foreign_keys=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    try:
+        now = SCALE_EPOCH.isoformat()
+        first_product = _next_id(conn, "products")
+        conn.executemany(
+            "INSERT INTO products (id, sku, name, description, price, image, stock, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((first_product + i, f"SYN{first_product + i:07d}", f"Synthetic product {i}", "Generated by setup_db.py --scale.",
+              float(rng.randint(10, 5_000_000) * 100), "images/b2.png", rng.randint(1_000, 1_000_000), now)
+             for i in range(products)),
+        )
+        conn.commit()
+        report("products", products, products)
+        product_rows = conn.execute("SELECT id, sku, price, name FROM products").fetchall()
+        product_ids = [r[0] for r in product_rows]
+        product_skus = [r[1] for r in product_rows]
+        prices = [r[2] for r in product_rows]
+        product_names = [r[3] for r in product_rows]
+
+        from werkzeug.security import generate_password_hash
+        pw_hash = generate_password_hash(SCALE_PASSWORD)
+        first_customer = _next_id(conn, "customers")
+        done = 0
+        for batch in _batched(((first_customer + i, f"Synthetic Customer {i}", f"user{first_customer + i}@agency{i % 200}.gov",
+                                now, pw_hash) for i in range(customers)), batch_size):
+            conn.executemany("INSERT INTO customers (id, name, email, created_at, password) VALUES (?, ?, ?, ?, ?)", batch)
+            conn.commit()
+            done += len(batch)
+            report("customers", done, customers)
+
+        pools = _token_pools(rng, key, blind_index_key) if key else None
+        n_products = len(product_ids)
+        span = 365 * 24 * 3600
+        first_order = _next_id(conn, "orders")
+        order_sql = f"INSERT INTO orders ({', '.join(SCALE_ORDER_COLUMNS)}) VALUES ({', '.join('?' for _ in SCALE_ORDER_COLUMNS)})"
+        item_sql = ("INSERT INTO order_items (order_id, product_id, quantity, unit_price, sku, product_name) "
+                    "VALUES (?, ?, ?, ?, ?, ?)")
+        randrange, n_items_total = rng.randrange, 0
+        for start in range(0, orders, batch_size):
+            order_rows, item_rows = [], []
+            for oid in range(first_order + start, first_order + min(start + batch_size, orders)):
+                total = 0.0
+                for _ in range(randrange(1, 5)):
+                    p = randrange(n_products)
+                    qty = randrange(1, 4)
+                    total += prices[p] * qty
+                    item_rows.append((oid, product_ids[p], qty, prices[p], product_skus[p], product_names[p]))
+                created = (SCALE_EPOCH + timedelta(seconds=(oid - first_order) * span // max(orders, 1))).isoformat()
+                row = [oid, first_customer + randrange(customers), total, SCALE_STATUSES[randrange(5)], created,
+                       f"officer{oid % 5000}@agency.gov", "synthetic_auth.pdf", "not_required", created[:10], 1]
+                if pools:
+                    drawn = {f: pool[randrange(SCALE_TOKEN_POOL)] for f, pool in zip(SCALE_ENCRYPTED_FIELDS, pools)}
+                    row.extend(drawn[f][0] for f in SCALE_ENCRYPTED_FIELDS)
+                    row.extend(drawn[f][1] for f in SCALE_INDEXED_FIELDS)
+                else:
+                    row.extend([None] * (len(SCALE_ENCRYPTED_FIELDS) + len(SCALE_INDEXED_FIELDS)))
+                order_rows.append(row)
+            conn.executemany(order_sql, order_rows)
+            conn.executemany(item_sql, item_rows)
+            conn.commit()
+            n_items_total += len(item_rows)
+            report("orders", start + len(order_rows), orders)
+
+        cart_rows = ((first_customer + c, json.dumps({product_skus[randrange(n_products)]: randrange(1, 4)
+                                                       for _ in range(randrange(1, 4))}))
+                     for c in rng.sample(range(customers), min(carts, customers)))
+        done = 0
+        for batch in _batched(cart_rows, batch_size):
+            conn.executemany("INSERT OR REPLACE INTO carts (customer_id, cart) VALUES (?, ?)", batch)
+            conn.commit()
+            done += len(batch)
+            report("carts", done, carts)
+    finally:
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute(f"PRAGMA journal_mode={prev_journal}")
+    return {"products": products, "customers": customers, "orders": orders,
+            "order_items": n_items_total, "carts": min(carts, customers)}
+
+
 def summary(conn):
     cur = conn.execute("SELECT COUNT(*) FROM products"); print("products:", cur.fetchone()[0])
     cur = conn.execute("SELECT COUNT(*) FROM customers"); print("customers:", cur.fetchone()[0])
@@ -98,21 +269,55 @@ def summary(conn):
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--force", action="store_true", help="Delete existing DB and recreate")
+    p.add_argument("--db", type=Path, default=DB_PATH, help="Database path (default: store.db)")
+    p.add_argument("--scale", type=int, metavar="ORDERS", help="Also bulk-generate this many synthetic orders")
+    p.add_argument("--customers", type=int, help="Synthetic customers (default: ORDERS / 10)")
+    p.add_argument("--products", type=int, help="Synthetic products (default: ORDERS / 10000, min 20)")
+    p.add_argument("--carts", type=int, help="Saved carts (default: customers / 4)")
+    p.add_argument("--seed", type=int, default=1, help="Random seed for --scale")
+    p.add_argument("--batch-size", type=int, default=50_000)
+    p.add_argument("--database-url", help="Then copy the DB into this PostgreSQL database (with --force, replacing "
+                                          "its contents)")
     args = p.parse_args()
+    db_path = args.db
 
-    if args.force and DB_PATH.exists():
-        DB_PATH.unlink()
-        print(f"Deleted existing DB: {DB_PATH}")
+    if args.force and db_path.exists():
+        db_path.unlink()
+        print(f"Deleted existing DB: {db_path}")
 
-    created = not DB_PATH.exists()
-    conn = sqlite3.connect(DB_PATH)
+    created = not db_path.exists()
+    conn = sqlite3.connect(db_path)
     try:
         create_schema_and_seed(conn)
         conn.commit()
-        print(f"Database: {DB_PATH} {'created' if created else 'updated'}")
+        print(f"Database: {db_path} {'created' if created else 'updated'}")
+        if args.scale:
+            # same column additions the app makes on startup (gov fields, password, carts)
+            from webstore.config import load_config
+            from webstore.db import ensure_schema
+            ensure_schema(db_path)
+            config = load_config()
+            key = config["DATA_ENC_KEY"]
+            if not key:
+                print("DATA_ENC_KEY not set: encrypted order fields will be left NULL", file=sys.stderr)
+            t0 = time.perf_counter()
+            counts = generate_scale(conn, args.scale, args.customers, args.products, args.carts, seed=args.seed,
+                                    key=key, blind_index_key=config["BLIND_INDEX_KEY"], batch_size=args.batch_size,
+                                    progress=lambda msg: print(msg, file=sys.stderr))
+            print(f"Generated {', '.join(f'{v:,} {k}' for k, v in counts.items())} in {time.perf_counter() - t0:.1f}s")
+            from webstore.analytics import rebuild_rollups
+            rebuild_rollups(conn, key, blind_index_key=config["BLIND_INDEX_KEY"])
         summary(conn)
     finally:
         conn.close()
+    if args.database_url:
+        # the PostgreSQL backend (webstore/storage.py) gets the same data through the migration tool
+        from webstore.migrate_postgres import copy_sqlite_to_postgres
+        try:
+            copied = copy_sqlite_to_postgres(db_path, args.database_url, truncate=args.force)
+        except ValueError as e:
+            raise SystemExit(f"Not copied to PostgreSQL: {e}; --force replaces it")
+        print(f"Copied to PostgreSQL: {', '.join(f'{n:,} {t}' for t, n in copied.items() if n)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
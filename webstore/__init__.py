@@ -0,0 +1,53 @@
+"""Webstore application package.
+
+Use `create_app()` to build a configured Flask app. Heavy dependencies
+(SMTP/email, cryptography) and the schema check are deferred until first
+use so that short-lived workers and tests start quickly.
+"""
+from flask import Flask
+
+from .config import BASE_DIR, load_config
+
+
+def create_app(config=None):
+    """Build the Flask app. `config` is an optional mapping that overrides the env-derived defaults."""
+    app = Flask(
+        __name__,
+        root_path=str(BASE_DIR),
+        template_folder="templates",
+        static_folder="static",
+    )
+    app.config.update(load_config())
+    if config:
+        app.config.update(config)
+
+    # queue-based logging with request ids (see log.py); before anything touches app.logger
+    from . import log
+    log.configure(app)
+
+    # per-app lazily-built state (Fernet instance, schema check flag, ...)
+    app.extensions["webstore"] = {}
+
+    from . import templating
+    templating.init_app(app)
+
+    from . import account, admin, cart, checkout, metrics, shop, stock_holds
+    from .auth import enforce_session_timeout
+    from .db import close_db
+
+    app.register_blueprint(shop.bp)
+    app.register_blueprint(cart.bp)
+    app.register_blueprint(checkout.bp)
+    app.register_blueprint(admin.bp)
+    app.register_blueprint(account.bp)
+
+    app.before_request(enforce_session_timeout)
+    app.teardown_appcontext(close_db)
+    metrics.init_app(app)
+    stock_holds.init_app(app)
+    if app.config.get("BACKUP_INTERVAL_MINUTES"):
+        from .backup import start_scheduler
+        start_scheduler(app)
+    if app.config.get("TEMPLATE_PRECOMPILE"):
+        templating.precompile(app.jinja_env)
+    return app
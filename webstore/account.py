@@ -0,0 +1,108 @@
+"""Customer account pages: order history for the logged-in customer.
+
+/account/orders lists the customer's orders newest first, ACCOUNT_ORDERS_PAGE_SIZE at a
+time, with keyset pagination: the "older orders" link carries the (created_at, id) of
+the last order shown, and the next page starts right after it on the
+orders(customer_id, created_at) index. No OFFSET, so an agency account with thousands
+of orders loads page 100 as fast as page 1. Archived orders (archive.py) are merged in
+when an archive exists.
+
+/account/orders/<id> (and checkout's order_success page) load an order from its read
+model (order_views.py), or else with one join query whose WHERE clause includes the
+customer id; either way other customers' orders are indistinguishable from missing
+ones (404).
+"""
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, session, url_for
+
+from . import order_views
+from .crypto import decrypt_field, get_fernet
+from .db import attach_archive, get_read_db
+from .repos import OrderRepo
+
+bp = Blueprint("account", __name__)
+
+# first page: sorts after every ISO created_at, so (created_at, id) < FIRST_PAGE matches all orders
+FIRST_PAGE = ("9999-12-31T23:59:59", 0)
+# order fields shown to the customer that are stored encrypted (crypto.ENCRYPTED_ORDER_FIELDS)
+SHOWN_ENCRYPTED_FIELDS = ("po_number", "contract_reference", "delivery_location")
+ORDER_FIELDS = ("id", "created_at", "status", "total", "export_license_status", "po_number",
+                "contract_reference", "delivery_location", "required_delivery_date", "archived")
+
+
+def parse_cursor(value):
+    """'<id>.<created_at>' from an "older orders" link -> (created_at, id), or FIRST_PAGE."""
+    order_id, _, created_at = (value or "").partition(".")
+    if not order_id.isdigit() or not created_at:
+        return FIRST_PAGE
+    return created_at, int(order_id)
+
+
+def make_cursor(row):
+    return f"{row['id']}.{row['created_at']}"
+
+
+def _decrypt(order_id, field, token):
+    try:
+        return decrypt_field(token) if token else None
+    except Exception:
+        current_app.logger.exception("Failed to decrypt order %s field %s", order_id, field)
+        return None
+
+
+def load_customer_order(db, customer_id, order_id):
+    """(order dict, line dicts) for one of `customer_id`'s orders, or (None, []) if it isn't theirs."""
+    # the order's read model (order_views.py) when it has one: a primary-key read
+    view, items = order_views.load(db, order_id, get_fernet())
+    if view is not None:
+        if view["customer_id"] != customer_id:
+            return None, []
+        order = {f: view.get(f) for f in ORDER_FIELDS}
+        order.update({f: view[f + "_decrypted"] for f in SHOWN_ENCRYPTED_FIELDS})
+        return order, items
+    orders = OrderRepo(db)
+    rows = orders.customer_order(order_id, customer_id)
+    if not rows and attach_archive(db):
+        rows = orders.customer_order(order_id, customer_id, archived=True)
+    if not rows:
+        return None, []
+    order = {f: rows[0][f] for f in ORDER_FIELDS}
+    for f in SHOWN_ENCRYPTED_FIELDS:
+        order[f] = _decrypt(order_id, f, order[f])
+    items = [{"sku": r["sku"], "name": r["name"], "quantity": r["quantity"], "unit_price": r["unit_price"]}
+             for r in rows if r["quantity"] is not None]
+    return order, items
+
+
+def _require_customer():
+    if not session.get("customer_id"):
+        flash("Log in to see your orders.", "warning")
+        return redirect(url_for("shop.login", next=request.path))
+    return None
+
+
+@bp.route("/account/orders")
+def account_orders():
+    login = _require_customer()
+    if login:
+        return login
+    db = get_read_db()
+    page_size = current_app.config["ACCOUNT_ORDERS_PAGE_SIZE"]
+    cursor = request.args.get("before")
+    # one extra row tells us whether there is an older page
+    rows = OrderRepo(db).customer_page(session["customer_id"], parse_cursor(cursor), page_size + 1,
+                                       include_archive=attach_archive(db))
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    older = url_for("account.account_orders", before=make_cursor(rows[-1])) if more else None
+    return render_template("account_orders.html", orders=rows, older_url=older, first_page=not cursor)
+
+
+@bp.route("/account/orders/<int:order_id>")
+def account_order_detail(order_id):
+    login = _require_customer()
+    if login:
+        return login
+    order, items = load_customer_order(get_read_db(), session["customer_id"], order_id)
+    if order is None:
+        abort(404)
+    return render_template("account_order_detail.html", order=order, items=items)
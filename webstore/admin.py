@@ -0,0 +1,426 @@
+import io
+from datetime import datetime, timezone
+from pathlib import Path
+
+from flask import (Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request,
+                   send_from_directory, session, stream_with_context, url_for)
+from werkzeug.utils import secure_filename
+
+from . import order_export, order_feed, order_views, upload_previews
+from .analytics import build_report, record_status_change, report_range
+from .auth import login_required
+from .blind_index import BLIND_INDEX_FIELDS, SEARCH_LIMIT, search_hashes
+from .catalogue_io import FORMATS, detect_format, export_products, import_products, make_sku_candidate
+from .crypto import ENCRYPTED_ORDER_FIELDS, decrypt_field, get_fernet, get_index_key, make_fernet
+from .db import attach_archive, get_db, get_read_db
+from .metrics import METRICS
+from .repos import QUERY_STATS, OrderRepo, ProductRepo, UploadPreviewRepo
+from .shop import get_products
+
+bp = Blueprint("admin", __name__)
+
+
+# Admin login/logout routes
+@bp.route("/admin/login", methods=["GET", "POST"])
+def admin_login():
+    if request.method == "GET":
+        return render_template("admin_login.html")
+    username = (request.form.get("username") or "").strip()
+    password = (request.form.get("password") or "").strip()
+    ADMIN_USER = current_app.config["ADMIN_USER"]
+    ADMIN_PASS = current_app.config["ADMIN_PASS"]
+    if username == ADMIN_USER and password == ADMIN_PASS:
+        session["is_admin"] = True
+        session["admin_user"] = username
+        session.permanent = False
+        session["last_active"] = datetime.now(timezone.utc).timestamp()
+        session["created_at"] = datetime.now(timezone.utc).timestamp()
+        next_url = request.args.get("next") or url_for("admin.admin_products")
+        return redirect(next_url)
+    return redirect(url_for("admin.admin_login"))
+
+@bp.route("/admin/logout")
+def admin_logout():
+    # fully clear session on admin logout to avoid stale flags
+    session.clear()
+    return redirect(url_for("shop.index"))
+
+def _save_product_image(image_file):
+    """Save an uploaded product image under static/images and return its static path."""
+    images_dir = Path(current_app.config["IMAGES_DIR"])
+    images_dir.mkdir(parents=True, exist_ok=True)
+    filename = secure_filename(image_file.filename)
+    dest = images_dir / filename
+    image_file.save(str(dest))
+    return f"images/{filename}"
+
+# admin: list & update products (POST from each product card)
+@bp.route("/admin/products", methods=["GET", "POST"])
+@login_required
+def admin_products():
+    db = get_db()
+    if request.method == "POST":
+        sku = (request.form.get("sku") or "").strip()
+        if not sku:
+            return redirect(url_for("admin.admin_products"))
+
+        name = (request.form.get("name") or "").strip()
+        description = (request.form.get("description") or "").strip()
+        price_raw = (request.form.get("price") or "").replace(",", "").strip()
+        stock_raw = (request.form.get("stock") or "").strip()
+        try:
+            price_val = float(price_raw) if price_raw != "" else None
+        except ValueError:
+            price_val = None
+        try:
+            stock_val = int(stock_raw) if stock_raw != "" else None
+        except ValueError:
+            stock_val = None
+
+        image_file = request.files.get("image")
+        image_path = None
+        if image_file and image_file.filename:
+            image_path = _save_product_image(image_file)
+
+        # update only the provided fields (None leaves a column unchanged)
+        fields = {
+            "name": name or None,
+            "description": description or None,
+            "price": price_val,
+            "stock": stock_val,
+            "image": image_path,
+        }
+        if any(v is not None for v in fields.values()):
+            try:
+                ProductRepo(db).update(sku, **fields)
+                db.commit()
+            except Exception:
+                db.rollback()
+        return redirect(url_for("admin.admin_products"))
+
+    # admins editing the catalogue always see current values
+    products = get_products(max_staleness=0)
+    return render_template("edit_products.html", products=products)
+
+# admin add product: accept stock
+@bp.route("/admin/products/add", methods=["POST"])
+@login_required
+def admin_add_product():
+    db = get_db()
+    name = (request.form.get("name") or "").strip()
+    sku = (request.form.get("sku") or "").strip().upper()
+    description = (request.form.get("description") or "").strip()
+    price_raw = (request.form.get("price") or "").replace(",", "").strip()
+    stock_raw = (request.form.get("stock") or "").strip()
+    try:
+        price_val = float(price_raw) if price_raw != "" else 0.0
+    except ValueError:
+        price_val = 0.0
+    try:
+        stock_val = int(stock_raw) if stock_raw != "" else 0
+    except ValueError:
+        stock_val = 0
+
+    image_file = request.files.get("image")
+    image_path = None
+    if image_file and image_file.filename:
+        image_path = _save_product_image(image_file)
+
+    sku = ProductRepo(db).unique_skus([sku.upper() if sku else make_sku_candidate(name)])[0]
+
+    created_at = datetime.utcnow().isoformat()
+    try:
+        ProductRepo(db).insert(sku, name, description, price_val, image_path, stock_val, created_at)
+        db.commit()
+    except Exception:
+        db.rollback()
+    return redirect(url_for("admin.admin_products"))
+
+@bp.route("/admin/products/delete", methods=["POST"])
+@login_required
+def admin_delete_product():
+    db = get_db()
+    sku = (request.form.get("sku") or "").strip()
+    if not sku:
+        return redirect(url_for("admin.admin_products"))
+
+    products_repo = ProductRepo(db)
+    product_id = products_repo.id_by_sku(sku)
+    if product_id is None:
+        return redirect(url_for("admin.admin_products"))
+
+    # prevent deletion when referenced by order_items
+    if products_repo.reference_count(product_id) > 0:
+        return redirect(url_for("admin.admin_products", error="in_use"))
+
+    try:
+        products_repo.delete(product_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+    return redirect(url_for("admin.admin_products"))
+
+# bulk catalogue import/export (CSV or JSON Lines, streamed both ways)
+@bp.route("/admin/products/export")
+@login_required
+def admin_export_products():
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        abort(400)
+    db = get_read_db()
+    return Response(stream_with_context(export_products(db, fmt)), mimetype=FORMATS[fmt],
+                    headers={"Content-Disposition": f"attachment; filename=products.{fmt}"})
+
+@bp.route("/admin/products/import", methods=["POST"])
+@login_required
+def admin_import_products():
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        flash("Choose a CSV or JSONL file to import.", "warning")
+        return redirect(url_for("admin.admin_products"))
+    fmt = request.form.get("format") or detect_format(upload.filename)
+    if fmt not in FORMATS:
+        abort(400)
+    stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+    result = import_products(get_db(), stream, fmt)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(result)
+    flash(f"Imported {result['imported']} of {result['rows']} rows ({result['error_count']} errors).",
+          "success" if not result["error_count"] else "warning")
+    for err in result["errors"][:20]:
+        flash(f"Line {err['line']}: {err['error']}", "danger")
+    return redirect(url_for("admin.admin_products"))
+
+# Admin-only download route for private files
+@bp.route("/admin/uploads/<filename>")
+@login_required
+def admin_download_upload(filename):
+    try:
+        return send_from_directory(str(current_app.config["PRIVATE_UPLOADS"]), filename, as_attachment=True)
+    except FileNotFoundError:
+        abort(404)
+
+# --- Admin: orders list and order detail (review / edit export license) ---
+@bp.route("/admin/orders")
+@login_required
+def admin_orders():
+    """List orders. filter=query param: 'current' (default) or 'previous'; q (+ field) searches instead"""
+    query = (request.args.get("q") or "").strip()
+    if query:
+        return _admin_search_orders(query, request.args.get("field") or None)
+    db = get_read_db(current_app.config["REPORTING_MAX_STALENESS"])
+    filt = request.args.get("filter", "current")
+    previous = filt == "previous"
+    # finished orders may have been moved to the archive DB (archive.py)
+    # read the feed position first: events committed after it are streamed, never lost
+    feed_last_id = order_feed.start_position(db, None)[0]
+    rows = OrderRepo(db).list(previous=previous, include_archive=previous and attach_archive(db))
+    return render_template("admin_orders.html", orders=rows, filter=filt, feed_last_id=feed_last_id,
+                           search_fields=SEARCH_FIELDS)
+
+
+# field choices for the orders search box (value -> label); "" searches all of them
+SEARCH_FIELDS = {"": "Any field", "po_number": "PO number", "contract_reference": "Contract reference",
+                 "agency": "Agency", "authorized_officer": "Authorized officer", "contact_number": "Contact number"}
+
+
+def _admin_search_orders(query, field):
+    """Exact-match search through the blind indexes; only the hits are decrypted."""
+    if field is not None and field not in BLIND_INDEX_FIELDS:
+        abort(400)
+    key = get_index_key()
+    if not key:
+        flash("DATA_ENC_KEY is not configured: encrypted order fields can't be searched.", "warning")
+        return redirect(url_for("admin.admin_orders"))
+    db = get_read_db()
+    rows = OrderRepo(db).search(search_hashes(key, query, field), SEARCH_LIMIT)
+    hits = []
+    for row in rows:
+        order = dict(row)
+        for f in BLIND_INDEX_FIELDS:
+            try:
+                order[f] = decrypt_field(order[f]) if order[f] else None
+            except Exception:
+                current_app.logger.exception("Failed to decrypt order %s field %s", order["id"], f)
+                order[f] = None
+        hits.append(order)
+    return render_template("admin_orders.html", orders=hits, filter="search", search=query,
+                           search_field=field or "", search_fields=SEARCH_FIELDS, search_limit=SEARCH_LIMIT,
+                           feed_last_id=None)
+
+@bp.route("/admin/orders/events")
+@login_required
+def admin_order_events():
+    """Server-Sent Events: new orders and status changes after Last-Event-ID (header or ?last_event_id)."""
+    last_id = order_feed.parse_last_event_id(request.headers.get("Last-Event-ID") or request.args.get("last_event_id"))
+    cfg = current_app.config
+    stream = order_feed.event_stream(get_read_db(), last_id, poll=cfg["ORDER_FEED_POLL_SECONDS"],
+                                     heartbeat=cfg["ORDER_FEED_HEARTBEAT_SECONDS"],
+                                     max_seconds=cfg["ORDER_FEED_MAX_SECONDS"])
+    return Response(stream_with_context(stream), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bp.route("/admin/orders/export")
+@login_required
+def admin_export_orders():
+    """Stream orders + items. Query params: format, from/to (YYYY-MM-DD, inclusive), status (comma list), decrypt=1"""
+    fmt = request.args.get("format", "csv")
+    if fmt not in order_export.FORMATS:
+        abort(400)
+    try:
+        since, until = order_export.date_range(request.args.get("from"), request.args.get("to"))
+        statuses = order_export.parse_statuses(request.args.get("status"))
+    except ValueError:
+        abort(400)
+    key = current_app.config.get("DATA_ENC_KEY") if request.args.get("decrypt") == "1" else None
+    db = get_read_db(current_app.config["REPORTING_MAX_STALENESS"])
+    chunks = order_export.export_orders(db, fmt, since, until, statuses, decrypt_key=key)
+    ext = "csv" if fmt == "csv" else "jsonl"
+    return Response(stream_with_context(chunks), mimetype=order_export.FORMATS[fmt],
+                    headers={"Content-Disposition": f"attachment; filename=orders.{ext}"})
+
+@bp.route("/admin/order/<int:order_id>", methods=["GET", "POST"])
+@login_required
+def admin_order_detail(order_id):
+    # Handle updates from the admin form
+    if request.method == "POST":
+        db = get_db()
+        status = (request.form.get("status") or "").strip()
+        export_status = (request.form.get("export_status") or "").strip()
+
+        # basic validation of allowed values
+        allowed_status = {"placed", "processing", "shipped", "cancelled"}
+        allowed_export = {"approved", "exempt", "processing", "pending"}
+
+        if status not in allowed_status:
+            flash("Invalid order status.", "danger")
+            return redirect(url_for("admin.admin_order_detail", order_id=order_id))
+        if export_status not in allowed_export:
+            flash("Invalid export status.", "danger")
+            return redirect(url_for("admin.admin_order_detail", order_id=order_id))
+
+        # IMMEDIATE: the old status read for the rollups and the UPDATE must see the same row
+        # (a deferred BEGIN fails with "database is locked" if another writer commits in between)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if OrderRepo(db).status(order_id) is None:
+                db.rollback()
+                flash("Order not found or archived (archived orders are read-only).", "warning")
+                return redirect(url_for("admin.admin_order_detail", order_id=order_id))
+            record_status_change(db, order_id, status)
+            OrderRepo(db).update_status(order_id, status, export_status)
+            order_views.record_status(db, order_id, status, export_status, get_fernet())
+            order_feed.record_event(db, order_id, "status", status)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        order_feed.notify()
+        flash("Order updated.", "success")
+        return redirect(url_for("admin.admin_order_detail", order_id=order_id))
+
+    db = get_read_db()
+    # one primary-key read of the order's read model (order_views.py, one decrypt)
+    order, items = order_views.load(db, order_id, get_fernet())
+    if order is not None:
+        return _render_order_detail(db, order, items)
+
+    # orders without a view (placed before order_views existed, or archived)
+    orders = OrderRepo(db)
+    order = orders.detail(order_id)
+    items = orders.items(order_id)
+    if order is None and attach_archive(db):
+        order = orders.archived_detail(order_id)
+        items = orders.archived_items(order_id)
+
+    # decrypt sensitive fields for admin display (if DATA_ENC_KEY provided)
+    if order:
+        order = dict(order)
+        for f in ENCRYPTED_ORDER_FIELDS:
+            token = order.get(f)
+            order[f + "_encrypted"] = token
+            try:
+                order[f + "_decrypted"] = decrypt_field(token) if token else None
+            except Exception as e:
+                current_app.logger.exception(
+                    "Failed to decrypt order %s field %s: %s", order.get("id"), f, e
+                )
+                order[f + "_decrypted"] = None
+
+    return _render_order_detail(db, order, items)
+
+
+def _render_order_detail(db, order, items):
+    # page count / metadata / preview of each uploaded document (upload_previews.py)
+    uploads = [(f, order.get(f)) for f in upload_previews.UPLOAD_FIELDS if order and order.get(f)]
+    previews = upload_previews.previews_for(db, [name for _, name in uploads])
+    return render_template("admin_order_detail.html", order=order, items=items, uploads=uploads, previews=previews)
+
+
+@bp.route("/admin/uploads/<filename>/preview")
+@login_required
+def admin_upload_preview(filename):
+    row = UploadPreviewRepo(get_read_db()).image(filename)
+    if row is None:
+        abort(404)
+    # previews never change for a given upload name
+    return Response(row["preview"], mimetype=row["preview_type"],
+                    headers={"Cache-Control": "private, max-age=86400"})
+
+# --- Admin: sales reports (answered from the daily rollups) ---
+def _report_from_request():
+    try:
+        first_day, last_day = report_range(request.args.get("from"), request.args.get("to"))
+    except ValueError:
+        abort(400)
+    db = get_read_db(current_app.config["REPORTING_MAX_STALENESS"])
+    return build_report(db, first_day, last_day, limit=request.args.get("limit", 20, type=int))
+
+@bp.route("/admin/reports")
+@login_required
+def admin_reports():
+    return render_template("admin_reports.html", report=_report_from_request())
+
+@bp.route("/admin/api/reports")
+@login_required
+def admin_reports_api():
+    """JSON: totals, daily revenue, status breakdown, top products (units vs stock) and agencies for from/to."""
+    return jsonify(_report_from_request())
+
+@bp.route("/admin/debug")
+@login_required
+def admin_debug():
+    """
+    Simple debug endpoint to verify the DATA_ENC_KEY / Fernet availability.
+    Returns JSON:
+      - DATA_ENC_KEY_set: whether the key is configured
+      - fernet_init: whether Fernet() could be instantiated (boolean)
+      - fernet_test_decrypt_ok: whether a local encrypt/decrypt round-trip succeeded
+      - error: optional error message if Fernet init failed
+      - query_stats: per-query count / total / average time in this worker (hotspots first)
+    """
+    key = current_app.config.get("DATA_ENC_KEY")
+    result = {"DATA_ENC_KEY_set": bool(key), "query_stats": QUERY_STATS.snapshot()}
+    if not key:
+        return jsonify(result)
+
+    try:
+        f = make_fernet(key)
+        result["fernet_init"] = True
+        # do a safe local round-trip to ensure the key works (does not touch DB)
+        token = f.encrypt(b"__debug__").decode()
+        ok = (f.decrypt(token.encode()).decode() == "__debug__")
+        result["fernet_test_decrypt_ok"] = bool(ok)
+    except Exception as e:
+        result["fernet_init"] = False
+        result["error"] = str(e)
+
+    return jsonify(result)
+
+@bp.route("/admin/metrics")
+@login_required
+def admin_metrics():
+    """Prometheus text-format metrics for this worker (404 unless METRICS_ENABLED)."""
+    if not current_app.config.get("METRICS_ENABLED"):
+        abort(404)
+    return current_app.response_class(METRICS.render_prometheus(), mimetype="text/plain; version=0.0.4")
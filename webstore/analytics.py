@@ -0,0 +1,153 @@
+"""Sales analytics from incrementally maintained daily rollups.
+
+checkout() calls record_order() and admin_order_detail() calls
+record_status_change() inside their own transactions, so the rollup tables
+(see ROLLUP_SCHEMA in db.py) always agree with the orders they summarise.
+Reports read only the rollups: their cost depends on the date range, not on
+how many orders exist. rebuild_rollups() recomputes everything from orders
+(backfills, or after fixing data by hand); scripts/rebuild_rollups.py runs it.
+"""
+import os
+from datetime import date, timedelta
+
+from .repos import AnalyticsRepo, OrderRepo
+
+REPORT_DEFAULT_DAYS = 30
+
+
+def order_day(created_at):
+    """Rollup day (YYYY-MM-DD) of an order's ISO created_at."""
+    return (created_at or "")[:10]
+
+
+def record_order(db, created_at, status, total, agency_hash, lines):
+    """Add a new order to the rollups. lines: (product_id, units, revenue). Caller commits."""
+    day = order_day(created_at)
+    repo = AnalyticsRepo(db)
+    repo.add_product_lines(day, lines)
+    repo.add_status(day, status, 1, total)
+    repo.add_agency(day, agency_hash or "", 1, total)
+
+
+def record_status_change(db, order_id, new_status):
+    """Move an order's count/revenue between status rollups. Call before the UPDATE; caller commits."""
+    row = OrderRepo(db).status(order_id)
+    if row is None or row["status"] == new_status:
+        return
+    day = order_day(row["created_at"])
+    repo = AnalyticsRepo(db)
+    repo.add_status(day, row["status"], -1, -row["total"])
+    repo.add_status(day, new_status, 1, row["total"])
+
+
+def report_range(date_from=None, date_to=None, default_days=REPORT_DEFAULT_DAYS):
+    """Inclusive (first_day, last_day) strings; defaults to the last `default_days` days.
+    Raises ValueError on malformed dates."""
+    last = date.fromisoformat(date_to) if date_to else date.today()
+    first = date.fromisoformat(date_from) if date_from else last - timedelta(days=default_days - 1)
+    return first.isoformat(), last.isoformat()
+
+
+def build_report(db, first_day, last_day, limit=20):
+    """Everything the dashboard / JSON API shows, as plain dicts."""
+    repo = AnalyticsRepo(db)
+    daily = [dict(r) for r in repo.daily(first_day, last_day)]
+    return {
+        "from": first_day,
+        "to": last_day,
+        "totals": {
+            "orders": sum(d["orders"] for d in daily),
+            "revenue": sum(d["revenue"] for d in daily),
+        },
+        "daily": daily,
+        "by_status": [dict(r) for r in repo.by_status(first_day, last_day)],
+        "products": [dict(r) for r in repo.top_products(first_day, last_day, limit)],
+        "agencies": [dict(r) for r in repo.top_agencies(first_day, last_day, limit)],
+    }
+
+
+def _rollup_sources(archived):
+    """FROM clauses for all orders/items: the hot tables, plus archived rows not (also) still in the hot DB."""
+    if not archived:
+        return "main.orders", "main.order_items"
+    orders = ("(SELECT id, created_at, status, total, agency FROM main.orders UNION ALL "
+              "SELECT id, created_at, status, total, agency FROM archive.orders "
+              "WHERE id NOT IN (SELECT id FROM main.orders))")
+    items = ("(SELECT order_id, product_id, quantity, unit_price FROM main.order_items UNION ALL "
+             "SELECT order_id, product_id, quantity, unit_price FROM archive.order_items "
+             "WHERE order_id NOT IN (SELECT id FROM main.orders))")
+    return orders, items
+
+
+def rebuild_rollups(conn, key=None, progress=None, archive_path=None, blind_index_key=None):
+    """
+    Recompute all rollup tables from orders/order_items in one transaction.
+
+    Product and status rollups are single INSERT ... SELECT statements; agency rollups
+    need the agency decrypted and hashed, so orders are streamed and each distinct
+    token decrypted once (with DATA_ENC_KEY `key`) and hashed under
+    crypto.index_key(key, blind_index_key). Without `key` every order counts under the '' agency.
+    Orders in the archive DB at `archive_path` (if it exists) are included.
+    """
+    from .crypto import index_key, keyed_hash
+
+    fernet = hash_key = None
+    if key:
+        hash_key = index_key(key, blind_index_key)
+        from cryptography.fernet import Fernet
+        fernet = Fernet(key.encode())
+    progress = progress or (lambda msg: None)
+    archived = bool(archive_path) and os.path.exists(archive_path)
+    if archived:
+        conn.execute("ATTACH DATABASE ? AS archive", (str(archive_path),))
+    orders_src, items_src = _rollup_sources(archived)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in ("rollup_product_daily", "rollup_status_daily", "rollup_agency_daily"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            "INSERT INTO rollup_product_daily (day, product_id, orders, units, revenue) "
+            "SELECT substr(o.created_at, 1, 10), oi.product_id, COUNT(DISTINCT o.id), SUM(oi.quantity), "
+            f"SUM(oi.quantity * oi.unit_price) FROM {items_src} oi JOIN {orders_src} o ON o.id = oi.order_id GROUP BY 1, 2"
+        )
+        progress("product rollups rebuilt")
+        conn.execute(
+            "INSERT INTO rollup_status_daily (day, status, orders, revenue) "
+            f"SELECT substr(created_at, 1, 10), status, COUNT(*), SUM(total) FROM {orders_src} GROUP BY 1, 2"
+        )
+        progress("status rollups rebuilt")
+
+        hashes, agencies = {}, {}
+        cur = conn.execute(f"SELECT created_at, total, agency FROM {orders_src}")
+        n = 0
+        while True:
+            rows = cur.fetchmany(10_000)
+            if not rows:
+                break
+            for created_at, total, token in rows:
+                if token not in hashes:
+                    plain = None
+                    if fernet and token:
+                        try:
+                            plain = fernet.decrypt(token.encode()).decode()
+                        except Exception:
+                            plain = None
+                    hashes[token] = keyed_hash(hash_key, "agency", plain) if plain else ""
+                k = (order_day(created_at), hashes[token])
+                acc = agencies.setdefault(k, [0, 0.0])
+                acc[0] += 1
+                acc[1] += total
+            n += len(rows)
+            progress(f"agency rollups: {n:,} orders")
+        conn.executemany(
+            "INSERT INTO rollup_agency_daily (day, agency_hash, orders, revenue) VALUES (?, ?, ?, ?)",
+            [(day, h, cnt, rev) for (day, h), (cnt, rev) in agencies.items()],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if archived:
+            conn.execute("DETACH DATABASE archive")
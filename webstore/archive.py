@@ -0,0 +1,154 @@
+"""Hot/cold order archival.
+
+Finished orders (completed/shipped/cancelled) older than ARCHIVE_AFTER_DAYS are
+moved from store.db into a separate archive SQLite file in batched
+transactions, so the hot DB (and every listing/index over it) only carries
+recent history. The archive has the same orders/order_items columns, including
+each line's sku/name as ordered, so archived orders still display after the
+product is edited or deleted. Readers ATTACH it read-only as `archive`
+(db.attach_archive); archived orders are read-only. Rollups are unaffected:
+they already count these orders and are never rebuilt from the hot DB alone.
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+from .db import ORDER_ITEM_SNAPSHOT_COLUMNS
+
+FINISHED_STATUSES = ("completed", "shipped", "cancelled")
+ARCHIVE_BATCH_SIZE = 1000
+# archives made before order_items had these columns got them from the products table
+ITEM_SNAPSHOT_COLUMNS = ORDER_ITEM_SNAPSHOT_COLUMNS
+
+
+def _columns(conn, schema, table):
+    return [(r[1], r[2]) for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def ensure_archive_schema(conn):
+    """Create/extend archive.orders and archive.order_items to match main (conn has the archive attached).
+    No foreign keys: customers and products live in the hot DB."""
+    for table, extra in (("orders", {}), ("order_items", ITEM_SNAPSHOT_COLUMNS)):
+        wanted = [(n, t) for n, t in _columns(conn, "main", table) if n != "id" and n not in extra] + list(extra.items())
+        have = {n for n, _ in _columns(conn, "archive", table)}
+        if not have:
+            cols = ", ".join(f"{n} {t}" for n, t in wanted)
+            conn.execute(f"CREATE TABLE archive.{table} (id INTEGER PRIMARY KEY, {cols})")
+            continue
+        for name, sqltype in wanted:
+            if name not in have:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {sqltype}")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_items_order ON order_items(order_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_created ON orders(created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_customer ON orders(customer_id, created_at)")
+
+
+def _db_bytes(conn, schema="main"):
+    page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+    pages = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+    free = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+    return (pages - free) * page_size, pages * page_size
+
+
+def archive_orders(db_path, archive_path, older_than_days, batch_size=ARCHIVE_BATCH_SIZE,
+                   vacuum=False, dry_run=False, progress=None):
+    """
+    Move finished orders created more than `older_than_days` ago into the archive DB.
+
+    Each batch is copied into the archive in one transaction, then deleted from the
+    hot DB in a second one (with WAL, a transaction spanning both files would not be
+    atomic across them). The delete only takes orders that are still finished and
+    still match their archived copy's status; one changed in between (e.g. an admin
+    moving it back to processing) stays hot, and its stale copy is dropped. A crash
+    in between leaves the batch in both files, which the next run re-copies; readers
+    prefer the hot copy. Returns
+    {"orders", "order_items", "kept", "used_bytes_before/after", "file_bytes_before/after"},
+    "kept" counting orders left hot because they changed mid-batch.
+    """
+    progress = progress or (lambda msg: None)
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (str(archive_path),))
+        ensure_archive_schema(conn)
+        conn.commit()
+        used_before, file_before = _db_bytes(conn)
+        order_cols = ", ".join(n for n, _ in _columns(conn, "main", "orders"))
+        item_names = [n for n, _ in _columns(conn, "main", "order_items") if n not in ITEM_SNAPSHOT_COLUMNS]
+        item_cols = ", ".join(item_names)
+        item_src = ", ".join(f"oi.{n}" for n in item_names)
+        status_param = json.dumps(FINISHED_STATUSES)
+        stats = {"orders": 0, "order_items": 0, "kept": 0, "cutoff": cutoff}
+        if dry_run:
+            stats["orders"] = conn.execute(
+                "SELECT COUNT(*) FROM main.orders WHERE created_at < ? AND status IN (SELECT value FROM json_each(?))",
+                (cutoff, status_param)).fetchone()[0]
+            return stats
+        select_batch = ("SELECT id FROM main.orders WHERE created_at < ? AND status IN (SELECT value FROM json_each(?)) "
+                        "ORDER BY id LIMIT ?")
+        archived_unchanged = (
+            "SELECT o.id FROM main.orders o JOIN archive.orders a ON a.id = o.id "
+            "WHERE o.id IN (SELECT value FROM json_each(?1)) AND o.status IN (SELECT value FROM json_each(?2)) "
+            "AND a.status IS o.status AND a.export_license_status IS o.export_license_status")
+        while True:
+            ids = [r[0] for r in conn.execute(select_batch, (cutoff, status_param, batch_size))]
+            if not ids:
+                break
+            id_param = json.dumps(ids)
+            # 1) copy into the archive (ids preserved; REPLACE refreshes a copy left by an interrupted run)
+            try:
+                conn.execute(f"INSERT OR REPLACE INTO archive.orders ({order_cols}) SELECT {order_cols} FROM main.orders "
+                             "WHERE id IN (SELECT value FROM json_each(?))", (id_param,))
+                conn.execute(
+                    f"INSERT OR REPLACE INTO archive.order_items ({item_cols}, sku, product_name) "
+                    f"SELECT {item_src}, COALESCE(oi.sku, p.sku), COALESCE(oi.product_name, p.name) "
+                    "FROM main.order_items oi LEFT JOIN main.products p ON p.id = oi.product_id "
+                    "WHERE oi.order_id IN (SELECT value FROM json_each(?))", (id_param,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            # 2) delete from the hot DB only orders still finished and unchanged since the copy;
+            # the write lock is held from the check, so no status change can land in between
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                done = [r[0] for r in conn.execute(archived_unchanged, (id_param, status_param))]
+                done_param = json.dumps(done)
+                moved_items = conn.execute("DELETE FROM main.order_items WHERE order_id IN "
+                                           "(SELECT value FROM json_each(?))", (done_param,)).rowcount
+                conn.execute("DELETE FROM main.orders WHERE id IN (SELECT value FROM json_each(?))", (done_param,))
+                # archived orders are read from the archive, not from their read model
+                conn.execute("DELETE FROM main.order_views WHERE order_id IN (SELECT value FROM json_each(?))",
+                             (done_param,))
+                # orders changed after the copy stay hot; drop their now-stale archive copies
+                changed_param = json.dumps(sorted(set(ids) - set(done)))
+                conn.execute("DELETE FROM archive.order_items WHERE order_id IN (SELECT value FROM json_each(?))",
+                             (changed_param,))
+                conn.execute("DELETE FROM archive.orders WHERE id IN (SELECT value FROM json_each(?))",
+                             (changed_param,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            stats["kept"] += len(ids) - len(done)
+            stats["orders"] += len(done)
+            stats["order_items"] += moved_items
+            progress(f"archived {stats['orders']:,} orders")
+        used_after, _ = _db_bytes(conn)
+        conn.execute("DETACH DATABASE archive")
+        if vacuum and stats["orders"]:
+            progress("vacuuming hot DB")
+            conn.execute("VACUUM")
+        stats.update(used_bytes_before=used_before, used_bytes_after=used_after,
+                     file_bytes_before=file_before, file_bytes_after=os.path.getsize(db_path))
+        return stats
+    finally:
+        conn.close()
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:,.1f} {unit}"
+        n /= 1024
@@ -0,0 +1,321 @@
+"""ASGI front-end with async read paths for the storefront.
+
+`/`, `/products`, `/product/<sku>`, `/cart` and the JSON catalogue API
+(`/api/products`, `/api/products/<sku>`) are served by coroutines: SQLite
+reads run on a small connection pool via `asyncio.to_thread` and templates
+are rendered with an async-enabled overlay of the Flask Jinja environment.
+Everything else (all POSTs, admin pages, checkout, ...) is handed to the
+normal Flask WSGI app through asgiref's `WsgiToAsgi`, so both run side by
+side in the same process.
+
+The admin live order feed (`/admin/orders/events`, Server-Sent Events) is a
+coroutine too: under WsgiToAsgi every WSGI request runs on one shared thread,
+so a long-lived sync stream would stall all the other WSGI views.
+
+Sessions, `before_request` hooks (session timeout) and cookies still go
+through Flask: each async request runs inside `app.request_context()`.
+
+Run with any ASGI server, e.g. `uvicorn asgi:app --workers 4`.
+"""
+import asyncio
+import io
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+from flask import jsonify, redirect, request, session, url_for
+
+from . import catalogue, create_app, order_feed, templating
+from .db import ensure_schema
+from .repos import ORDER_EVENTS_BOUNDS_SQL, ORDER_EVENTS_SINCE_SQL, PRODUCT_BY_SKU_SQL, PRODUCTS_LIST_SQL
+from .storage import uses_postgres
+
+# how often an async order feed stream checks for same-process changes between DB polls
+FEED_WAKE_SECONDS = 0.2
+
+
+class AsyncReadPool:
+    """Fixed-size pool of read-only SQLite connections used from worker threads via asyncio.to_thread."""
+
+    def __init__(self, db_path, size=8, journal_mode=None, cached_statements=128):
+        self.db_path = str(db_path)
+        self.size = size
+        self.journal_mode = journal_mode
+        self.cached_statements = cached_statements
+        self._idle = None
+        self._all = []
+
+    def _connect(self):
+        # check_same_thread=False: a connection is only ever used by one thread at a time (pool checkout)
+        conn = sqlite3.connect(f"file:{Path(self.db_path).as_posix()}?mode=ro", uri=True,
+                               check_same_thread=False, cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    async def start(self):
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        await asyncio.to_thread(ensure_schema, self.db_path, self.journal_mode)
+        for _ in range(self.size):
+            conn = await asyncio.to_thread(self._connect)
+            self._all.append(conn)
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._all:
+            conn.close()
+        self._all = []
+        self._idle = None
+
+    async def run(self, fn):
+        """Call fn(conn) on a pooled connection in a worker thread; returns its result."""
+        if self._idle is None:
+            await self.start()
+        conn = await self._idle.get()
+        try:
+            return await asyncio.to_thread(fn, conn)
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def fetchall(self, sql, params=()):
+        """Run a read query on a pooled connection; returns a list of dicts."""
+        return await self.run(lambda conn: [dict(r) for r in conn.execute(sql, params).fetchall()])
+
+    async def fetchone(self, sql, params=()):
+        rows = await self.fetchall(sql, params)
+        return rows[0] if rows else None
+
+
+def _environ_from_scope(scope):
+    """Build a minimal WSGI environ for a body-less ASGI HTTP request (GET/HEAD)."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("127.0.0.1", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(b""),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin1")
+        value = raw_value.decode("latin1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name == "content-length":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+            if key in environ:
+                sep = "; " if key == "HTTP_COOKIE" else ","
+                value = environ[key] + sep + value
+            environ[key] = value
+    return environ
+
+
+class AsyncStorefront:
+    """ASGI app: async handlers for catalogue/cart reads, Flask WSGI for everything else."""
+
+    def __init__(self, flask_app, pool_size=8):
+        if uses_postgres(flask_app.config):
+            # the async read paths query the SQLite file directly (AsyncReadPool)
+            raise RuntimeError("the ASGI storefront needs the SQLite backend; serve app:app when DATABASE_URL is set")
+        self.app = flask_app
+        self.pool = AsyncReadPool(flask_app.config["DB_PATH"], size=pool_size,
+                                  journal_mode=flask_app.config.get("SQLITE_JOURNAL_MODE"),
+                                  cached_statements=flask_app.config["SQLITE_CACHED_STATEMENTS"])
+        # separate compiled-template caches: async templates can't be shared with the sync env
+        self.jinja = flask_app.jinja_env.overlay(
+            enable_async=True, cache_size=400,
+            bytecode_cache=templating.bytecode_cache(flask_app, templating.ASYNC_CACHE_PATTERN))
+        if flask_app.config.get("TEMPLATE_PRECOMPILE"):
+            templating.precompile(self.jinja)
+        self._wsgi = None
+        self.routes = [
+            (re.compile(r"^/$"), self.index),
+            (re.compile(r"^/products$"), self.products),
+            (re.compile(r"^/product/(?P<sku>[^/]+)$"), self.product_detail),
+            (re.compile(r"^/cart$"), self.cart_view),
+            (re.compile(r"^/api/products$"), self.api_products),
+            (re.compile(r"^/api/products/(?P<sku>[^/]+)$"), self.api_product),
+        ]
+
+    @property
+    def wsgi(self):
+        if self._wsgi is None:
+            from asgiref.wsgi import WsgiToAsgi
+            self._wsgi = WsgiToAsgi(self.app)
+        return self._wsgi
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] == "http" and scope["method"] == "GET" and scope["path"] == "/admin/orders/events":
+            if await self.order_events(scope, receive, send):
+                return
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            for pattern, handler in self.routes:
+                m = pattern.match(scope["path"])
+                if m:
+                    if await self._serve(handler, m.groupdict(), scope, send):
+                        return
+                    break
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.pool.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.pool.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _serve(self, handler, kwargs, scope, send):
+        """Run an async handler inside a Flask request context. Returns False to fall back to WSGI."""
+        app = self.app
+        with app.request_context(_environ_from_scope(scope)):
+            # pending flash messages are consumed (a session write) by the sync views
+            if session.get("_flashes"):
+                return False
+            # as Flask.wsgi_app/full_dispatch_request: HTTPExceptions (abort(), redirects) and
+            # registered error handlers first; only what they re-raise becomes a 500
+            try:
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await handler(**kwargs)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.process_response(app.make_response(rv))
+            except Exception as e:
+                response = app.handle_exception(e)
+
+        headers = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in response.headers.items()]
+        await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+        body = b"" if scope["method"] == "HEAD" else response.get_data()
+        await send({"type": "http.response.body", "body": body})
+        return True
+
+    async def order_events(self, scope, receive, send):
+        """Async version of admin.admin_order_events. Returns False (use the WSGI view) unless
+        the session is an admin one, so login redirects and session expiry stay in Flask."""
+        app = self.app
+        with app.request_context(_environ_from_scope(scope)):
+            if not session.get("is_admin") or app.preprocess_request() is not None:
+                return False
+            last_id = order_feed.parse_last_event_id(
+                request.headers.get("Last-Event-ID") or request.args.get("last_event_id"))
+            response = app.process_response(app.response_class(
+                mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}))
+        cfg = app.config
+        poll, heartbeat = cfg["ORDER_FEED_POLL_SECONDS"], cfg["ORDER_FEED_HEARTBEAT_SECONDS"]
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        async def push(text):
+            await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+
+        watcher = asyncio.create_task(watch_disconnect())
+        headers = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in response.headers.items()]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        try:
+            bounds = await self.pool.fetchone(ORDER_EVENTS_BOUNDS_SQL)
+            last_id, reset = order_feed.resolve_start(tuple(bounds.values()), last_id)
+            await push(f"retry: {order_feed.RETRY_MS}\n\n")
+            if reset:
+                await push(order_feed.reset_message(last_id))
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + cfg["ORDER_FEED_MAX_SECONDS"]
+            last_sent = last_polled = loop.time()
+            seen = None
+            while not disconnected.is_set() and loop.time() < deadline:
+                now = loop.time()
+                generation = order_feed.current_generation()
+                if generation != seen or now - last_polled >= poll:
+                    seen, last_polled = generation, now
+                    rows = await self.pool.fetchall(ORDER_EVENTS_SINCE_SQL, (last_id, order_feed.EVENT_BATCH))
+                    for row in rows:
+                        await push(order_feed.format_event(row))
+                        last_id = row["id"]
+                    if rows:
+                        last_sent = now
+                        if len(rows) == order_feed.EVENT_BATCH:
+                            continue
+                if now - last_sent >= heartbeat:
+                    await push(": keep-alive\n\n")
+                    last_sent = now
+                try:
+                    await asyncio.wait_for(disconnected.wait(), FEED_WAKE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            watcher.cancel()
+            if not disconnected.is_set():
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        return True
+
+    async def render(self, template_name, **context):
+        self.app.update_template_context(context)
+        template = self.jinja.get_template(template_name)
+        return await template.render_async(context)
+
+    # --- async read handlers (mirror shop.index/products/product_detail and cart.cart_view) ---
+    async def index(self):
+        featured = await self.pool.fetchall(PRODUCTS_LIST_SQL, (3,))
+        return await self.render("index.html", featured=featured)
+
+    async def products(self):
+        prods = await self.pool.fetchall(PRODUCTS_LIST_SQL, (-1,))
+        snapshot = await self.pool.run(lambda conn: catalogue.current(self.app, conn))
+        return await self.render("products.html", layout=snapshot.layout.arrange(prods))
+
+    async def product_detail(self, sku):
+        p = await self.pool.fetchone(PRODUCT_BY_SKU_SQL, (sku.upper(),))
+        if not p:
+            return redirect(url_for("shop.products"))
+        return await self.render("product_detail.html", product=p)
+
+    async def cart_view(self):
+        cart = session.get("cart", {}) or {}
+        items = []
+        total = 0.0
+        if cart:
+            # version check (and any rebuild) off the event loop, pricing itself is in-memory
+            snapshot = await self.pool.run(lambda conn: catalogue.current(self.app, conn))
+            pricing = snapshot.price_cart(cart)
+            items, total = pricing.lines, pricing.total
+        return await self.render("cart.html", items=items, total=total)
+
+    async def api_products(self):
+        return jsonify(await self.pool.fetchall(PRODUCTS_LIST_SQL, (-1,)))
+
+    async def api_product(self, sku):
+        p = await self.pool.fetchone(PRODUCT_BY_SKU_SQL, (sku.upper(),))
+        if not p:
+            return jsonify({"error": "not found"}), 404
+        return jsonify(p)
+
+
+def create_asgi_app(config=None, pool_size=8):
+    """Build the Flask app with `create_app(config)` and wrap it with the async read paths."""
+    return AsyncStorefront(create_app(config), pool_size=pool_size)
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, flash, redirect, request, session, url_for
+
+
+# simple login_required decorator (admin-only)
+def login_required(f):
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        if not session.get("is_admin"):
+            return redirect(url_for("admin.admin_login", next=request.path))
+        return f(*args, **kwargs)
+    return wrapped
+
+
+def enforce_session_timeout():
+    """
+    Invalidate session if inactive longer than SESSION_TIMEOUT_MINUTES.
+    Keeps session non-permanent (do not rely on browser to drop cookies).
+    """
+    # skip session checks for static assets, service worker and simple health/debug endpoints
+    if request.path.startswith(("/static", "/sw.js", "/favicon.ico", "/admin/debug", "/admin/uploads")):
+        return
+
+    # update or expire session last_active timestamp
+    now_ts = datetime.now(timezone.utc).timestamp()
+    last = session.get("last_active")
+    timeout_secs = current_app.config["SESSION_TIMEOUT_MINUTES"] * 60
+
+    # absolute session age check (created_at)
+    created = session.get("created_at")
+    if created:
+        try:
+            created_ts = float(created)
+        except Exception:
+            created_ts = None
+        if created_ts:
+            max_age_secs = current_app.config["SESSION_MAX_AGE_MINUTES"] * 60
+            if (now_ts - created_ts) > max_age_secs:
+                session.clear()
+                if request.path.startswith("/admin"):
+                    flash("Session expired. Please log in again.", "info")
+                    return redirect(url_for("admin.admin_login", next=request.path))
+                return
+
+    if last:
+        try:
+            last_ts = float(last)
+        except Exception:
+            last_ts = None
+
+        if last_ts and (now_ts - last_ts) > timeout_secs:
+            # expire session
+            session.clear()
+            # If an admin page was being accessed, redirect to admin login
+            if request.path.startswith("/admin"):
+                flash("Session expired due to inactivity. Please log in again.", "info")
+                return redirect(url_for("admin.admin_login", next=request.path))
+            # otherwise allow request to continue as anonymous (session cleared)
+
+    # refresh last_active for logged-in users (only for non-static interactive requests)
+    if session.get("customer_id") or session.get("is_admin"):
+        session["last_active"] = now_ts
+        # set created_at when session first established (keeps absolute age tracking)
+        if "created_at" not in session:
+            session["created_at"] = now_ts
@@ -0,0 +1,466 @@
+"""Online backups of store.db (and the order archive) with point-in-time restore.
+
+A snapshot is a directory under BACKUP_DIR/snapshots/<UTC timestamp>/ holding
+gzip-compressed copies of the databases and a manifest.json with their sizes,
+SHA-256 checksums (raw and compressed), page counts and backup throughput, plus
+the private_uploads files the snapshot's orders reference. Upload files are
+stored once, content-addressed, under BACKUP_DIR/blobs/ and shared between
+snapshots.
+
+Copies use the sqlite3 backup API in page steps with a short pause between
+steps, so checkout writers only ever wait for one step. In WAL mode the source
+connection holds a read transaction for the whole copy: writers carry on (into
+the WAL) and the copy is of that one point in time, instead of restarting every
+time another connection commits. Restore picks the newest snapshot taken at or
+before a given time and writes it to a fresh file after verifying its checksum.
+
+scripts/backup.py is the CLI; BACKUP_INTERVAL_MINUTES > 0 also runs it from the
+app in a background thread (start_scheduler).
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .storage import uses_postgres
+
+BACKUP_STEP_PAGES = 1024     # pages per backup step (4 MB at the default 4 KB page size)
+BACKUP_STEP_PAUSE = 0.002    # seconds between steps, so waiting writers get the lock
+COMPRESS_LEVEL = 1           # gzip level: the copy is I/O-bound, higher levels mostly cost CPU
+CHUNK_SIZE = 1 << 20
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+SNAPSHOT_NAME_FORMAT = "%Y%m%dT%H%M%S%fZ"
+# orders columns holding private_uploads file names
+UPLOAD_COLUMNS = ("auth_doc", "end_user_cert", "digital_signature")
+# a scheduler lock older than this is from a crashed run
+STALE_LOCK_SECONDS = 6 * 3600
+
+
+class BackupError(Exception):
+    """A snapshot is missing, incomplete or fails its checksums."""
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _parse_time(value):
+    """Accept a datetime or ISO string (naive = UTC) and return an aware UTC datetime."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def online_copy(src_path, dst_path, step_pages=BACKUP_STEP_PAGES, pause=BACKUP_STEP_PAUSE, progress=None):
+    """
+    Copy the live database at src_path to dst_path with the backup API, step_pages at a time.
+
+    Returns {"pages", "page_size", "bytes", "steps", "restarts", "seconds"}. "restarts"
+    counts how often SQLite had to start over because the source changed mid-copy
+    (only possible when the source is not in WAL mode).
+    """
+    progress = progress or (lambda msg: None)
+    src = sqlite3.connect(f"file:{Path(src_path).as_posix()}?mode=ro", uri=True, timeout=30)
+    dst = sqlite3.connect(dst_path)
+    state = {"steps": 0, "restarts": 0, "remaining": None, "reported": 0.0}
+
+    def on_step(status, remaining, total):
+        state["steps"] += 1
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+        state["remaining"] = remaining
+        now = time.monotonic()
+        if now - state["reported"] >= 5:
+            state["reported"] = now
+            progress(f"{Path(src_path).name}: {total - remaining:,}/{total:,} pages")
+        if remaining and pause:
+            time.sleep(pause)
+
+    t0 = time.perf_counter()
+    try:
+        pinned = src.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+        if pinned:
+            # a WAL read transaction fixes what the backup sees; commits by others don't restart it
+            src.execute("BEGIN")
+            src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+        src.backup(dst, pages=step_pages, progress=on_step)
+        if pinned:
+            src.rollback()
+        # a standalone file: no -wal/-shm needed to open or restore it
+        dst.execute("PRAGMA journal_mode=DELETE")
+        pages = dst.execute("PRAGMA page_count").fetchone()[0]
+        page_size = dst.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    return {"pages": pages, "page_size": page_size, "bytes": os.path.getsize(dst_path),
+            "steps": state["steps"], "restarts": state["restarts"], "seconds": time.perf_counter() - t0}
+
+
+class _HashingWriter:
+    """File wrapper that hashes and counts everything written through it (the compressed stream)."""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+def compress_file(src_path, gz_path, level=COMPRESS_LEVEL):
+    """gzip src_path to gz_path in one pass; returns sha256/bytes of both the raw and the compressed data."""
+    raw_hash, raw_size = hashlib.sha256(), 0
+    with open(src_path, "rb") as src, open(gz_path, "wb") as out:
+        sink = _HashingWriter(out)
+        with gzip.GzipFile(filename="", mode="wb", fileobj=sink, compresslevel=level, mtime=0) as gz:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                raw_hash.update(chunk)
+                raw_size += len(chunk)
+                gz.write(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+    return {"sha256": raw_hash.hexdigest(), "bytes": raw_size,
+            "gz_sha256": sink.sha256.hexdigest(), "gz_bytes": sink.size}
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def referenced_uploads(db_path):
+    """Names of private_uploads files referenced by orders in the (snapshot) database."""
+    conn = sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True)
+    try:
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(orders)")}
+        parts = [f"SELECT {c} FROM orders WHERE {c} IS NOT NULL AND {c} != ''" for c in UPLOAD_COLUMNS if c in cols]
+        if not parts:
+            return []
+        return sorted(r[0] for r in conn.execute(" UNION ".join(parts)))
+    finally:
+        conn.close()
+
+
+def _blob_path(backup_dir, sha):
+    return Path(backup_dir) / "blobs" / sha[:2] / sha
+
+
+def store_blob(backup_dir, path):
+    """Copy a file into the content-addressed blob store (once); returns (sha256, bytes, newly_stored)."""
+    sha = _file_sha256(path)
+    target = _blob_path(backup_dir, sha)
+    if target.exists():
+        return sha, target.stat().st_size, False
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{sha}.tmp{os.getpid()}")
+    shutil.copyfile(path, tmp)
+    os.replace(tmp, target)
+    return sha, target.stat().st_size, True
+
+
+def create_snapshot(db_path, backup_dir, uploads_dir=None, archive_path=None, step_pages=BACKUP_STEP_PAGES,
+                    pause=BACKUP_STEP_PAUSE, level=COMPRESS_LEVEL, progress=None):
+    """
+    Take a snapshot of db_path (and archive_path, if it exists) into backup_dir/snapshots/.
+
+    The snapshot directory only gets its final name once everything, manifest
+    included, is written, so an interrupted run never looks like a usable snapshot.
+    Returns (snapshot_dir, manifest).
+    """
+    progress = progress or (lambda msg: None)
+    started = _utcnow()
+    snapshots = Path(backup_dir) / "snapshots"
+    final = snapshots / started.strftime(SNAPSHOT_NAME_FORMAT)
+    work = final.with_name(final.name + ".partial")
+    work.mkdir(parents=True)
+    manifest = {"version": MANIFEST_VERSION, "taken_at": started.isoformat(), "databases": {},
+                "uploads": {}, "missing_uploads": []}
+    try:
+        # hot DB first: archival copies orders to the archive before deleting them,
+        # so this order can only duplicate an order across the two copies, never lose one
+        sources = [("store", Path(db_path))]
+        if archive_path and os.path.exists(archive_path):
+            sources.append(("archive", Path(archive_path)))
+        refs = set()
+        for role, path in sources:
+            raw = work / f"{role}.db"
+            copy = online_copy(path, raw, step_pages=step_pages, pause=pause, progress=progress)
+            refs.update(referenced_uploads(raw))
+            t0 = time.perf_counter()
+            sums = compress_file(raw, work / f"{role}.db.gz", level=level)
+            compress_seconds = time.perf_counter() - t0
+            raw.unlink()
+            seconds = copy["seconds"] + compress_seconds
+            manifest["databases"][role] = {
+                "source": str(path), "file": f"{role}.db.gz", **sums,
+                "pages": copy["pages"], "page_size": copy["page_size"], "restarts": copy["restarts"],
+                "copy_seconds": round(copy["seconds"], 3), "compress_seconds": round(compress_seconds, 3),
+                "mb_per_s": round(sums["bytes"] / 1e6 / seconds, 1) if seconds else None,
+            }
+            progress(f"{role}: {sums['bytes'] / 1e6:,.1f} MB -> {sums['gz_bytes'] / 1e6:,.1f} MB in {seconds:.1f}s")
+
+        new_blobs = 0
+        for name in sorted(refs):
+            path = Path(uploads_dir) / name if uploads_dir else None
+            if path is None or not path.is_file():
+                manifest["missing_uploads"].append(name)
+                continue
+            sha, size, stored = store_blob(backup_dir, path)
+            new_blobs += stored
+            manifest["uploads"][name] = {"sha256": sha, "bytes": size}
+        if refs:
+            progress(f"uploads: {len(manifest['uploads'])} referenced, {new_blobs} new, "
+                     f"{len(manifest['missing_uploads'])} missing")
+
+        manifest["seconds"] = round((_utcnow() - started).total_seconds(), 3)
+        with open(work / MANIFEST_NAME, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(work, final)
+    except BaseException:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    return final, manifest
+
+
+def list_snapshots(backup_dir):
+    """[(snapshot_dir, manifest)] of complete snapshots, oldest first."""
+    root = Path(backup_dir) / "snapshots"
+    if not root.is_dir():
+        return []
+    out = []
+    for d in sorted(root.iterdir()):
+        manifest_path = d / MANIFEST_NAME
+        if d.suffix == ".partial" or not manifest_path.is_file():
+            continue
+        with open(manifest_path, encoding="utf-8") as f:
+            out.append((d, json.load(f)))
+    return out
+
+
+def find_snapshot(backup_dir, at=None):
+    """Newest snapshot taken at or before `at` (datetime or ISO string; default: newest)."""
+    at = _parse_time(at) if at is not None else None
+    chosen = None
+    for d, manifest in list_snapshots(backup_dir):
+        if at is None or _parse_time(manifest["taken_at"]) <= at:
+            chosen = (d, manifest)
+    if chosen is None:
+        raise BackupError(f"no snapshot in {backup_dir}" + (f" at or before {at.isoformat()}" if at else ""))
+    return chosen
+
+
+def _decompress_to(gz_path, out_path):
+    """Stream gz_path into out_path (or nowhere); returns (raw sha256, raw bytes)."""
+    raw_hash, size = hashlib.sha256(), 0
+    with gzip.open(gz_path, "rb") as src, open(out_path or os.devnull, "wb") as out:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            raw_hash.update(chunk)
+            size += len(chunk)
+            out.write(chunk)
+    return raw_hash.hexdigest(), size
+
+
+def _check_db(snapshot_dir, role, info, out_path=None):
+    """Checksum one database file of a snapshot (compressed first, then the decompressed
+    stream, optionally written to out_path); returns a list of problems."""
+    gz_path = Path(snapshot_dir) / info["file"]
+    try:
+        if _file_sha256(gz_path) != info["gz_sha256"]:
+            return [f"{role}: compressed checksum mismatch"]
+        raw_sha, size = _decompress_to(gz_path, out_path)
+    except (OSError, EOFError, zlib.error) as e:
+        return [f"{role}: {e}"]
+    if raw_sha != info["sha256"] or size != info["bytes"]:
+        return [f"{role}: database checksum mismatch"]
+    return []
+
+
+def verify_snapshot(backup_dir, snapshot_dir, manifest):
+    """Re-check every checksum in the manifest (databases and upload blobs); returns a list of problems."""
+    problems = []
+    for role, info in manifest["databases"].items():
+        problems += _check_db(snapshot_dir, role, info)
+    for name, info in manifest["uploads"].items():
+        blob = _blob_path(backup_dir, info["sha256"])
+        if not blob.is_file():
+            problems.append(f"upload {name}: blob missing")
+        elif _file_sha256(blob) != info["sha256"]:
+            problems.append(f"upload {name}: blob checksum mismatch")
+    return problems
+
+
+def archive_target_for(target):
+    """store.db -> store.archive.db (the ARCHIVE_DB_PATH naming)."""
+    target = Path(target)
+    return target.with_name(f"{target.stem}.archive{target.suffix or '.db'}")
+
+
+def restore_snapshot(backup_dir, target, at=None, archive_target=None, uploads_target=None, progress=None):
+    """
+    Restore the newest snapshot taken at or before `at` into the fresh file `target`.
+
+    Existing files are never overwritten. Each database is decompressed to a temp
+    file, checked against the manifest and with PRAGMA quick_check, then renamed
+    into place. The archive (if the snapshot has one) goes to archive_target
+    (default: store.archive.db next to target); upload files are copied into
+    uploads_target when given. Returns (snapshot_dir, manifest).
+    """
+    progress = progress or (lambda msg: None)
+    snapshot_dir, manifest = find_snapshot(backup_dir, at)
+    targets = {"store": Path(target)}
+    if "archive" in manifest["databases"]:
+        targets["archive"] = Path(archive_target) if archive_target else archive_target_for(target)
+    for path in targets.values():
+        if path.exists():
+            raise BackupError(f"{path} already exists; restore only writes fresh files")
+    progress(f"restoring snapshot {snapshot_dir.name} (taken {manifest['taken_at']})")
+
+    tmp_paths = {role: path.with_name(path.name + ".restore-tmp") for role, path in targets.items()}
+    try:
+        for role, path in targets.items():
+            tmp = tmp_paths[role]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            problems = _check_db(snapshot_dir, role, manifest["databases"][role], tmp)
+            if problems:
+                raise BackupError("; ".join(problems))
+            conn = sqlite3.connect(tmp)
+            try:
+                result = conn.execute("PRAGMA quick_check").fetchone()[0]
+            finally:
+                conn.close()
+            if result != "ok":
+                raise BackupError(f"{role}: quick_check failed: {result}")
+        for role, path in targets.items():
+            os.replace(tmp_paths[role], path)
+            progress(f"{role} -> {path}")
+    finally:
+        for tmp in tmp_paths.values():
+            if tmp.exists():
+                tmp.unlink()
+
+    if uploads_target:
+        uploads_target = Path(uploads_target)
+        uploads_target.mkdir(parents=True, exist_ok=True)
+        copied = 0
+        for name, info in manifest["uploads"].items():
+            dest = uploads_target / name
+            if dest.exists():
+                continue
+            shutil.copyfile(_blob_path(backup_dir, info["sha256"]), dest)
+            copied += 1
+        progress(f"uploads: {copied} copied to {uploads_target}")
+    return snapshot_dir, manifest
+
+
+def prune_snapshots(backup_dir, keep):
+    """Keep the newest `keep` snapshots, then delete blobs no remaining manifest references.
+    Returns (snapshots_removed, blobs_removed)."""
+    snapshots = list_snapshots(backup_dir)
+    removed = 0
+    for d, _ in snapshots[:max(len(snapshots) - keep, 0)]:
+        shutil.rmtree(d)
+        removed += 1
+    live = {info["sha256"] for _, m in list_snapshots(backup_dir) for info in m["uploads"].values()}
+    blobs_removed = 0
+    blob_root = Path(backup_dir) / "blobs"
+    if blob_root.is_dir():
+        for blob in blob_root.glob("*/*"):
+            if blob.name not in live and ".tmp" not in blob.name:
+                blob.unlink()
+                blobs_removed += 1
+    return removed, blobs_removed
+
+
+def _acquire_lock(backup_dir):
+    """Cross-process lock (mkdir is atomic everywhere), so several app workers don't back up at once."""
+    lock = Path(backup_dir) / ".lock"
+    lock.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        lock.mkdir()
+        return lock
+    except FileExistsError:
+        try:
+            if time.time() - lock.stat().st_mtime > STALE_LOCK_SECONDS:
+                lock.rmdir()
+                lock.mkdir()
+                return lock
+        except OSError:
+            pass
+        return None
+
+
+def run_due_backup(config, interval_minutes, keep=None, progress=None):
+    """Take a snapshot if the newest one is older than interval_minutes (and no other process is
+    taking one), then prune to `keep`. Returns the new snapshot dir, or None if not due."""
+    backup_dir = config["BACKUP_DIR"]
+    snapshots = list_snapshots(backup_dir)
+    if snapshots:
+        age = (_utcnow() - _parse_time(snapshots[-1][1]["taken_at"])).total_seconds()
+        if age < interval_minutes * 60:
+            return None
+    lock = _acquire_lock(backup_dir)
+    if lock is None:
+        return None
+    try:
+        snapshot_dir, _ = create_snapshot(config["DB_PATH"], backup_dir, uploads_dir=config["PRIVATE_UPLOADS"],
+                                          archive_path=config.get("ARCHIVE_DB_PATH"), progress=progress)
+        if keep:
+            prune_snapshots(backup_dir, keep)
+        return snapshot_dir
+    finally:
+        lock.rmdir()
+
+
+def start_scheduler(app):
+    """Start the background backup thread when BACKUP_INTERVAL_MINUTES > 0 (once per process)."""
+    interval = app.config.get("BACKUP_INTERVAL_MINUTES") or 0
+    state = app.extensions["webstore"]
+    if interval <= 0 or state.get("backup_thread"):
+        return None
+    if uses_postgres(app.config):
+        app.logger.warning("BACKUP_INTERVAL_MINUTES ignored: backups copy the SQLite file, use pg_dump with DATABASE_URL")
+        return None
+    config = {k: app.config.get(k) for k in ("DB_PATH", "BACKUP_DIR", "PRIVATE_UPLOADS", "ARCHIVE_DB_PATH")}
+    keep = app.config.get("BACKUP_KEEP")
+    logger = app.logger
+
+    def run():
+        while True:
+            try:
+                snapshot_dir = run_due_backup(config, interval, keep)
+                if snapshot_dir:
+                    logger.info("Backup snapshot written to %s", snapshot_dir)
+            except Exception:
+                logger.exception("Scheduled backup failed")
+            # wake up often enough to notice when the interval has elapsed
+            time.sleep(min(60, interval * 60))
+
+    thread = threading.Thread(target=run, name="backup-scheduler", daemon=True)
+    thread.start()
+    state["backup_thread"] = thread
+    return thread
@@ -0,0 +1,117 @@
+"""Blind indexes: exact-match search over encrypted order fields without decrypting them.
+
+Fernet tokens differ on every encryption, so an encrypted column can't be indexed or
+compared. Next to each searchable field, orders carry `<field>_bidx`: a keyed hash
+(crypto.keyed_hash under crypto.index_key: BLIND_INDEX_KEY, or a key derived from
+DATA_ENC_KEY) of the normalised plaintext, written by checkout() and backfilled for
+older rows by scripts/backfill_blind_indexes.py (with --rehash after the index key
+changes, e.g. a DATA_ENC_KEY rotation without BLIND_INDEX_KEY set). A
+search hashes the query the same way and looks it up through the partial indexes
+created in db.ensure_schema; only the matching rows are decrypted for display.
+
+Normalisation decides what counts as "the same" value: references ignore case and
+punctuation ("PO-1234" == "po 1234"), phone numbers keep only digits, names ignore
+case and repeated whitespace. The hashes are truncated to 64 bits, which is plenty to
+find an order but reveals little beyond which orders share a value. agency_bidx is the
+same hash as the rollups' agency_hash.
+"""
+import re
+
+from .crypto import index_key, keyed_hash
+
+BACKFILL_BATCH = 2000
+SEARCH_LIMIT = 100
+
+_NON_ALNUM = re.compile(r"[\W_]+")
+_NON_DIGIT = re.compile(r"\D+")
+
+
+def _reference(value):
+    return _NON_ALNUM.sub("", value).casefold()
+
+
+def _phone(value):
+    return _NON_DIGIT.sub("", value)
+
+
+def _name(value):
+    return " ".join(value.split()).casefold()
+
+
+# searchable field -> normaliser (the label passed to keyed_hash is the field name)
+BLIND_INDEX_FIELDS = {
+    "po_number": _reference,
+    "contract_reference": _reference,
+    "agency": _name,
+    "authorized_officer": _name,
+    "contact_number": _phone,
+}
+BLIND_INDEX_COLUMNS = [f"{field}_bidx" for field in BLIND_INDEX_FIELDS]
+
+
+def blind_index(key, field, value):
+    """
+    The `<field>_bidx` value for a plaintext under index key `key` (crypto.index_key),
+    or None (no key, or nothing left after normalising).
+    """
+    if not key or value is None:
+        return None
+    normalised = BLIND_INDEX_FIELDS[field](str(value))
+    return keyed_hash(key, field, normalised) if normalised else None
+
+
+def blind_indexes(key, plaintexts):
+    """{'<field>_bidx': hash} for every searchable field in `plaintexts` ({field: plaintext})."""
+    return {f"{field}_bidx": blind_index(key, field, plaintexts.get(field)) for field in BLIND_INDEX_FIELDS}
+
+
+def search_hashes(key, query, field=None):
+    """Hashes to look up, one per BLIND_INDEX_COLUMNS entry (None = don't match that column)."""
+    fields = [field] if field else list(BLIND_INDEX_FIELDS)
+    return [blind_index(key, f, query) if f in fields else None for f in BLIND_INDEX_FIELDS]
+
+
+def backfill(conn, key, batch_size=BACKFILL_BATCH, progress=None, blind_index_key=None, rehash=False):
+    """
+    Fill in missing blind indexes for orders in `conn`, decrypting only the searchable
+    fields with DATA_ENC_KEY `key` and hashing under index_key(key, blind_index_key).
+    `rehash` recomputes every row's indexes instead (after the index key changed).
+    Resumable: each batch commits; without `rehash`, rows that already have their
+    indexes are skipped. Returns (orders updated, fields that could not be decrypted).
+    """
+    from cryptography.fernet import Fernet, InvalidToken
+
+    fernet = Fernet(key.encode())
+    hash_key = index_key(key, blind_index_key)
+    progress = progress or (lambda msg: None)
+    fields = list(BLIND_INDEX_FIELDS)
+    if rehash:
+        todo = " OR ".join(f"({f} IS NOT NULL AND {f} != '')" for f in fields)
+        assign = [f"{c} = ?" for c in BLIND_INDEX_COLUMNS]
+    else:
+        todo = " OR ".join(f"({f} IS NOT NULL AND {f} != '' AND {f}_bidx IS NULL)" for f in fields)
+        assign = [f"{c} = COALESCE(?, {c})" for c in BLIND_INDEX_COLUMNS]
+    select = f"SELECT id, {', '.join(fields)} FROM orders WHERE id > ? AND ({todo}) ORDER BY id LIMIT ?"
+    update = f"UPDATE orders SET {', '.join(assign)} WHERE id = ?"
+    last_id, updated, failed = 0, 0, 0
+    while True:
+        rows = conn.execute(select, (last_id, batch_size)).fetchall()
+        if not rows:
+            return updated, failed
+        params = []
+        for row in rows:
+            plain = {}
+            for f, token in zip(fields, row[1:]):
+                if not token:
+                    continue
+                try:
+                    plain[f] = fernet.decrypt(token.encode()).decode()
+                except InvalidToken:
+                    failed += 1
+            hashes = blind_indexes(hash_key, plain)
+            params.append([hashes[c] for c in BLIND_INDEX_COLUMNS] + [row[0]])
+        conn.executemany(update, params)
+        conn.commit()
+        updated += len(rows)
+        last_id = rows[-1][0]
+        progress(f"blind indexes: {updated:,} orders")
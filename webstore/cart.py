@@ -0,0 +1,135 @@
+import json
+
+from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+
+from . import stock_holds
+from .catalogue import get_catalogue
+from .db import get_db
+from .repos import CartRepo, ProductRepo
+
+bp = Blueprint("cart", __name__)
+
+
+# Cart persistence helpers
+def load_customer_cart(customer_id):
+    data = CartRepo(get_db()).load(customer_id)
+    if not data:
+        return {}
+    try:
+        return json.loads(data)
+    except Exception:
+        return {}
+
+def save_customer_cart(customer_id, cart_dict):
+    db = get_db()
+    CartRepo(db).save(customer_id, json.dumps(cart_dict or {}))
+    db.commit()
+
+def merge_carts(session_cart, stored_cart):
+    """Merge two cart dicts {sku: qty} — session wins for additive quantities."""
+    out = dict(stored_cart or {})
+    for sku, qty in (session_cart or {}).items():
+        try:
+            q = int(qty)
+        except Exception:
+            q = 0
+        if q <= 0:
+            continue
+        out[sku] = out.get(sku, 0) + q
+    return out
+
+def save_cart_if_logged_in():
+    """Call after mutating session['cart'] to persist for logged-in customers."""
+    cust_id = session.get("customer_id")
+    if cust_id:
+        save_customer_cart(cust_id, session.get("cart", {}) or {})
+
+# -- Cart helpers ------------------------------------------------
+def _cart_get():
+    return session.setdefault("cart", {})  # { sku: qty }
+
+def _cart_set(cart):
+    session["cart"] = cart
+    session.modified = True
+
+# -- Add to cart -------------------------------------------------
+@bp.route("/cart/add", methods=["POST"])
+def cart_add():
+    sku = (request.form.get("sku") or "").strip().upper()
+    try:
+        qty = int(request.form.get("qty") or 1)
+    except ValueError:
+        qty = 1
+    if qty < 1:
+        qty = 1
+
+    db = get_db()
+    prod = ProductRepo(db).get_by_sku(sku)
+    if not prod:
+        flash("Product not found.", "danger")
+        return redirect(request.referrer or url_for("shop.products"))
+
+    # reserve the units: never more than stock not already held by other carts
+    cart = _cart_get()
+    current = cart.get(sku, 0)
+    desired = current + qty
+    granted = stock_holds.hold(db, stock_holds.holder_id(), {prod["id"]: desired})[prod["id"]]
+    if granted < desired:
+        flash(f"Only {granted} units available for {sku}.", "warning")
+    if granted:
+        cart[sku] = granted
+    else:
+        cart.pop(sku, None)
+    _cart_set(cart)
+    # persist for logged-in customers
+    save_cart_if_logged_in()
+    if granted:
+        flash("Added to cart.", "success")
+    return redirect(request.referrer or url_for("shop.products"))
+
+@bp.route("/cart")
+def cart_view():
+    """Render customer's cart (used by navbar link)."""
+    cart = session.get("cart", {}) or {}
+    items = []
+    total = 0.0
+    if cart:
+        pricing = get_catalogue().price_cart(cart)
+        items, total = pricing.lines, pricing.total
+
+    return render_template("cart.html", items=items, total=total)
+
+@bp.route("/cart/remove", methods=["POST"])
+def cart_remove():
+    """Remove an SKU from the session cart (template calls url_for('cart.cart_remove'))."""
+    sku = (request.form.get("sku") or "").strip().upper()
+    if not sku:
+        return redirect(request.referrer or url_for("cart.cart_view"))
+
+    cart = _cart_get()
+    if sku in cart:
+        cart.pop(sku, None)
+        _cart_set(cart)
+        # give the held units back straight away rather than at expiry
+        holder = session.get(stock_holds.HOLDER_SESSION_KEY)
+        product_id = ProductRepo(get_db()).id_by_sku(sku) if holder else None
+        if product_id is not None:
+            stock_holds.release(get_db(), holder, product_id)
+        # persist change if customer is logged in
+        try:
+            save_cart_if_logged_in()
+        except Exception:
+            # silent fail-safe if persistence helpers removed/absent
+            pass
+        flash("Removed from cart.", "success")
+    return redirect(request.referrer or url_for("cart.cart_view"))
+
+# inject cart count into all templates
+@bp.app_context_processor
+def inject_cart_count():
+    cart = session.get("cart", {}) if session is not None else {}
+    try:
+        count = sum(int(v) for v in cart.values()) if cart else 0
+    except Exception:
+        count = 0
+    return {"cart_count": count}
@@ -0,0 +1,224 @@
+"""Immutable, array-backed catalogue snapshot for pricing carts without per-request row dicts.
+
+A CatalogueSnapshot holds the whole products table as a SKU -> position dict plus
+parallel `array` columns (id, price, stock: 24 bytes per SKU, no per-value objects)
+and tuples (sku, name, image), about half the memory of a dict per row (see
+benchmarks/catalogue_snapshot.py). It is never mutated, so request threads share it
+without locking, and a snapshot built before the server forks (preload) stays in
+pages shared by all workers: the arrays carry no per-element reference counts for
+the workers to write to.
+
+Freshness: price/name/SKU/image changes (admin edits, imports) bump
+catalogue_version through triggers (db.CATALOGUE_VERSION_SCHEMA), and each request
+compares that one-row counter with the snapshot's version. Stock changes with every
+order, so it is only refreshed when the snapshot is older than
+CATALOGUE_SNAPSHOT_MAX_AGE; it is for display and early warnings. Checkout's stock
+holds and its in-transaction check (stock_holds.py) stay authoritative.
+
+price_cart() prices and validates a whole cart at once (map/zip over the arrays,
+not a Python loop of dict lookups), for cart_view, the async cart and checkout.
+
+Each snapshot also carries the /products page layout (ProductsLayout): which SKUs
+take the fixed slots and how the rest are split into rows, worked out once per
+snapshot instead of by a loop in templates/products.html on every request.
+"""
+import threading
+import time
+from array import array
+from math import fsum
+from operator import mul
+
+from flask import current_app
+
+from .metrics import METRICS
+
+CATALOGUE_VERSION_SQL = "SELECT version FROM catalogue_version WHERE id = 1"
+CATALOGUE_SNAPSHOT_SQL = "SELECT id, sku, name, price, image, stock FROM products ORDER BY id"
+
+# /products layout: SKUs (lower case) with fixed slots, a top row and full-width cards;
+# every other product follows, LAYOUT_ROW_SIZE to a row, in catalogue order
+LAYOUT_TOP_ROW = ("f35", "fa18", "growler")
+LAYOUT_WIDE = ("b2", "ac130")
+LAYOUT_ROW_SIZE = 3
+
+_build_lock = threading.Lock()
+
+
+def _qty(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class ProductView:
+    """Read-only view of one snapshot row (no per-product dict is ever built)."""
+
+    __slots__ = ("_snapshot", "_i")
+
+    def __init__(self, snapshot, i):
+        self._snapshot = snapshot
+        self._i = i
+
+    id = property(lambda self: self._snapshot.ids[self._i])
+    sku = property(lambda self: self._snapshot.skus[self._i])
+    name = property(lambda self: self._snapshot.names[self._i])
+    price = property(lambda self: self._snapshot.prices[self._i])
+    stock = property(lambda self: self._snapshot.stock[self._i])
+    image = property(lambda self: self._snapshot.images[self._i])
+
+
+class CartLine:
+    """One priced cart line; supports it.name and it["name"] (templates, checkout, mailer)."""
+
+    __slots__ = ("id", "sku", "name", "price", "qty", "stock", "subtotal", "image")
+
+    def __init__(self, id, sku, name, price, qty, stock, subtotal, image):
+        self.id, self.sku, self.name, self.price = id, sku, name, price
+        self.qty, self.stock, self.subtotal, self.image = qty, stock, subtotal, image
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class CartPricing:
+    """Result of CatalogueSnapshot.price_cart: lines (cart order), total, unknown SKUs, and the qty array."""
+
+    __slots__ = ("lines", "total", "missing", "qtys")
+
+    def __init__(self, lines, total, missing, qtys):
+        self.lines, self.total, self.missing, self.qtys = lines, total, missing, qtys
+
+    def short(self, available=None):
+        """
+        Lines asking for more than is available: `available` is {product_id: units}
+        (e.g. granted stock holds); by default the snapshot's stock.
+        """
+        if available is None:
+            stock = [line.stock for line in self.lines]
+        else:
+            stock = list(map(available.get, (line.id for line in self.lines), [0] * len(self.lines)))
+        return [line for line, qty, have in zip(self.lines, self.qtys, stock) if qty > (have or 0)]
+
+
+class ProductsLayout:
+    """Slots on the products page by SKU: top (3, None where a SKU is absent), wide, and rows of the rest."""
+
+    __slots__ = ("top", "wide", "rows")
+
+    def __init__(self, skus):
+        by_key = {}
+        for sku in skus:
+            by_key[sku.lower()] = sku
+        fixed = set(LAYOUT_TOP_ROW + LAYOUT_WIDE)
+        others = [sku for sku in skus if sku.lower() not in fixed]
+        self.top = tuple(map(by_key.get, LAYOUT_TOP_ROW))
+        self.wide = tuple(by_key[key] for key in LAYOUT_WIDE if key in by_key)
+        self.rows = tuple(tuple(others[i:i + LAYOUT_ROW_SIZE]) for i in range(0, len(others), LAYOUT_ROW_SIZE))
+
+    def arrange(self, products):
+        """
+        Place product rows (with a "sku" key) into the layout for templates/products.html:
+        {"top": [row or None], "wide": [rows], "rows": [[rows]]}. Rows the layout doesn't
+        know (new since the snapshot, read from the
+        stale read copy, see db.get_read_db) are left out.
+        """
+        by_sku = {p["sku"]: p for p in products}
+        return {
+            "top": [by_sku.get(sku) if sku else None for sku in self.top],
+            "wide": [by_sku[sku] for sku in self.wide if sku in by_sku],
+            "rows": [row for row in ([by_sku[sku] for sku in skus if sku in by_sku] for skus in self.rows) if row],
+        }
+
+
+class CatalogueSnapshot:
+    __slots__ = ("version", "built_at", "index", "ids", "skus", "names", "prices", "stock", "images", "layout")
+
+    def __init__(self, version, rows):
+        ids, skus, names, prices, images, stock = [], [], [], [], [], []
+        for r in rows:
+            ids.append(r[0])
+            skus.append(r[1])
+            names.append(r[2])
+            prices.append(r[3] or 0.0)
+            images.append(r[4])
+            stock.append(r[5] or 0)
+        self.version = version
+        self.built_at = time.monotonic()
+        self.ids = array("q", ids)
+        self.skus = tuple(skus)
+        self.names = tuple(names)
+        self.prices = array("d", prices)
+        self.images = tuple(images)
+        self.stock = array("q", stock)
+        self.index = {sku: i for i, sku in enumerate(self.skus)}
+        self.layout = ProductsLayout(self.skus)
+
+    @classmethod
+    def load(cls, conn):
+        with METRICS.timer("webstore_catalogue_build_seconds"):
+            version = read_version(conn)
+            return cls(version, conn.execute(CATALOGUE_SNAPSHOT_SQL))
+
+    def __len__(self):
+        return len(self.skus)
+
+    def get(self, sku):
+        i = self.index.get(sku)
+        return None if i is None else ProductView(self, i)
+
+    def price_cart(self, cart):
+        """Price a session cart {sku: qty}; SKUs no longer in the catalogue are listed in .missing."""
+        skus = list(cart)
+        positions = list(map(self.index.get, skus))
+        missing = [sku for sku, i in zip(skus, positions) if i is None]
+        if missing:
+            skus = [sku for sku, i in zip(skus, positions) if i is not None]
+            positions = [i for i in positions if i is not None]
+        qtys = array("q", map(_qty, map(cart.__getitem__, skus)))
+        prices = array("d", map(self.prices.__getitem__, positions))
+        subtotals = list(map(mul, prices, qtys))
+        lines = list(map(CartLine, map(self.ids.__getitem__, positions), skus,
+                         map(self.names.__getitem__, positions), prices, qtys,
+                         map(self.stock.__getitem__, positions), subtotals,
+                         map(self.images.__getitem__, positions)))
+        return CartPricing(lines, fsum(subtotals), missing, qtys)
+
+
+def read_version(conn):
+    row = conn.execute(CATALOGUE_VERSION_SQL).fetchone()
+    return row[0] if row else 0
+
+
+def current(app, conn):
+    """
+    The app's snapshot, rebuilt from `conn` when the catalogue version moved on or it is
+    older than CATALOGUE_SNAPSHOT_MAX_AGE. One thread rebuilds; the others wait for it.
+    """
+    state = app.extensions["webstore"]
+    snapshot = state.get("catalogue")
+    max_age = app.config["CATALOGUE_SNAPSHOT_MAX_AGE"]
+    if (snapshot is not None and snapshot.version == read_version(conn)
+            and time.monotonic() - snapshot.built_at <= max_age):
+        return snapshot
+    with _build_lock:
+        latest = state.get("catalogue")
+        if latest is not snapshot and latest is not None:
+            return latest  # another thread rebuilt it while we waited
+        state["catalogue"] = snapshot = CatalogueSnapshot.load(conn)
+    return snapshot
+
+
+def get_catalogue():
+    """Current snapshot for this request (reads the version from the primary, see db.get_read_db)."""
+    from .db import get_read_db
+    return current(current_app, get_read_db())
+
+
+def preload(app):
+    """Build the snapshot now, e.g. in a pre-fork server before starting workers."""
+    with app.app_context():
+        return get_catalogue()
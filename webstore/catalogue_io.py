@@ -0,0 +1,168 @@
+"""Bulk product import/export as CSV or JSON Lines.
+
+Shared by the admin endpoints and scripts/catalogue.py. Both directions stream:
+imports are parsed and upserted in batches (one transaction each), exports are
+generators over a fetchmany cursor, so neither holds the catalogue in memory.
+"""
+import csv
+import io
+import json
+import re
+from datetime import datetime
+
+from .repos import PRODUCT_EXPORT_COLUMNS, ProductRepo
+from .storage import database_errors
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+IMPORT_BATCH_SIZE = 1000
+# errors beyond this are only counted, so a bad 100k-row file can't blow up the response
+MAX_REPORTED_ERRORS = 200
+
+
+def make_sku_candidate(name):
+    cand = re.sub(r'[^A-Za-z0-9]+', '-', (name or '').strip()).strip('-').upper()
+    if not cand:
+        cand = 'SKU'
+    return cand[:30]
+
+
+def detect_format(filename, default="csv"):
+    ext = (filename or "").rsplit(".", 1)[-1].lower()
+    if ext in ("jsonl", "ndjson", "json"):
+        return "jsonl"
+    return "csv" if ext == "csv" else default
+
+
+def iter_records(stream, fmt):
+    """Yield (line_no, dict) per record, or (line_no, ValueError) for unparseable lines."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for rec in reader:
+            yield reader.line_num, rec
+        return
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"invalid JSON: {e}")
+            continue
+        yield line_no, rec if isinstance(rec, dict) else ValueError("expected a JSON object")
+
+
+def _clean(rec):
+    """Validate one record into a product dict; raises ValueError with a user-facing message."""
+    name = str(rec.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is required")
+    price_raw = str(rec.get("price") if rec.get("price") is not None else "").replace(",", "").strip()
+    try:
+        price = float(price_raw) if price_raw != "" else 0.0
+    except ValueError:
+        raise ValueError(f"invalid price {price_raw!r}")
+    stock_raw = str(rec.get("stock") if rec.get("stock") is not None else "").strip()
+    try:
+        stock = int(stock_raw) if stock_raw != "" else 0
+    except ValueError:
+        raise ValueError(f"invalid stock {stock_raw!r}")
+    if price < 0 or stock < 0:
+        raise ValueError("price and stock must not be negative")
+    return {
+        "sku": str(rec.get("sku") or "").strip().upper(),
+        "name": name,
+        "description": str(rec.get("description") or "").strip(),
+        "price": price,
+        "image": str(rec.get("image") or "").strip() or None,
+        "stock": stock,
+    }
+
+
+def _flush(db, repo, batch, result):
+    # rows without a SKU get one derived from their name, resolved set-wise against the
+    # table and the rest of the batch (explicit SKUs are upsert keys and are kept as given)
+    unnamed = [p for _, p in batch if not p["sku"]]
+    if unnamed:
+        explicit = {p["sku"] for _, p in batch if p["sku"]}
+        skus = repo.unique_skus([make_sku_candidate(p["name"]) for p in unnamed], reserved=explicit)
+        for p, sku in zip(unnamed, skus):
+            p["sku"] = sku
+    now = datetime.utcnow().isoformat()
+    rows = [(p["sku"], p["name"], p["description"], p["price"], p["image"], p["stock"], now) for _, p in batch]
+    try:
+        repo.upsert_many(rows)
+        db.commit()
+        result["imported"] += len(rows)
+    except database_errors():
+        db.rollback()
+        # retry row by row so one bad row doesn't lose the rest of its batch (each row in a
+        # savepoint: on PostgreSQL a failed statement would otherwise abort the whole transaction)
+        for (line_no, _), row in zip(batch, rows):
+            db.execute("SAVEPOINT import_row")
+            try:
+                repo.upsert(row)
+                result["imported"] += 1
+            except database_errors() as e:
+                db.execute("ROLLBACK TO SAVEPOINT import_row")
+                _add_error(result, line_no, str(e))
+            db.execute("RELEASE SAVEPOINT import_row")
+        db.commit()
+
+
+def _add_error(result, line_no, message):
+    result["error_count"] += 1
+    if len(result["errors"]) < MAX_REPORTED_ERRORS:
+        result["errors"].append({"line": line_no, "error": message})
+
+
+def import_products(db, stream, fmt, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Upsert products from a text stream (CSV with a header row, or JSON Lines).
+
+    Records are keyed by `sku`; records without one become new products with a
+    SKU generated from the name. Invalid records are reported, not fatal.
+    Returns {"rows", "imported", "error_count", "errors": [{"line", "error"}]}.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format {fmt!r}")
+    repo = ProductRepo(db)
+    result = {"rows": 0, "imported": 0, "error_count": 0, "errors": []}
+    batch = []
+    for line_no, rec in iter_records(stream, fmt):
+        result["rows"] += 1
+        try:
+            if isinstance(rec, Exception):
+                raise rec
+            batch.append((line_no, _clean(rec)))
+        except ValueError as e:
+            _add_error(result, line_no, str(e))
+        if len(batch) >= batch_size:
+            _flush(db, repo, batch, result)
+            batch = []
+    if batch:
+        _flush(db, repo, batch, result)
+    return result
+
+
+def export_products(db, fmt, chunk_rows=500):
+    """Yield the catalogue as CSV or JSON Lines text, chunk_rows records per chunk."""
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format {fmt!r}")
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer:
+        writer.writerow(PRODUCT_EXPORT_COLUMNS)
+    n = 0
+    for row in ProductRepo(db).iter_export():
+        if writer:
+            writer.writerow(tuple(row))
+        else:
+            buf.write(json.dumps(dict(zip(PRODUCT_EXPORT_COLUMNS, row))) + "\n")
+        n += 1
+        if n % chunk_rows == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
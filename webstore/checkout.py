@@ -0,0 +1,348 @@
+import os
+import random
+import secrets
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, session, url_for
+from werkzeug.utils import secure_filename
+
+from . import order_feed, order_views, stock_holds, upload_previews
+from .account import load_customer_order
+from .analytics import record_order
+from .blind_index import blind_indexes
+from .catalogue import get_catalogue
+from .cart import save_cart_if_logged_in, save_customer_cart
+from .crypto import agency_hash, encrypt_field, get_fernet, get_index_key
+from .db import get_db, get_read_db
+from .repos import CheckoutRequestRepo, CustomerRepo, OrderRepo, ProductRepo, StockHoldRepo
+
+bp = Blueprint("checkout", __name__)
+
+# Example simple domain whitelist check (server-side)
+ALLOWED_GOV_DOMAINS = (".gov", ".gov.au", ".mil")
+def is_official_email(email: str) -> bool:
+    email = (email or "").strip().lower()
+    return any(email.endswith(d) for d in ALLOWED_GOV_DOMAINS)
+
+# file validation for private uploads
+ALLOWED_DOC_EXT = {".pdf", ".png", ".jpg", ".jpeg"}
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024  # 5 MB
+
+def _save_file_private_valid(field_name):
+    """Validate and save an uploaded document to PRIVATE_UPLOADS (not served by static)."""
+    f = request.files.get(field_name)
+    if f and f.filename:
+        filename = secure_filename(f.filename)
+        ext = Path(filename).suffix.lower()
+        if ext not in ALLOWED_DOC_EXT:
+            raise ValueError(f"Invalid file type for {field_name}.")
+        f.stream.seek(0, os.SEEK_END)
+        size = f.stream.tell()
+        f.stream.seek(0)
+        if size > MAX_UPLOAD_BYTES:
+            raise ValueError(f"File too large for {field_name}.")
+        uploads = Path(current_app.config["PRIVATE_UPLOADS"])
+        uploads.mkdir(parents=True, exist_ok=True)
+        dest_name = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{filename}"
+        dest = uploads / dest_name
+        f.save(str(dest))
+        return dest.name
+    return None
+
+# ---------- Submission keys (duplicate POST protection) ----------
+# The checkout GET renders a fresh key into the form; a POST first claims (customer, key)
+# in checkout_requests. A double-click, browser retry or proxy replay of the same form
+# then loses the claim and is answered with the original order_success redirect instead
+# of placing (and uploading, encrypting, emailing) the order again. A duplicate never waits
+# for the original on the request thread: while it is still running, the duplicate is sent
+# to submission_status, a page that refreshes itself until the order is placed or not.
+IDEMPOTENCY_FIELD = "idempotency_key"
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 128
+STATUS_REFRESH_SECONDS = 1
+PRUNE_PROBABILITY = 0.01
+
+
+def _submission_key():
+    key = (request.form.get(IDEMPOTENCY_FIELD) or request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+    return key if 0 < len(key) <= MAX_KEY_LENGTH else None
+
+
+def _replay(order_id):
+    # the original response cleared the cart, but the browser may keep this response's cookie
+    session.pop("cart", None)
+    flash("Order placed. Thank you!", "success")
+    return redirect(url_for("checkout.order_success", order_id=order_id))
+
+
+def _stale_before():
+    timeout = current_app.config["CHECKOUT_CLAIM_TIMEOUT_SECONDS"]
+    return (datetime.utcnow() - timedelta(seconds=timeout)).isoformat()
+
+
+def _claim_submission(db, customer_id, key):
+    """
+    Claim `key` for this request. Returns None when this request should place the order,
+    otherwise the response for a duplicate, right away: the original order once it has
+    committed, else a redirect to the submission's status page.
+    """
+    cfg = current_app.config
+    requests = CheckoutRequestRepo(db)
+    # twice: the original may fail and release the key between our claim and our read
+    for _ in range(2):
+        now = datetime.utcnow()
+        claimed = requests.claim(customer_id, key, now.isoformat(), _stale_before())
+        if claimed and random.random() < PRUNE_PROBABILITY:
+            requests.prune((now - timedelta(hours=cfg["CHECKOUT_KEY_RETENTION_HOURS"])).isoformat())
+        db.commit()
+        if claimed:
+            return None
+        row = requests.get(customer_id, key)
+        if row is not None and row["order_id"] is not None:
+            return _replay(row["order_id"])
+        if row is not None:
+            break
+    return redirect(url_for("checkout.submission_status", key=key))
+
+
+@bp.route("/checkout/submitted/<key>")
+def submission_status(key):
+    """Where a duplicate submission waits (in the browser) for the original to finish."""
+    customer_id = session.get("customer_id")
+    if not customer_id:
+        return redirect(url_for("shop.login"))
+    row = CheckoutRequestRepo(get_read_db()).get(customer_id, key)
+    if row is not None and row["order_id"] is not None:
+        return _replay(row["order_id"])
+    # released (the original failed) or abandoned (its worker died): nothing was placed
+    if row is None or row["created_at"] < _stale_before():
+        flash("Your order was not placed. Please review your cart and submit it again.", "warning")
+        return redirect(url_for("cart.cart_view"))
+    return render_template("checkout_pending.html", refresh=STATUS_REFRESH_SECONDS)
+
+
+# ---------- Checkout route (government) ----------
+@bp.route("/checkout", methods=["GET", "POST"])
+def checkout():
+    # require customer login
+    if not session.get("customer_id"):
+        flash("You must be logged in as a customer to checkout.", "warning")
+        return redirect(url_for("shop.login", next=url_for("checkout.checkout")))
+
+    if request.method == "GET":
+        return _checkout(None)
+
+    # POST: deduplicate before any work (uploads, encryption, stock) is done
+    key = _submission_key()
+    if key is None:
+        flash("Your checkout form has expired. Please review your order and submit it again.", "warning")
+        return redirect(url_for("checkout.checkout"))
+    db = get_db()
+    customer_id = session["customer_id"]
+    duplicate = _claim_submission(db, customer_id, key)
+    if duplicate is not None:
+        return duplicate
+    try:
+        return _checkout(key)
+    finally:
+        # frees the key for a resubmission if the order was not placed; no-op once it was
+        CheckoutRequestRepo(db).release(customer_id, key)
+        db.commit()
+
+
+def _checkout(key):
+    cart = session.get("cart", {}) or {}
+    if not cart:
+        flash("Your cart is empty.", "warning")
+        return redirect(url_for("shop.products"))
+
+    db = get_db()
+    products_repo = ProductRepo(db)
+    customers = CustomerRepo(db)
+    orders = OrderRepo(db)
+    pricing = get_catalogue().price_cart(cart)
+    for sku in pricing.missing:
+        flash(f"Product {sku} not found, removed from cart.", "warning")
+    items, total = pricing.lines, pricing.total
+
+    # re-take this cart's stock holds (with a fresh expiry) before any upload or encryption work,
+    # so a shortage is reported now rather than after the expensive part of the order
+    holder = stock_holds.holder_id()
+    granted = stock_holds.hold(db, holder, {it.id: it.qty for it in items})
+    short = pricing.short(granted)
+    if short:
+        for it in short:
+            left = granted.get(it.id, 0)
+            flash(f"Only {left} units of {it.name} are still available; your cart was updated.", "warning")
+            if left:
+                cart[it.sku] = left
+            else:
+                cart.pop(it.sku, None)
+        session["cart"] = cart
+        save_cart_if_logged_in()
+        return redirect(url_for("cart.cart_view"))
+
+    if request.method == "GET":
+        return render_template("checkout.html", items=items, total=total,
+                               idempotency_key=secrets.token_urlsafe(24))
+
+    # POST: collect gov fields and files
+    agency = (request.form.get("agency") or "").strip()
+    authorized_officer = (request.form.get("authorized_officer") or "").strip()
+    official_email = (request.form.get("official_email") or "").strip()
+    position_clearance = (request.form.get("position_clearance") or "").strip()
+    contact_number = (request.form.get("contact_number") or "").strip()
+
+    po_number = (request.form.get("po_number") or "").strip()
+    contract_reference = (request.form.get("contract_reference") or "").strip()
+    funding_source = (request.form.get("funding_source") or "").strip()
+
+    vendor_id = (request.form.get("vendor_id") or "").strip()
+    export_license_status = (request.form.get("export_license_status") or "").strip()
+    delivery_location = (request.form.get("delivery_location") or "").strip()
+    required_delivery_date = (request.form.get("required_delivery_date") or "").strip()
+    payment_method = (request.form.get("payment_method") or "").strip()
+
+    declaration = request.form.get("declaration") == "on"
+
+    if not official_email:
+        flash("Official email is required.", "danger")
+        return redirect(url_for("checkout.checkout"))
+    if not declaration:
+        flash("You must confirm you are an authorized government representative.", "danger")
+        return redirect(url_for("checkout.checkout"))
+    if not is_official_email(official_email):
+        flash("Official government email required (e.g. name@domain.gov).", "danger")
+        return redirect(url_for("checkout.checkout"))
+
+    try:
+        auth_doc_name = _save_file_private_valid("auth_doc")
+        digital_sig_name = _save_file_private_valid("digital_signature")
+    except ValueError as ve:
+        flash(str(ve), "danger")
+        return redirect(url_for("checkout.checkout"))
+
+    if not auth_doc_name:
+        flash("Authorization document is required.", "danger")
+        return redirect(url_for("checkout.checkout"))
+
+    auth_doc_path = auth_doc_name
+    end_user_cert_path = None
+    digital_sig_path = digital_sig_name
+
+    # prevent saving orders without encryption key (avoids NULLs)
+    if get_fernet() is None:
+        flash("Server encryption key (DATA_ENC_KEY) not configured — cannot place order. Contact admin.", "danger")
+        return redirect(url_for("checkout.checkout"))
+
+    # encrypt the sensitive fields (official_email left plaintext so emails still work)
+    agency_enc = encrypt_field(agency)
+    authorized_officer_enc = encrypt_field(authorized_officer)
+    position_clearance_enc = encrypt_field(position_clearance)
+    contact_number_enc = encrypt_field(contact_number)
+    po_number_enc = encrypt_field(po_number)
+    contract_reference_enc = encrypt_field(contract_reference)
+    funding_source_enc = encrypt_field(funding_source)
+    delivery_location_enc = encrypt_field(delivery_location)
+    payment_method_enc = encrypt_field(payment_method)
+    # keyed hashes for admin search (blind_index.py); the plaintext itself is never stored
+    search_hashes = blind_indexes(get_index_key(), {
+        "po_number": po_number, "contract_reference": contract_reference, "agency": agency,
+        "authorized_officer": authorized_officer, "contact_number": contact_number,
+    })
+
+    try:
+        # IMMEDIATE: take the write lock before reading stock, so the check and the decrement agree
+        # (on PostgreSQL available_now row-locks the products instead)
+        db.execute("BEGIN IMMEDIATE")
+        # Re-check stock availability inside transaction (our holds cover it unless they expired)
+        available = stock_holds.available_now(db, holder, [it.id for it in items])
+        for it in items:
+            if available.get(it.id, 0) < it.qty:
+                raise ValueError(f"Insufficient stock for {it.name}")
+
+        # the order belongs to the logged-in account that placed it (its order history,
+        # order_success); the officer and official email are recorded on the order itself
+        customer_id = session["customer_id"]
+
+        # prepare order insert with government fields
+        created_at = datetime.utcnow().isoformat()
+
+        order = {
+            "customer_id": customer_id, "total": total, "status": "placed", "created_at": created_at,
+            "agency": agency_enc, "authorized_officer": authorized_officer_enc, "official_email": official_email,
+            "position_clearance": position_clearance_enc, "contact_number": contact_number_enc,
+            "po_number": po_number_enc, "contract_reference": contract_reference_enc, "funding_source": funding_source_enc,
+            "auth_doc": auth_doc_path, "vendor_id": vendor_id, "end_user_cert": end_user_cert_path,
+            "export_license_status": export_license_status,
+            "delivery_location": delivery_location_enc, "required_delivery_date": required_delivery_date,
+            "payment_method": payment_method_enc,
+            "declaration_agreed": int(declaration), "digital_signature": digital_sig_path,
+            **search_hashes,
+        }
+        order_id = orders.insert(order)
+
+        # insert items and decrement stock
+        for it in items:
+            orders.add_item(order_id, it.id, it.qty, it.price, it.sku, it.name)
+            if not products_repo.decrement_stock(it.id, it.qty):
+                raise ValueError(f"Insufficient stock for {it.name}")
+        # the holds are now decrements
+        StockHoldRepo(db).delete_holder(holder)
+        # the order page's read model, from the values just inserted (no re-read, no decrypts)
+        customer = customers.by_id(customer_id)
+        order_views.record(
+            db, {**order, "id": order_id, "customer_name": customer["name"] if customer else None,
+                 "customer_email": customer["email"] if customer else None},
+            [{"product_id": it.id, "sku": it.sku, "name": it.name, "quantity": it.qty, "unit_price": it.price}
+             for it in items],
+            {"agency": agency, "authorized_officer": authorized_officer, "position_clearance": position_clearance,
+             "contact_number": contact_number, "po_number": po_number, "contract_reference": contract_reference,
+             "funding_source": funding_source, "delivery_location": delivery_location,
+             "payment_method": payment_method},
+            get_fernet())
+        record_order(db, created_at, "placed", total, agency_hash(agency),
+                     [(it.id, it.qty, it.subtotal) for it in items])
+        order_feed.record_event(db, order_id, "order", "placed")
+        CheckoutRequestRepo(db).complete(session["customer_id"], key, order_id)
+
+        db.commit()
+        order_feed.notify()
+        # page count / metadata / preview for the admin review page, off the request thread
+        upload_previews.enqueue(current_app, [auth_doc_path, end_user_cert_path, digital_sig_path])
+        # clear session cart and persisted cart
+        session.pop("cart", None)
+        if session.get("customer_id"):
+            save_customer_cart(session["customer_id"], {})
+
+        # send confirmation email (try official_email first, then logged-in customer email)
+        recipient = official_email or None
+        recipient_name = authorized_officer or session.get("customer_name")
+        if not recipient and customer:
+            recipient = customer["email"]
+            recipient_name = customer["name"]
+
+        if recipient:
+            try:
+                from .mailer import send_order_confirmation_email
+                send_order_confirmation_email(recipient, recipient_name, order_id, items, total)
+            except Exception:
+                # swallow email exceptions so checkout flow is not blocked
+                current_app.logger.exception("Unexpected error sending confirmation email")
+
+        flash("Order placed. Thank you!", "success")
+        return redirect(url_for("checkout.order_success", order_id=order_id))
+    except Exception as e:
+        db.rollback()
+        flash(str(e), "danger")
+        return redirect(url_for("cart.cart_view"))
+
+# -- Order success page -----------------------------------------
+@bp.route("/order/success/<int:order_id>")
+def order_success(order_id):
+    # only the customer who placed the order may see it (404 otherwise, like a missing order)
+    order, items = load_customer_order(get_read_db(), session.get("customer_id"), order_id)
+    if order is None:
+        abort(404)
+    return render_template("order_success.html", order=order, items=items)
@@ -0,0 +1,104 @@
+"""Fernet helpers for the encrypted government order fields, plus keyed hashes of them
+(under a separate key, see index_key).
+
+`cryptography` is imported on first use so that workers which never touch
+order data (catalogue pages, tests) don't pay for it at startup.
+"""
+import hashlib
+import hmac
+
+from flask import current_app
+
+from .metrics import METRICS
+
+# HKDF info label for the keyed-hash key derived from DATA_ENC_KEY (see index_key)
+BLIND_INDEX_INFO = b"webstore blind-index"
+
+# order columns stored as Fernet tokens (official_email stays plaintext so emails still work)
+ENCRYPTED_ORDER_FIELDS = [
+    "agency",
+    "authorized_officer",
+    "position_clearance",
+    "contact_number",
+    "po_number",
+    "contract_reference",
+    "funding_source",
+    "delivery_location",
+    "payment_method",
+]
+
+
+def make_fernet(key):
+    """Return a Fernet for `key` (str) or None when no key is configured."""
+    if not key:
+        return None
+    from cryptography.fernet import Fernet
+    return Fernet(key.encode())
+
+
+def get_fernet():
+    """Return the app's Fernet instance, building it on first use (None if DATA_ENC_KEY unset)."""
+    state = current_app.extensions["webstore"]
+    if "fernet" not in state:
+        state["fernet"] = make_fernet(current_app.config.get("DATA_ENC_KEY"))
+    return state["fernet"]
+
+
+def encrypt_field(plaintext):
+    """Return Fernet token (str) or None if not available/empty."""
+    fernet = get_fernet()
+    if not plaintext or fernet is None:
+        return None
+    with METRICS.timer("webstore_fernet_seconds", op="encrypt"):
+        return fernet.encrypt(str(plaintext).encode()).decode()
+
+
+def decrypt_field(token):
+    """Return decrypted plaintext (str) or None on failure."""
+    fernet = get_fernet()
+    if not token or fernet is None:
+        return None
+    with METRICS.timer("webstore_fernet_seconds", op="decrypt"):
+        return fernet.decrypt(token.encode()).decode()
+
+
+def index_key(data_key, blind_index_key=None):
+    """
+    The key (bytes) for keyed_hash: BLIND_INDEX_KEY when configured, otherwise derived from
+    DATA_ENC_KEY with HKDF under a "blind-index" label, so the Fernet key is never used as an
+    HMAC key directly. None when neither is set.
+    """
+    if blind_index_key:
+        return blind_index_key.encode()
+    if not data_key:
+        return None
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=BLIND_INDEX_INFO).derive(data_key.encode())
+
+
+def get_index_key():
+    """Return the app's keyed-hash key, deriving it on first use (None if no key is configured)."""
+    state = current_app.extensions["webstore"]
+    if "index_key" not in state:
+        state["index_key"] = index_key(current_app.config.get("DATA_ENC_KEY"),
+                                       current_app.config.get("BLIND_INDEX_KEY"))
+    return state["index_key"]
+
+
+def keyed_hash(key, label, value):
+    """
+    Deterministic HMAC-SHA256 (hex, 16 chars) of a normalised value, keyed by `key` (index_key()).
+    Fernet tokens differ on every encryption, so this is what lets encrypted fields be grouped
+    or matched without decrypting them; `label` keeps hashes of different fields apart.
+    """
+    normalised = " ".join(str(value or "").split()).casefold()
+    return hmac.new(key, f"{label}:{normalised}".encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def agency_hash(agency):
+    """keyed_hash of an agency name with the app's index key ('' when no key or no agency)."""
+    key = get_index_key()
+    if not key or not (agency or "").strip():
+        return ""
+    return keyed_hash(key, "agency", agency)
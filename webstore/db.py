@@ -0,0 +1,501 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from flask import current_app, g
+
+from .blind_index import BLIND_INDEX_COLUMNS
+from .storage import connect_sqlite_ro, get_storage
+
+# only one snapshot refresh per process at a time
+_snapshot_lock = threading.Lock()
+
+
+def get_db():
+    """Return the request's read-write connection (sqlite3.Connection, or storage.PgConnection
+    with DATABASE_URL set; rows readable by column name) stored in flask.g"""
+    if 'db' not in g:
+        ensure_schema_once()
+        conn = get_storage(current_app).connect()
+        _run_connection_hooks(conn)
+        g.db = conn
+    return g.db
+
+
+def _run_connection_hooks(conn):
+    """Let extensions (e.g. metrics) instrument each new request connection."""
+    for hook in current_app.extensions["webstore"].get("connection_hooks", ()):
+        hook(conn)
+
+
+def _connect_ro(path, cached_statements=128):
+    """Open a read-only connection (a stray write raises instead of taking the write lock)."""
+    return connect_sqlite_ro(path, cached_statements)
+
+
+def get_read_db(max_staleness=0):
+    """Return a read-only connection for queries that never write (catalogue, listings, reports).
+
+    max_staleness is how old (seconds) the data may be for this call site:
+      - 0 (default): read-only connection on the primary DB (always current)
+      - > 0: the snapshot copy at READ_SNAPSHOT_PATH if it is fresh enough; otherwise
+        the primary is used for this request and the snapshot is refreshed in the background.
+    On PostgreSQL there is no snapshot file: every read goes to the database (autocommit).
+    """
+    storage = get_storage(current_app)
+    if max_staleness and max_staleness > 0 and storage.dialect == "sqlite":
+        snapshot = current_app.config.get("READ_SNAPSHOT_PATH")
+        age = snapshot_age(snapshot) if snapshot else None
+        if age is not None and age <= max_staleness:
+            if 'read_snapshot_db' not in g:
+                g.read_snapshot_db = _connect_ro(snapshot, current_app.config["SQLITE_CACHED_STATEMENTS"])
+                _run_connection_hooks(g.read_snapshot_db)
+            return g.read_snapshot_db
+        if snapshot:
+            refresh_snapshot_async(current_app.config["DB_PATH"], snapshot)
+
+    if 'read_db' not in g:
+        ensure_schema_once()
+        g.read_db = storage.connect_read()
+        _run_connection_hooks(g.read_db)
+    return g.read_db
+
+
+def attach_archive(conn):
+    """ATTACH the order archive (ARCHIVE_DB_PATH) read-only as `archive`, once per connection.
+    Returns False when nothing has been archived yet, or on PostgreSQL (the archive is a SQLite
+    file). `conn` must be a URI connection (_connect_ro)."""
+    if getattr(conn, "dialect", "sqlite") != "sqlite":
+        return False
+    path = current_app.config.get("ARCHIVE_DB_PATH")
+    if not path or not os.path.exists(path):
+        return False
+    if not any(r[1] == "archive" for r in conn.execute("PRAGMA database_list")):
+        conn.execute("ATTACH DATABASE ? AS archive", (f"file:{Path(path).as_posix()}?mode=ro",))
+    return True
+
+
+def close_db(exc=None):
+    for key in ('db', 'read_db', 'read_snapshot_db'):
+        db = g.pop(key, None)
+        if db is not None:
+            db.close()
+
+
+def snapshot_age(snapshot_path):
+    """Seconds since the snapshot was last refreshed, or None if there is no snapshot."""
+    try:
+        return time.time() - os.path.getmtime(snapshot_path)
+    except OSError:
+        return None
+
+
+def refresh_snapshot(db_path, snapshot_path):
+    """Copy db_path to snapshot_path with the SQLite online backup API, then swap it in atomically."""
+    tmp_path = f"{snapshot_path}.tmp"
+    src = _connect_ro(db_path)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dst)
+        # snapshot readers open it read-only; keep it out of WAL so no -wal/-shm files are needed
+        dst.execute("PRAGMA journal_mode=DELETE;")
+    finally:
+        dst.close()
+        src.close()
+    os.replace(tmp_path, snapshot_path)
+
+
+def refresh_snapshot_async(db_path, snapshot_path):
+    """Start a background snapshot refresh unless one is already running."""
+    if not _snapshot_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            refresh_snapshot(db_path, snapshot_path)
+        except Exception:
+            current_logger.exception("Read snapshot refresh failed")
+        finally:
+            _snapshot_lock.release()
+
+    current_logger = current_app.logger
+    threading.Thread(target=run, name="read-snapshot-refresh", daemon=True).start()
+
+
+# columns added to the original orders table (government fields)
+ORDER_GOV_COLUMNS = {
+    "agency": "TEXT",
+    "authorized_officer": "TEXT",
+    "official_email": "TEXT",
+    "position_clearance": "TEXT",
+    "contact_number": "TEXT",
+    "po_number": "TEXT",
+    "contract_reference": "TEXT",
+    "funding_source": "TEXT",
+    "auth_doc": "TEXT",
+    "vendor_id": "TEXT",
+    "end_user_cert": "TEXT",
+    "export_license_status": "TEXT",
+    "delivery_location": "TEXT",
+    "required_delivery_date": "TEXT",
+    "payment_method": "TEXT",
+    "declaration_agreed": "INTEGER",
+    "digital_signature": "TEXT"
+}
+
+
+def _ensure_order_columns(conn):
+    """
+    Add government-specific columns to orders table if they don't exist.
+    Safe to run multiple times.
+    """
+    cur = conn.execute("PRAGMA table_info(orders)").fetchall()
+    cols = { r[1] for r in cur }
+    additions = dict(ORDER_GOV_COLUMNS)
+    # keyed hashes of the searchable encrypted fields (see blind_index.py)
+    additions.update({column: "TEXT" for column in BLIND_INDEX_COLUMNS})
+    for name, sqltype in additions.items():
+        if name not in cols:
+            conn.execute(f"ALTER TABLE orders ADD COLUMN {name} {sqltype};")
+    # partial: orders placed without a key (or without the field) take no index space
+    for column in BLIND_INDEX_COLUMNS:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_orders_{column} ON orders({column}) WHERE {column} IS NOT NULL;")
+
+
+# what each order line was when it was ordered (the order pages, export and archive show these,
+# not the product's current sku/name)
+ORDER_ITEM_SNAPSHOT_COLUMNS = {"sku": "TEXT", "product_name": "TEXT"}
+
+
+def _ensure_order_item_columns(conn):
+    """Add the order_items sku/product_name columns, filling existing lines from their products once."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(order_items)").fetchall()}
+    missing = [name for name in ORDER_ITEM_SNAPSHOT_COLUMNS if name not in cols]
+    for name in missing:
+        conn.execute(f"ALTER TABLE order_items ADD COLUMN {name} {ORDER_ITEM_SNAPSHOT_COLUMNS[name]};")
+    if missing:
+        # the best record there is for lines from before: the products as they are at upgrade time
+        conn.execute("UPDATE order_items SET sku = (SELECT p.sku FROM products p WHERE p.id = order_items.product_id), "
+                     "product_name = (SELECT p.name FROM products p WHERE p.id = order_items.product_id)")
+
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_product_daily (
+    day TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_status_daily (
+    day TEXT NOT NULL,
+    status TEXT NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_agency_daily (
+    day TEXT NOT NULL,
+    agency_hash TEXT NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, agency_hash)
+) WITHOUT ROWID;
+"""
+
+
+# append-only change log behind the admin live order feed (webstore/order_feed.py);
+# AUTOINCREMENT so ids are never reused after pruning (they are the SSE Last-Event-IDs)
+ORDER_EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+# one row per checkout submission key (webstore/checkout.py): the primary key makes
+# duplicate POSTs of the same form lose the race; order_id is set in the order's transaction
+CHECKOUT_REQUESTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkout_requests (
+    customer_id INTEGER NOT NULL,
+    idem_key TEXT NOT NULL,
+    order_id INTEGER,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (customer_id, idem_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_checkout_requests_created ON checkout_requests(created_at);
+"""
+
+
+# cart reservations (webstore/stock_holds.py): available stock = products.stock minus the
+# other holders' live holds, summed from the covering (product_id, expires_at, holder, qty) index
+STOCK_HOLDS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_holds (
+    holder TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    qty INTEGER NOT NULL,
+    expires_at TEXT NOT NULL,
+    PRIMARY KEY (holder, product_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_stock_holds_product ON stock_holds(product_id, expires_at, holder, qty);
+CREATE INDEX IF NOT EXISTS idx_stock_holds_expires ON stock_holds(expires_at);
+"""
+
+
+# bumped by every catalogue change except stock (see catalogue.py): one row, read per request
+CATALOGUE_VERSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalogue_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalogue_version (id, version) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS trg_products_version_insert AFTER INSERT ON products
+BEGIN UPDATE catalogue_version SET version = version + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS trg_products_version_delete AFTER DELETE ON products
+BEGIN UPDATE catalogue_version SET version = version + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS trg_products_version_update AFTER UPDATE OF sku, name, price, image ON products
+BEGIN UPDATE catalogue_version SET version = version + 1 WHERE id = 1; END;
+"""
+
+
+# denormalized order read model (webstore/order_views.py): one row per order, read by primary
+# key on the order pages; status columns are updated in place, the rest is written at checkout
+ORDER_VIEWS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_views (
+    order_id INTEGER PRIMARY KEY,
+    customer_id INTEGER,
+    status TEXT,
+    export_license_status TEXT,
+    summary TEXT NOT NULL,
+    sensitive TEXT,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+# page count / metadata / small preview image per checkout upload (webstore/upload_previews.py)
+UPLOAD_PREVIEWS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_previews (
+    filename TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    kind TEXT,
+    size INTEGER,
+    pages INTEGER,
+    width INTEGER,
+    height INTEGER,
+    meta TEXT,
+    preview BLOB,
+    preview_type TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+# the whole schema for the PostgreSQL backend (storage.PostgresStorage), run in one go on first
+# use: the same tables, columns and indexes as setup_db.py's SCHEMA plus ensure_schema(), with
+# identity ids (never reused, like order_events' AUTOINCREMENT), double precision for REAL, bytea
+# for BLOB and timestamps kept as ISO-8601 TEXT. SKUs compare bytewise (COLLATE "C") as in SQLite,
+# which the SKU collision range query relies on.
+_POSTGRES_BLIND_INDEXES = "\n".join(
+    f"CREATE INDEX IF NOT EXISTS idx_orders_{column} ON orders({column}) WHERE {column} IS NOT NULL;"
+    for column in BLIND_INDEX_COLUMNS
+)
+POSTGRES_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS products (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    sku TEXT COLLATE "C" UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT,
+    price DOUBLE PRECISION NOT NULL,
+    image TEXT,
+    stock INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS customers (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    phone TEXT,
+    address TEXT,
+    created_at TEXT NOT NULL,
+    password TEXT
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    customer_id BIGINT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+    total DOUBLE PRECISION NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    {", ".join(f"{name} {sqltype}" for name, sqltype in ORDER_GOV_COLUMNS.items())},
+    {", ".join(f"{column} TEXT" for column in BLIND_INDEX_COLUMNS)}
+);
+CREATE TABLE IF NOT EXISTS order_items (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    order_id BIGINT NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+    product_id BIGINT NOT NULL REFERENCES products(id) ON DELETE RESTRICT,
+    quantity INTEGER NOT NULL,
+    unit_price DOUBLE PRECISION NOT NULL,
+    sku TEXT,
+    product_name TEXT
+);
+CREATE TABLE IF NOT EXISTS donations (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    donor TEXT,
+    amount DOUBLE PRECISION NOT NULL,
+    card_last4 TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS carts (
+    customer_id BIGINT PRIMARY KEY REFERENCES customers(id) ON DELETE CASCADE,
+    cart TEXT
+);
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema()
+                   AND table_name = 'order_items' AND column_name = 'sku') THEN
+        ALTER TABLE order_items ADD COLUMN sku TEXT, ADD COLUMN product_name TEXT;
+        UPDATE order_items SET sku = p.sku, product_name = p.name FROM products p WHERE p.id = order_items.product_id;
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id, id);
+CREATE INDEX IF NOT EXISTS idx_orders_customer_created ON orders(customer_id, created_at);
+{_POSTGRES_BLIND_INDEXES}
+CREATE TABLE IF NOT EXISTS rollup_product_daily (
+    day TEXT NOT NULL,
+    product_id BIGINT NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0,
+    revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product_id)
+);
+CREATE TABLE IF NOT EXISTS rollup_status_daily (
+    day TEXT NOT NULL,
+    status TEXT NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, status)
+);
+CREATE TABLE IF NOT EXISTS rollup_agency_daily (
+    day TEXT NOT NULL,
+    agency_hash TEXT NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, agency_hash)
+);
+CREATE TABLE IF NOT EXISTS order_events (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    order_id BIGINT NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkout_requests (
+    customer_id BIGINT NOT NULL,
+    idem_key TEXT NOT NULL,
+    order_id BIGINT,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (customer_id, idem_key)
+);
+CREATE INDEX IF NOT EXISTS idx_checkout_requests_created ON checkout_requests(created_at);
+CREATE TABLE IF NOT EXISTS stock_holds (
+    holder TEXT NOT NULL,
+    product_id BIGINT NOT NULL,
+    qty INTEGER NOT NULL,
+    expires_at TEXT NOT NULL,
+    PRIMARY KEY (holder, product_id)
+);
+CREATE INDEX IF NOT EXISTS idx_stock_holds_product ON stock_holds(product_id, expires_at, holder, qty);
+CREATE INDEX IF NOT EXISTS idx_stock_holds_expires ON stock_holds(expires_at);
+CREATE TABLE IF NOT EXISTS catalogue_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL
+);
+INSERT INTO catalogue_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+CREATE OR REPLACE FUNCTION bump_catalogue_version() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN UPDATE catalogue_version SET version = version + 1 WHERE id = 1; RETURN NULL; END $$;
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_products_version') THEN
+        CREATE TRIGGER trg_products_version AFTER INSERT OR DELETE OR UPDATE OF sku, name, price, image
+        ON products FOR EACH STATEMENT EXECUTE FUNCTION bump_catalogue_version();
+    END IF;
+END $$;
+CREATE TABLE IF NOT EXISTS order_views (
+    order_id BIGINT PRIMARY KEY,
+    customer_id BIGINT,
+    status TEXT,
+    export_license_status TEXT,
+    summary TEXT NOT NULL,
+    sensitive TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_previews (
+    filename TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    kind TEXT,
+    size BIGINT,
+    pages INTEGER,
+    width INTEGER,
+    height INTEGER,
+    meta TEXT,
+    preview BYTEA,
+    preview_type TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+def ensure_schema(db_path, journal_mode=None):
+    """Ensure orders/table and carts/password columns exist. Safe to run multiple times."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        if journal_mode:
+            # WAL lets read-only connections (get_read_db) run alongside checkout writes
+            conn.execute(f"PRAGMA journal_mode={journal_mode};")
+        _ensure_order_columns(conn)
+        _ensure_order_item_columns(conn)
+        # ensure customers table has a password column (safe to run multiple times)
+        cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='customers'").fetchone()
+        if cur:
+            cols = { r[1] for r in conn.execute("PRAGMA table_info(customers)").fetchall() }
+            if "password" not in cols:
+                conn.execute("ALTER TABLE customers ADD COLUMN password TEXT;")
+        # ensure carts table exists to persist per-customer cart JSON
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS carts (
+                customer_id INTEGER PRIMARY KEY,
+                cart TEXT,
+                FOREIGN KEY(customer_id) REFERENCES customers(id) ON DELETE CASCADE
+            );
+        """)
+        # order lines by order (detail page, export); rowid order within an order comes for free
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);")
+        # a customer's orders newest first (account.py keyset pages, order ownership checks)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer_created ON orders(customer_id, created_at);")
+        # daily sales rollups, kept current by checkout/status changes (webstore/analytics.py)
+        conn.executescript(ROLLUP_SCHEMA)
+        conn.executescript(ORDER_EVENTS_SCHEMA)
+        conn.executescript(CHECKOUT_REQUESTS_SCHEMA)
+        conn.executescript(STOCK_HOLDS_SCHEMA)
+        conn.executescript(CATALOGUE_VERSION_SCHEMA)
+        conn.executescript(ORDER_VIEWS_SCHEMA)
+        conn.executescript(UPLOAD_PREVIEWS_SCHEMA)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def ensure_schema_once():
+    """Create/upgrade the schema (ensure_schema, or POSTGRES_SCHEMA) the first time this app needs the DB."""
+    state = current_app.extensions["webstore"]
+    if not state.get("schema_checked"):
+        get_storage(current_app).ensure_schema()
+        state["schema_checked"] = True
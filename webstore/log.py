@@ -0,0 +1,272 @@
+"""Logging pipeline: request threads only enqueue records, one listener thread formats and writes them.
+
+configure(app) (called by create_app) puts a QueueHandler on the root logger; the
+listener thread behind it owns the real handler (stderr, or LOG_FILE), so JSON
+encoding, traceback formatting and the write itself never run on a request thread.
+The queue is bounded (LOG_QUEUE_SIZE): when the listener can't keep up, records are
+dropped and counted rather than making requests wait, and the next record that fits
+is preceded by a warning with the count.
+
+Every request gets an id (a sane incoming X-Request-ID header, e.g. from a load
+balancer, or a new one), returned in the X-Request-ID response header and attached
+to everything logged while handling it. Each request is logged once on
+`webstore.access` with method, path, status and duration_ms.
+
+Settings come from the WEBSTORE_ENV profile (PROFILES) and can be overridden one by
+one with LOG_LEVEL, LOG_FORMAT ("json" or "text") and LOG_SAMPLING
+("logger=rate,...", e.g. "webstore.access=0.05"). Sampling applies to the named
+loggers and their children, only below WARNING, and is per request: a sampled
+request keeps all its records, so its log lines stay together.
+
+Logging is per process: a later create_app() in the same process replaces the
+pipeline, and a forked worker starts its own listener (os.register_at_fork).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+# per-environment defaults (WEBSTORE_ENV); LOG_LEVEL / LOG_FORMAT / LOG_SAMPLING override them
+PROFILES = {
+    "development": {"level": "DEBUG", "format": "text", "sampling": ""},
+    "test": {"level": "WARNING", "format": "text", "sampling": ""},
+    "production": {"level": "INFO", "format": "json", "sampling": "webstore.access=0.1"},
+}
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_RE = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+access_log = logging.getLogger("webstore.access")
+# LogRecord attributes that aren't `extra=` fields
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+_state = {"handler": None, "listener": None}
+
+
+def parse_sampling(value):
+    """'webstore.access=0.1,werkzeug=0.5' -> {"webstore.access": 0.1, "werkzeug": 0.5}."""
+    rates = {}
+    for part in (value or "").split(","):
+        name, sep, rate = part.strip().partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            raise ValueError(f"LOG_SAMPLING: bad rate for {name.strip()!r}: {rate!r}") from None
+    return rates
+
+
+def settings_for(config):
+    """The effective logging settings for an app config (see module docstring)."""
+    env = config.get("WEBSTORE_ENV") or "development"
+    if env not in PROFILES:
+        raise ValueError(f"WEBSTORE_ENV must be one of {', '.join(PROFILES)}, not {env!r}")
+    profile = PROFILES[env]
+    fmt = config.get("LOG_FORMAT") or profile["format"]
+    if fmt not in ("json", "text"):
+        raise ValueError(f"LOG_FORMAT must be 'json' or 'text', not {fmt!r}")
+    sampling = config.get("LOG_SAMPLING")
+    return {
+        "level": (config.get("LOG_LEVEL") or profile["level"]).upper(),
+        "format": fmt,
+        "sampling": parse_sampling(profile["sampling"] if sampling is None else sampling),
+        "file": config.get("LOG_FILE") or None,
+        "queue_size": config.get("LOG_QUEUE_SIZE") or 10000,
+    }
+
+
+# --- formatting (listener thread) ---------------------------------------------
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id, pid, thread, `extra=` fields, exc."""
+
+    def format(self, record):
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        out.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        if record.stack_info:
+            out["stack"] = record.stack_info
+        return json.dumps(out, default=str)
+
+
+def build_handler(settings, stream=None):
+    """The handler that does the actual output (run by the listener thread)."""
+    if stream is not None:
+        handler = logging.StreamHandler(stream)
+    elif settings["file"]:
+        handler = logging.FileHandler(settings["file"], encoding="utf-8")
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    if settings["format"] == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT, defaults={"request_id": "-"}))
+    return handler
+
+
+# --- request-thread side ------------------------------------------------------
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the current request's id ('-' outside requests)."""
+
+    def filter(self, record):
+        record.request_id = g.get("request_id", "-") if has_request_context() else "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps `rate` of the sub-WARNING records of the configured loggers, whole requests at a time."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._cache = {}
+
+    def _rate(self, name):
+        rate = self._cache.get(name)
+        if rate is None:
+            prefix = name
+            while prefix and prefix not in self.rates:
+                prefix = prefix.rpartition(".")[0]
+            rate = self._cache[name] = self.rates.get(prefix, 1.0)
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        request_id = getattr(record, "request_id", "-")
+        if request_id != "-":
+            return zlib.crc32(request_id.encode()) / 0xFFFFFFFF < rate
+        return random.random() < rate
+
+
+class _Handler(QueueHandler):
+    """Enqueues without blocking; counts what a full queue drops (dropped: not yet reported)."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.dropped_total = 0
+
+    def prepare(self, record):
+        # merge the args now (they may be mutated after we return); unlike QueueHandler.prepare,
+        # leave formatting and the traceback (exc_info) to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            warning = logging.makeLogRecord({"name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                                             "msg": f"Log queue full: dropped {dropped} records", "request_id": "-"})
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self.dropped += dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.dropped_total += 1
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # blocks until the listener has made room, instead of raising
+
+
+# --- installation -------------------------------------------------------------
+
+def install(settings, target=None):
+    """Route the root logger through a new queue/listener pair writing to `target` (default build_handler())."""
+    shutdown()
+    target = target or build_handler(settings)
+    handler = _Handler(queue.Queue(settings["queue_size"]))
+    handler.addFilter(RequestContextFilter())
+    if settings["sampling"]:
+        handler.addFilter(SamplingFilter(settings["sampling"]))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(settings["level"])
+    listener = _Listener(handler.queue, target, respect_handler_level=True)
+    listener.start()
+    _state.update(handler=handler, listener=listener)
+    return handler
+
+
+def shutdown():
+    """Write out everything queued and remove the pipeline (also run at exit)."""
+    handler, listener = _state["handler"], _state["listener"]
+    if handler is None:
+        return
+    logging.getLogger().removeHandler(handler)
+    listener.stop()
+    for target in listener.handlers:
+        target.close()
+    _state.update(handler=None, listener=None)
+
+
+def _after_fork():
+    # the parent's listener thread doesn't exist in the child: give it its own queue and thread
+    handler, listener = _state["handler"], _state["listener"]
+    if handler is None:
+        return
+    handler.queue = queue.Queue(handler.queue.maxsize)
+    listener = _Listener(handler.queue, *listener.handlers, respect_handler_level=True)
+    listener.start()
+    _state["listener"] = listener
+
+
+atexit.register(shutdown)
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _start_request():
+    incoming = request.headers.get(REQUEST_ID_HEADER, "")
+    g.request_id = incoming if REQUEST_ID_RE.fullmatch(incoming) else uuid.uuid4().hex
+    g.log_started = time.perf_counter()
+
+
+def _finish_request(response):
+    request_id = g.get("request_id")
+    if request_id is None:  # a before_request hook that ran ahead of ours returned early
+        return response
+    response.headers[REQUEST_ID_HEADER] = request_id
+    access_log.info("%s %s %s", request.method, request.path, response.status_code,
+                    extra={"method": request.method, "path": request.path, "status": response.status_code,
+                           "duration_ms": round((time.perf_counter() - g.log_started) * 1000, 2)})
+    return response
+
+
+def configure(app):
+    """Install the logging pipeline for this process and the request id / access log hooks on `app`."""
+    install(settings_for(app.config))
+    # first, so ids are set before session handling and the other before_request hooks log anything
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    app.after_request(_finish_request)
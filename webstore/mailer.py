@@ -0,0 +1,70 @@
+import os
+
+from flask import current_app
+
+from .metrics import METRICS
+
+
+def send_order_confirmation_email(to_email, recipient_name, order_id, items, total):
+    """Send a simple order confirmation email via SMTP. Returns True on success."""
+    SMTP_HOST = os.environ.get("SMTP_HOST")
+    if not SMTP_HOST:
+        # SMTP not configured
+        current_app.logger.debug("SMTP_HOST not set, skipping email.")
+        return False
+
+    # imported here so SMTP/TLS/email modules are only loaded by workers that actually send mail
+    import smtplib
+    import ssl
+    from email.message import EmailMessage
+
+    SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+    SMTP_USER = os.environ.get("SMTP_USER")
+    SMTP_PASS = os.environ.get("SMTP_PASS")
+    FROM_EMAIL = os.environ.get("FROM_EMAIL", SMTP_USER or "no-reply@example.com")
+
+    msg = EmailMessage()
+    msg["Subject"] = f"Order #{order_id} placed"
+    msg["From"] = FROM_EMAIL
+    msg["To"] = to_email
+
+    # Plain text body
+    lines = [f"Hello {recipient_name or ''},", "", f"Your order #{order_id} has been placed.", "", "Order details:"]
+    for it in (items or []):
+        lines.append(f"- {it.get('qty',0)} x {it.get('name','')} — ${float(it.get('subtotal',0)):.2f}")
+    lines.append("")
+    lines.append(f"Total: ${float(total):.2f}")
+    lines.append("")
+    lines.append("Thank you for your order.")
+    plain = "\n".join(lines)
+
+    # Simple HTML body
+    html_items = "".join(f"<li>{it.get('qty',0)} × {it.get('name','')} — ${float(it.get('subtotal',0)):.2f}</li>" for it in (items or []))
+    html = f"""
+    <html>
+      <body>
+        <p>Hello {recipient_name or ''},</p>
+        <p>Your order <strong>#{order_id}</strong> has been placed.</p>
+        <p>Order details:</p>
+        <ul>{html_items}</ul>
+        <p><strong>Total: ${float(total):.2f}</strong></p>
+        <p>Thank you for your order.</p>
+      </body>
+    </html>
+    """
+
+    msg.set_content(plain)
+    msg.add_alternative(html, subtype="html")
+
+    context = ssl.create_default_context()
+    try:
+        with METRICS.timer("webstore_smtp_seconds"), smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20) as server:
+            server.starttls(context=context)
+            if SMTP_USER and SMTP_PASS:
+                server.login(SMTP_USER, SMTP_PASS)
+            server.send_message(msg)
+        current_app.logger.debug("Order confirmation email sent for order %s", order_id)
+        return True
+    except Exception as e:
+        current_app.logger.exception("Failed to send order confirmation email: %s", e)
+        return False
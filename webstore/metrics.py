@@ -0,0 +1,248 @@
+"""Opt-in request instrumentation (METRICS_ENABLED=1).
+
+Records, per worker process:
+  - request latency per endpoint/method/status
+  - SQL statements and SQL time per request (sqlite3 trace callback on get_db()
+    connections for the count, repos.py query timings for the time)
+  - per-query SQL time, template render time, Fernet encrypt/decrypt time, SMTP time,
+    password hashing time and pool wait (passwords.py)
+
+as Prometheus-style histograms, exported at the admin-only `/admin/metrics`.
+
+Slow-request profiling: with PROFILE_SAMPLE_RATE > 0 a random sample of requests
+runs under cProfile (or pyinstrument when PROFILER=pyinstrument and it is installed);
+profiles of requests slower than PROFILE_SLOW_MS are written to PROFILE_DIR.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from flask import current_app, g, has_app_context, request
+from jinja2 import Template
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+HELP = {
+    "webstore_request_seconds": "Request latency by endpoint",
+    "webstore_request_sql_queries": "SQL statements executed per request",
+    "webstore_request_sql_seconds": "Time spent in SQL per request",
+    "webstore_sql_query_seconds": "Latency of each named query in repos.py",
+    "webstore_template_render_seconds": "Template render time",
+    "webstore_fernet_seconds": "Fernet encrypt/decrypt time per field",
+    "webstore_smtp_seconds": "Time to send an order confirmation email",
+    "webstore_password_hash_seconds": "Password hash/verify CPU time in the hashing pool",
+    "webstore_password_hash_wait_seconds": "Time a password hash/verify waited for the pool",
+    "webstore_catalogue_build_seconds": "Time to (re)build the in-memory catalogue snapshot",
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histograms keyed by (metric name, sorted label items). Thread-safe."""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the with-block into histogram `name` (no-op while metrics are disabled)."""
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render_prometheus(self):
+        """Return all histograms in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(
+                ((name, labels, list(h.counts), h.buckets, h.total, h.count)
+                 for (name, labels), h in self._histograms.items()),
+                key=lambda it: (it[0], it[1]),
+            )
+        lines = []
+        current = None
+        for name, labels, counts, buckets, total, count in items:
+            if name != current:
+                current = name
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for upper, n in zip(buckets, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels, le=_fmt(upper))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _fmt(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+METRICS = MetricsRegistry()
+
+
+# --- hooks ------------------------------------------------------------------
+
+class TimedTemplate(Template):
+    """Jinja template class that records top-level render time."""
+
+    def render(self, *args, **kwargs):
+        with METRICS.timer("webstore_template_render_seconds", template=self.name or "<string>"):
+            return super().render(*args, **kwargs)
+
+
+def _count_statement(statement):
+    # sqlite3 trace callback: runs on the thread executing the statement
+    if has_app_context() and "metrics_sql_count" in g:
+        g.metrics_sql_count += 1
+
+
+def _instrument_connection(conn):
+    conn.set_trace_callback(_count_statement)
+
+
+def _record_query(name, elapsed):
+    METRICS.observe("webstore_sql_query_seconds", elapsed, query=name)
+    if has_app_context() and "metrics_sql_time" in g:
+        g.metrics_sql_time += elapsed
+
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_sql_count = 0
+    g.metrics_sql_time = 0.0
+    rate = current_app.config["PROFILE_SAMPLE_RATE"]
+    if rate > 0 and random.random() < rate:
+        g.metrics_profiler = _start_profiler(current_app.config["PROFILER"])
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _finish_request(exc=None):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or "unmatched"
+    status = g.pop("metrics_status", 500)
+    METRICS.observe("webstore_request_seconds", elapsed, endpoint=endpoint, method=request.method, status=status)
+    METRICS.observe("webstore_request_sql_queries", g.pop("metrics_sql_count", 0), buckets=COUNT_BUCKETS, endpoint=endpoint)
+    METRICS.observe("webstore_request_sql_seconds", g.pop("metrics_sql_time", 0.0), endpoint=endpoint)
+
+    profiler = g.pop("metrics_profiler", None)
+    if profiler is not None:
+        kind, prof = profiler
+        _stop_profiler(kind, prof)
+        if elapsed * 1000 >= current_app.config["PROFILE_SLOW_MS"]:
+            _dump_profile(kind, prof, endpoint, elapsed)
+
+
+# --- sampling profiler ------------------------------------------------------
+
+def _start_profiler(kind):
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            kind = "cprofile"
+        else:
+            prof = Profiler()
+            prof.start()
+            return kind, prof
+    import cProfile
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:
+        # another profiler is already active on this interpreter
+        return None
+    return "cprofile", prof
+
+
+def _stop_profiler(kind, prof):
+    if kind == "pyinstrument":
+        prof.stop()
+    else:
+        prof.disable()
+
+
+def _dump_profile(kind, prof, endpoint, elapsed):
+    out_dir = Path(current_app.config["PROFILE_DIR"])
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}_{endpoint.replace('.', '-')}_{int(elapsed * 1000)}ms"
+    if kind == "pyinstrument":
+        (out_dir / f"{stem}.html").write_text(prof.output_html())
+    else:
+        prof.dump_stats(str(out_dir / f"{stem}.prof"))
+    current_app.logger.info("Slow request %s (%.0f ms) profiled to %s", endpoint, elapsed * 1000, out_dir / stem)
+
+
+def init_app(app):
+    """Install the instrumentation hooks when METRICS_ENABLED is set."""
+    if not app.config.get("METRICS_ENABLED"):
+        return
+    from . import repos
+
+    METRICS.enabled = True
+    app.extensions["webstore"].setdefault("connection_hooks", []).append(_instrument_connection)
+    if _record_query not in repos.QUERY_OBSERVERS:
+        repos.QUERY_OBSERVERS.append(_record_query)
+    app.jinja_env.template_class = TimedTemplate
+    # run first so session handling and other before_request hooks are included in the latency
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
@@ -0,0 +1,99 @@
+"""Copy a SQLite store.db into PostgreSQL (the storage backend used with DATABASE_URL).
+
+copy_sqlite_to_postgres() brings the SQLite file's schema up to date, creates the
+PostgreSQL schema (db.POSTGRES_SCHEMA), then streams every table across with COPY
+in foreign-key order, keeping ids. Identity sequences are moved past the copied ids
+(and past SQLite's AUTOINCREMENT high-water mark for order_events, whose ids are
+the live feed's Last-Event-IDs). The whole copy is one PostgreSQL transaction: a
+failure leaves the target as it was. Row counts are compared before committing.
+
+The target must be empty unless truncate=True, which empties it first. Run it with
+the app stopped (or read-only): writes made to store.db during the copy are not
+picked up. scripts/migrate_to_postgres.py is the CLI.
+"""
+import sqlite3
+import time
+
+from .db import POSTGRES_SCHEMA, ensure_schema
+
+# parents before children; tables missing from the SQLite file are skipped
+TABLES = ["products", "customers", "orders", "order_items", "donations", "carts",
+          "rollup_product_daily", "rollup_status_daily", "rollup_agency_daily",
+          "order_events", "checkout_requests", "stock_holds", "order_views", "upload_previews"]
+IDENTITY_TABLES = ["products", "customers", "orders", "order_items", "donations", "order_events"]
+
+
+def _sqlite_columns(conn, table):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _pg_columns(pg, table):
+    return [r[0] for r in pg.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() "
+        "AND table_name = %s ORDER BY ordinal_position", (table,))]
+
+
+def _sqlite_sequence(conn, table):
+    try:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    except sqlite3.OperationalError:  # no AUTOINCREMENT table in this file
+        return 0
+    return row[0] if row else 0
+
+
+def copy_sqlite_to_postgres(db_path, database_url, truncate=False, batch_size=5000, progress=None):
+    """Copy every table of `db_path` into `database_url`; returns {table: rows copied}."""
+    import psycopg
+
+    progress = progress or (lambda msg: None)
+    ensure_schema(db_path)
+    src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    started = time.perf_counter()
+    try:
+        with psycopg.connect(database_url) as pg:
+            pg.execute(POSTGRES_SCHEMA)
+            if truncate:
+                pg.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+            else:
+                busy = [t for t in TABLES if pg.execute(f"SELECT EXISTS (SELECT 1 FROM {t})").fetchone()[0]]
+                if busy:
+                    raise ValueError(f"target database is not empty ({', '.join(busy)})")
+
+            present = {r[0] for r in src.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            copied = {}
+            for table in TABLES:
+                if table not in present:
+                    continue
+                source_cols = set(_sqlite_columns(src, table))
+                cols = [c for c in _pg_columns(pg, table) if c in source_cols]
+                names = ", ".join(cols)
+                cur = src.execute(f"SELECT {names} FROM {table}")
+                n = 0
+                with pg.cursor().copy(f"COPY {table} ({names}) FROM STDIN") as copy:
+                    while True:
+                        rows = cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        for row in rows:
+                            copy.write_row(row)
+                        n += len(rows)
+                        progress(f"{table}: {n:,} rows ({time.perf_counter() - started:.1f}s)")
+                copied[table] = n
+
+            for table in IDENTITY_TABLES:
+                if table in copied:
+                    high = max(pg.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0],
+                               _sqlite_sequence(src, table))
+                    pg.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false)", (table, high + 1))
+            if "catalogue_version" in present:
+                version = src.execute("SELECT version FROM catalogue_version WHERE id = 1").fetchone()
+                if version:
+                    pg.execute("UPDATE catalogue_version SET version = %s WHERE id = 1", (version[0],))
+
+            for table, n in copied.items():
+                count = pg.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                if count != n:
+                    raise RuntimeError(f"{table}: copied {n} rows but the target has {count}")
+    finally:
+        src.close()
+    return copied
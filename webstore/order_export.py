@@ -0,0 +1,155 @@
+"""Streaming order export (orders joined with customers and line items) for finance/audit.
+
+Shared by the admin endpoint and scripts/export_orders.py. Rows come off a
+fetchmany cursor and are written out chunk by chunk, so memory stays flat
+however many orders match. Formats:
+  - csv      one line per order item, order columns repeated
+  - jsonl    one object per order with a nested "items" list
+  - columnar one JSON object per chunk: {"columns": {name: [values...]}}, the
+             layout dataframe/Parquet loaders ingest directly
+Encrypted gov fields are exported as stored, or decrypted in a process pool.
+"""
+import csv
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from .crypto import ENCRYPTED_ORDER_FIELDS
+from .repos import ORDER_EXPORT_COLUMNS, OrderRepo
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson", "columnar": "application/x-ndjson"}
+ORDER_STATUSES = ("placed", "processing", "shipped", "completed", "cancelled")
+EXPORT_BATCH_SIZE = 2000
+ITEM_COLUMNS = ["sku", "product_name", "quantity", "unit_price"]
+ORDER_ONLY_COLUMNS = [c for c in ORDER_EXPORT_COLUMNS if c not in ITEM_COLUMNS]
+_ENCRYPTED_INDEXES = [ORDER_EXPORT_COLUMNS.index(f) for f in ENCRYPTED_ORDER_FIELDS if f in ORDER_EXPORT_COLUMNS]
+
+
+def date_range(date_from=None, date_to=None):
+    """Turn inclusive YYYY-MM-DD bounds into the [since, until) ISO strings the query takes.
+    Raises ValueError on malformed dates."""
+    since = date.fromisoformat(date_from).isoformat() if date_from else None
+    until = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat() if date_to else None
+    return since, until
+
+
+def parse_statuses(raw):
+    """'placed,shipped' -> ['placed', 'shipped']; None/'' -> None (all). Raises ValueError on unknown ones."""
+    statuses = [s.strip() for s in (raw or "").split(",") if s.strip()]
+    unknown = set(statuses) - set(ORDER_STATUSES)
+    if unknown:
+        raise ValueError(f"unknown status: {', '.join(sorted(unknown))}")
+    return statuses or None
+
+
+# --- decryption worker pool -------------------------------------------------
+
+_worker_fernet = None
+
+
+def _init_worker(key):
+    global _worker_fernet
+    from cryptography.fernet import Fernet
+    _worker_fernet = Fernet(key.encode())
+
+
+def _decrypt_tokens(tokens):
+    from cryptography.fernet import InvalidToken
+    out = []
+    for token in tokens:
+        try:
+            out.append(_worker_fernet.decrypt(token.encode()).decode() if token else None)
+        except (InvalidToken, ValueError):
+            out.append(None)
+    return out
+
+
+class _Decryptor:
+    """Decrypts the encrypted columns of row batches across `workers` processes."""
+
+    def __init__(self, key, workers):
+        self.workers = max(1, workers)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(key,))
+
+    def __call__(self, rows):
+        rows = [list(r) for r in rows]
+        # unique tokens only: an order's fields repeat on each of its item rows
+        tokens = list({r[i] for r in rows for i in _ENCRYPTED_INDEXES if r[i]})
+        size = max(1, -(-len(tokens) // self.workers))
+        chunks = [tokens[i:i + size] for i in range(0, len(tokens), size)]
+        plain = {}
+        for chunk, result in zip(chunks, self.pool.map(_decrypt_tokens, chunks)):
+            plain.update(zip(chunk, result))
+        for r in rows:
+            for i in _ENCRYPTED_INDEXES:
+                r[i] = plain.get(r[i])
+        return rows
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+# --- writers ----------------------------------------------------------------
+
+def _csv_chunks(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(ORDER_EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _jsonl_chunks(batches):
+    n_order = len(ORDER_ONLY_COLUMNS)
+    current = None
+    for rows in batches:
+        out = []
+        for r in rows:
+            # ORDER_EXPORT_COLUMNS has the order columns first and the item columns last
+            if current is None or current["order_id"] != r[0]:
+                if current is not None:
+                    out.append(json.dumps(current))
+                current = dict(zip(ORDER_ONLY_COLUMNS, r[:n_order]))
+                current["items"] = []
+            if r[n_order] is not None:
+                current["items"].append(dict(zip(ITEM_COLUMNS, r[n_order:])))
+        if out:
+            yield "\n".join(out) + "\n"
+    if current is not None:
+        yield json.dumps(current) + "\n"
+
+
+def _columnar_chunks(batches):
+    for rows in batches:
+        yield json.dumps({"columns": {name: [r[i] for r in rows] for i, name in enumerate(ORDER_EXPORT_COLUMNS)}}) + "\n"
+
+
+_WRITERS = {"csv": _csv_chunks, "jsonl": _jsonl_chunks, "columnar": _columnar_chunks}
+
+
+def export_orders(db, fmt, since=None, until=None, statuses=None, decrypt_key=None, workers=2,
+                  batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield the matching orders as text chunks in `fmt`.
+
+    since/until: ISO bounds on created_at (see date_range); statuses: list or None.
+    With decrypt_key the Fernet fields are decrypted by `workers` processes
+    (undecryptable values export as empty); without it they are exported as tokens.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format {fmt!r}")
+    batches = OrderRepo(db).iter_export(since, until, statuses, batch_size)
+    decryptor = _Decryptor(decrypt_key, workers) if decrypt_key else None
+    try:
+        if decryptor:
+            batches = map(decryptor, batches)
+        yield from _WRITERS[fmt](batches)
+    finally:
+        if decryptor:
+            decryptor.close()
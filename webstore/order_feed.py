@@ -0,0 +1,131 @@
+"""Live admin order feed (Server-Sent Events) over a small change log.
+
+checkout() and admin_order_detail() call record_event() inside their own
+transactions, so the order_events table (see ORDER_EVENTS_SCHEMA in db.py)
+only ever holds committed changes, and call notify() after committing.
+/admin/orders/events streams the log from the client's Last-Event-ID:
+the admin orders page renders its listing once and passes the newest event
+id it saw, and EventSource resumes from the last delivered id after any
+reconnect, so nothing is missed or repeated. That relies on event ids becoming
+visible in increasing order: SQLite has one writer at a time anyway, and on
+PostgreSQL record_event() takes a transaction-level advisory lock before the
+insert, so event-writing transactions commit one after another in id order.
+
+Streams wake up immediately for changes made in the same process and poll
+the log (a primary key range read) every ORDER_FEED_POLL_SECONDS for changes
+made by other worker processes. Each stream ends after ORDER_FEED_MAX_SECONDS
+and the browser reconnects, so a sync worker is never held indefinitely.
+Under ASGI (asgi.py) the stream is a coroutine on the read pool instead, so it
+doesn't occupy the single thread the WSGI views run on.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+
+from .repos import OrderEventRepo
+
+# keep roughly this many events; a client further behind gets a "reset" and reloads
+ORDER_EVENTS_KEEP = 10_000
+PRUNE_EVERY = 500
+EVENT_BATCH = 200
+RETRY_MS = 2000
+
+_changed = threading.Condition()
+_generation = 0
+
+
+def record_event(db, order_id, kind, status):
+    """
+    Append an 'order' (new order) or 'status' event. Call it as the transaction's last write:
+    on PostgreSQL it holds the event lock until the caller commits (then calls notify()).
+    """
+    OrderEventRepo(db).lock()
+    event_id = OrderEventRepo(db).add(order_id, kind, status, datetime.utcnow().isoformat())
+    if event_id % PRUNE_EVERY == 0:
+        OrderEventRepo(db).prune(event_id - ORDER_EVENTS_KEEP)
+    return event_id
+
+
+def notify():
+    """Wake this process's streams after an event was committed."""
+    global _generation
+    with _changed:
+        _generation += 1
+        _changed.notify_all()
+
+
+def current_generation():
+    return _generation
+
+
+def wait_for_change(seen, timeout):
+    """Block until notify() runs (generation != seen) or timeout; returns the new generation."""
+    with _changed:
+        if _generation == seen:
+            _changed.wait(timeout)
+        return _generation
+
+
+def parse_last_event_id(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def resolve_start(bounds, last_id):
+    """
+    Where a stream starts, given the log's (oldest, newest) ids: (last_id, reset).
+    No last_id means "only new events"; reset is True when events after last_id
+    have already been pruned (the client should reload its listing).
+    """
+    oldest, newest = bounds
+    if last_id is None:
+        return newest or 0, False
+    if oldest is not None and last_id < oldest - 1:
+        return newest, True
+    return last_id, False
+
+
+def start_position(db, last_id):
+    return resolve_start(OrderEventRepo(db).bounds(), last_id)
+
+
+def reset_message(last_id):
+    return f"id: {last_id}\nevent: reset\ndata: {{}}\n\n"
+
+
+def format_event(row):
+    """One SSE message for an order_events row (from ORDER_EVENTS_SINCE_SQL)."""
+    data = {k: row[k] for k in ("order_id", "status", "event_at", "created_at", "total",
+                                "export_license_status", "customer_name", "customer_email")}
+    return f"id: {row['id']}\nevent: {row['kind']}\ndata: {json.dumps(data)}\n\n"
+
+
+def event_stream(db, last_id, poll=1.0, heartbeat=15.0, max_seconds=300.0):
+    """Generator of SSE text for the WSGI endpoint (run under stream_with_context)."""
+    repo = OrderEventRepo(db)
+    last_id, reset = start_position(db, last_id)
+    yield f"retry: {RETRY_MS}\n\n"
+    if reset:
+        yield reset_message(last_id)
+    deadline = time.monotonic() + max_seconds
+    last_sent = time.monotonic()
+    seen = current_generation()
+    while True:
+        rows = repo.since(last_id, EVENT_BATCH)
+        for row in rows:
+            yield format_event(row)
+            last_id = row["id"]
+        now = time.monotonic()
+        if rows:
+            last_sent = now
+            if len(rows) == EVENT_BATCH:
+                continue
+        if now >= deadline:
+            return
+        if now - last_sent >= heartbeat:
+            yield ": keep-alive\n\n"
+            last_sent = now
+        seen = wait_for_change(seen, min(poll, deadline - now))
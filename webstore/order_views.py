@@ -0,0 +1,220 @@
+"""Denormalized order read model: the order pages render from one primary-key read.
+
+checkout() calls record() in the order's own transaction with the values it has just
+inserted; it serialises the order once (customer name/email, totals, line items with
+the product sku/name at the time, attachment paths) into order_views.summary as JSON.
+The gov fields (plaintext from the form, never re-read or decrypted here) are kept
+together as a single Fernet token in order_views.sensitive, so the admin detail page
+decrypts one token instead of one per field, and nothing is stored in plaintext that
+wasn't before. rebuild(), check() and record_status() for an order without a view
+recompute it from orders/order_items instead, decrypting the stored fields; the line
+sku/name come from order_items (as ordered), never from the current products rows. status and
+export_license_status are plain columns that admin_order_detail() updates in place
+(record_status(), same transaction as the orders UPDATE).
+
+order_success / the customer's order page (account.py) and admin_order_detail() read
+a view with load(); orders without one (placed before upgrading, or archived) fall
+back to the normalised queries. Archival deletes the views of archived orders.
+
+check() recomputes views from orders/order_items and reports the ones that are
+missing, stale or orphaned; rebuild() rewrites them. scripts/rebuild_order_views.py
+runs both.
+"""
+import json
+from datetime import datetime
+
+from flask import current_app
+
+from .crypto import ENCRYPTED_ORDER_FIELDS
+from .repos import OrderViewRepo
+
+REBUILD_BATCH = 500
+# order columns copied into the summary as they are
+SUMMARY_FIELDS = ("id", "customer_id", "created_at", "total", "customer_name", "customer_email",
+                  "official_email", "vendor_id", "required_delivery_date", "declaration_agreed",
+                  "auth_doc", "end_user_cert", "digital_signature")
+
+
+def _decrypt(fernet, value):
+    """Plaintext of a stored field; values that aren't tokens (rows from before encryption) as they are."""
+    if fernet is None:
+        return None
+    try:
+        return fernet.decrypt(value.encode()).decode()
+    except Exception:
+        return value
+
+
+def _group(rows):
+    """ORDER_VIEW_SOURCE_SQL rows -> [(order row, [line rows])], one per order."""
+    orders = []
+    for row in rows:
+        if not orders or orders[-1][0]["id"] != row["id"]:
+            orders.append((row, []))
+        if row["quantity"] is not None:
+            orders[-1][1].append(row)
+    return orders
+
+
+def compose(order, items, sensitive):
+    """
+    (summary JSON, sensitive plaintext dict) for one order: `order` has the SUMMARY_FIELDS,
+    `items` are summary item dicts, `sensitive` the gov field plaintexts. The JSON is
+    serialised deterministically, so check() can compare it with the stored text.
+    """
+    summary = {f: order[f] for f in SUMMARY_FIELDS}
+    summary["items"] = items
+    return json.dumps(summary, sort_keys=True, separators=(",", ":")), {f: v for f, v in sensitive.items() if v}
+
+
+def compose_stored(order, lines, fernet):
+    """compose() for an ORDER_VIEW_SOURCE_SQL order row and its line rows (decrypts the stored fields)."""
+    items = [{"product_id": r["product_id"], "sku": r["item_sku"], "name": r["item_name"],
+              "quantity": r["quantity"], "unit_price": r["unit_price"]} for r in lines]
+    sensitive = {f: _decrypt(fernet, order[f]) for f in ENCRYPTED_ORDER_FIELDS if order[f]}
+    return compose(order, items, sensitive)
+
+
+def _open(fernet, token):
+    """The sensitive dict stored in a view ({} without a token or key); raises if it can't be decrypted."""
+    if not token or fernet is None:
+        return {}
+    return json.loads(fernet.decrypt(token.encode()))
+
+
+def _view_row(order, composed, fernet, now):
+    summary, sensitive = composed
+    token = fernet.encrypt(json.dumps(sensitive).encode()).decode() if fernet is not None and sensitive else None
+    return (order["id"], order["customer_id"], order["status"], order["export_license_status"],
+            summary, token, now)
+
+
+def _write(db, first_id, last_id, fernet):
+    repo = OrderViewRepo(db)
+    now = datetime.utcnow().isoformat()
+    grouped = _group(repo.source(first_id, last_id))
+    repo.put_many([_view_row(order, compose_stored(order, lines, fernet), fernet, now) for order, lines in grouped])
+    return len(grouped)
+
+
+def record(db, order, items, sensitive, fernet):
+    """
+    Write the view of a just-inserted order from the values checkout inserted: `order`
+    has the SUMMARY_FIELDS plus status/export_license_status, `items` the summary item
+    dicts, `sensitive` {field: plaintext}. Caller commits.
+    """
+    row = _view_row(order, compose(order, items, sensitive), fernet, datetime.utcnow().isoformat())
+    OrderViewRepo(db).put_many([row])
+
+
+def record_status(db, order_id, status, export_status, fernet):
+    """Apply a status change to the order's view, creating the view if the order has none. Caller commits."""
+    if not OrderViewRepo(db).set_status(order_id, status, export_status, datetime.utcnow().isoformat()):
+        _write(db, order_id, order_id, fernet)
+
+
+def load(db, order_id, fernet):
+    """
+    (order dict, item dicts) from the order's view, or (None, []) when it has none.
+    The order dict has the summary fields, status columns and `<field>_decrypted`
+    for the encrypted fields (None without DATA_ENC_KEY).
+    """
+    row = OrderViewRepo(db).get(order_id)
+    if row is None:
+        return None, []
+    order = json.loads(row["summary"])
+    items = order.pop("items")
+    order.update(status=row["status"], export_license_status=row["export_license_status"], archived=0)
+    try:
+        sensitive = _open(fernet, row["sensitive"])
+    except Exception:
+        current_app.logger.exception("Failed to decrypt the view of order %s", order_id)
+        sensitive = {}
+    for f in ENCRYPTED_ORDER_FIELDS:
+        order[f + "_decrypted"] = sensitive.get(f)
+    return order, items
+
+
+def check(db, fernet, batch_size=REBUILD_BATCH, progress=None):
+    """
+    Compare every view with what compose_stored() makes of the current orders/order_items.
+    Returns {"missing": [ids], "stale": [ids], "orphaned": [ids]} (orphans: views of
+    orders no longer in the hot DB).
+    """
+    repo = OrderViewRepo(db)
+    progress = progress or (lambda msg: None)
+    problems = {"missing": [], "stale": [], "orphaned": []}
+    last_id, checked = 0, 0
+    while True:
+        ids = repo.order_ids_after(last_id, batch_size)
+        if not ids:
+            break
+        stored = {r["order_id"]: r for r in repo.in_range(ids[0], ids[-1])}
+        for order, lines in _group(repo.source(ids[0], ids[-1])):
+            view = stored.get(order["id"])
+            if view is None:
+                problems["missing"].append(order["id"])
+                continue
+            summary, sensitive = compose_stored(order, lines, fernet)
+            try:
+                stored_sensitive = _open(fernet, view["sensitive"])
+            except Exception:
+                stored_sensitive = None
+            if (view["summary"] != summary or view["customer_id"] != order["customer_id"]
+                    or view["status"] != order["status"]
+                    or view["export_license_status"] != order["export_license_status"]
+                    or (fernet is not None and stored_sensitive != sensitive)):
+                problems["stale"].append(order["id"])
+        checked += len(ids)
+        last_id = ids[-1]
+        progress(f"checked {checked:,} orders")
+    last_id = 0
+    while True:
+        orphans = repo.orphans_after(last_id, batch_size)
+        if not orphans:
+            break
+        problems["orphaned"] += orphans
+        last_id = orphans[-1]
+    return problems
+
+
+def _write_batch(db, first_id, last_id, fernet):
+    # IMMEDIATE: no checkout or status change can commit between reading the orders and writing their views
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        written = _write(db, first_id, last_id, fernet)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return written
+
+
+def rebuild(db, fernet, order_ids=None, batch_size=REBUILD_BATCH, progress=None):
+    """
+    Rewrite the views of `order_ids` (default: every order) and delete orphaned views.
+    Each batch commits, so this is safe while the app is serving. Returns the number
+    of views written.
+    """
+    repo = OrderViewRepo(db)
+    progress = progress or (lambda msg: None)
+    written = 0
+    if order_ids is None:
+        last_id = 0
+        while True:
+            ids = repo.order_ids_after(last_id, batch_size)
+            if not ids:
+                break
+            written += _write_batch(db, ids[0], ids[-1], fernet)
+            last_id = ids[-1]
+            progress(f"rebuilt {written:,} order views")
+    else:
+        for order_id in sorted(order_ids):
+            written += _write_batch(db, order_id, order_id, fernet)
+    while True:
+        orphans = repo.orphans_after(0, batch_size)
+        if not orphans:
+            break
+        repo.delete(orphans)
+        db.commit()
+    return written
@@ -0,0 +1,195 @@
+"""Password hashing off the request thread, with throttling in front of it.
+
+Werkzeug's password hashes are deliberately slow (~0.3 s of CPU each), so login
+and register:
+  - take a token from a per-email and a per-IP bucket *before* any hashing
+    (RateLimited carries the Retry-After seconds),
+  - hash/verify in a small process pool (PASSWORD_HASH_WORKERS) with at most
+    PASSWORD_HASH_MAX_PENDING jobs in flight per worker process; when it is
+    full, HashingBusy is raised at once instead of queueing requests behind it
+    (also when a pool worker dies: that pool is dropped and the next call starts a new one),
+  - rehash on a successful login when the stored hash was made with other
+    parameters than PASSWORD_HASH_METHOD (e.g. after raising the iterations).
+
+Hash time and queue wait are recorded as webstore_password_hash_seconds /
+webstore_password_hash_wait_seconds (see metrics.py). Buckets live in process
+memory, so with N server workers the effective limit is up to N times the
+configured one.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from .metrics import METRICS
+
+
+class RateLimited(Exception):
+    """Too many attempts for this email or client; retry_after is in whole seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated (or timed out); the client should retry shortly."""
+
+
+class TokenBucket:
+    """
+    Per-key token buckets: `capacity` attempts, refilled continuously over `window` seconds.
+    capacity <= 0 disables the limit. Full buckets are dropped once there are more than
+    max_keys, so memory stays bounded under a spray of distinct emails/IPs.
+    """
+
+    def __init__(self, capacity, window, max_keys=100_000):
+        self.capacity = capacity
+        self.rate = capacity / window if window > 0 else float("inf")
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Spend one token for `key`; returns 0 if allowed, else seconds until one is available."""
+        if self.capacity <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return max(1, int((1 - tokens) / self.rate + 0.999))
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return 0
+
+    def _prune(self, now):
+        full = [k for k, (tokens, last) in self._buckets.items()
+                if tokens + (now - last) * self.rate >= self.capacity]
+        for k in full:
+            del self._buckets[k]
+
+
+def _hash_job(op, method, password, stored=None):
+    """Runs in a pool process: ('hash'|'verify', ...) -> (result, seconds of CPU work)."""
+    t0 = time.perf_counter()
+    if op == "hash":
+        result = generate_password_hash(password, method=method)
+    else:
+        result = check_password_hash(stored, password)
+    return result, time.perf_counter() - t0
+
+
+def normalise_method(method):
+    """'pbkdf2:sha256' -> 'pbkdf2:sha256:260000', the form Werkzeug stores in the hash."""
+    parts = method.split(":")
+    if parts[0] == "pbkdf2" and len(parts) < 3:
+        parts = ["pbkdf2", parts[1] if len(parts) > 1 else "sha256", str(DEFAULT_PBKDF2_ITERATIONS)]
+    return ":".join(parts)
+
+
+class PasswordEngine:
+    """Bounded hashing pool plus the login/register token buckets. One per app per process."""
+
+    def __init__(self, method, workers, max_pending, timeout, per_email, per_ip, window):
+        self.method = normalise_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self.email_buckets = TokenBucket(per_email, window)
+        self.ip_buckets = TokenBucket(per_ip, window)
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        # created lazily and per process: a pool inherited across fork() is unusable
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _discard(self, pool):
+        # a worker died (OOM kill, signal): the pool refuses all further work, so the next call builds a new one
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def throttle(self, email=None, ip=None):
+        """Spend a token from each bucket that applies; raises RateLimited when one is empty."""
+        wait = max(self.email_buckets.take(email) if email else 0, self.ip_buckets.take(ip) if ip else 0)
+        if wait:
+            raise RateLimited(wait)
+
+    def _run(self, op, password, stored=None):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy("password hashing queue is full")
+        t0 = time.perf_counter()
+        if self.workers <= 0:
+            try:
+                result, work = _hash_job(op, self.method, password, stored)
+            finally:
+                self._slots.release()
+        else:
+            pool = self._executor()
+            try:
+                future = pool.submit(_hash_job, op, self.method, password, stored)
+            except BrokenProcessPool:
+                self._slots.release()
+                self._discard(pool)
+                raise HashingBusy("password hashing pool was restarted") from None
+            except Exception:
+                self._slots.release()
+                raise
+            # the slot is held until the job finishes, even if this request gives up waiting
+            future.add_done_callback(lambda _f: self._slots.release())
+            try:
+                result, work = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                raise HashingBusy("password hashing timed out") from None
+            except BrokenProcessPool:
+                self._discard(pool)
+                raise HashingBusy("password hashing pool was restarted") from None
+        METRICS.observe("webstore_password_hash_seconds", work, op=op)
+        METRICS.observe("webstore_password_hash_wait_seconds", max(0.0, time.perf_counter() - t0 - work), op=op)
+        return result
+
+    def hash(self, password):
+        return self._run("hash", password)
+
+    def verify(self, stored, password):
+        return self._run("verify", password, stored)
+
+    def needs_rehash(self, stored):
+        """True when `stored` was not made with the configured method/parameters."""
+        return (stored or "").split("$", 1)[0] != self.method
+
+    def close(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+
+def get_password_engine():
+    """Return the app's PasswordEngine, building it from config on first use."""
+    state = current_app.extensions["webstore"]
+    if "password_engine" not in state:
+        cfg = current_app.config
+        state["password_engine"] = PasswordEngine(
+            cfg["PASSWORD_HASH_METHOD"], cfg["PASSWORD_HASH_WORKERS"], cfg["PASSWORD_HASH_MAX_PENDING"],
+            cfg["PASSWORD_HASH_TIMEOUT"], cfg["LOGIN_ATTEMPTS_PER_EMAIL"], cfg["LOGIN_ATTEMPTS_PER_IP"],
+            cfg["LOGIN_ATTEMPT_WINDOW_SECONDS"],
+        )
+    return state["password_engine"]
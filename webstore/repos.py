@@ -0,0 +1,765 @@
+"""Data-access layer: one small repository class per table group.
+
+Every query is a module-level constant with a fixed shape, so sqlite3's
+per-connection statement cache (sized by SQLITE_CACHED_STATEMENTS) can reuse
+the prepared statement. Variable-size SKU sets are passed as one JSON array
+parameter and expanded with `json_each` instead of building `IN (?,?,...)`.
+
+Each query is timed under its name in QUERY_STATS (count + total seconds);
+functions in QUERY_OBSERVERS are also called with (name, elapsed) for every query.
+
+The same constants run on PostgreSQL (storage.PgConnection rewrites placeholders
+and json_each); the few that need different SQL there are in POSTGRES_SQL.
+"""
+import json
+import threading
+import time
+
+from .blind_index import BLIND_INDEX_COLUMNS
+
+# --- query timing -----------------------------------------------------------
+
+class QueryStats:
+    """Process-wide per-query counters: {name: (count, total_seconds)}. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, elapsed):
+        with self._lock:
+            count, total = self._stats.get(name, (0, 0.0))
+            self._stats[name] = (count + 1, total + elapsed)
+
+    def snapshot(self):
+        """Return {name: {"count", "total_ms", "avg_ms"}} sorted by total time (hotspots first)."""
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda kv: kv[1][1], reverse=True)
+        return {
+            name: {"count": count, "total_ms": round(total * 1000, 3), "avg_ms": round(total * 1000 / count, 3)}
+            for name, (count, total) in items
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+QUERY_STATS = QueryStats()
+
+# extra per-query callbacks f(name, elapsed_seconds), e.g. metrics.init_app
+QUERY_OBSERVERS = []
+
+
+def _record(name, elapsed):
+    QUERY_STATS.record(name, elapsed)
+    for observer in QUERY_OBSERVERS:
+        observer(name, elapsed)
+
+
+class Repo:
+    def __init__(self, db):
+        self.db = db
+        # "sqlite" or "postgres" (storage.PgConnection)
+        self.dialect = getattr(db, "dialect", "sqlite")
+
+    def _execute(self, name, sql, params=()):
+        t0 = time.perf_counter()
+        try:
+            return self.db.execute(sql, params)
+        finally:
+            _record(name, time.perf_counter() - t0)
+
+    def _fetchall(self, name, sql, params=()):
+        t0 = time.perf_counter()
+        try:
+            return self.db.execute(sql, params).fetchall()
+        finally:
+            _record(name, time.perf_counter() - t0)
+
+    def _fetchone(self, name, sql, params=()):
+        t0 = time.perf_counter()
+        try:
+            return self.db.execute(sql, params).fetchone()
+        finally:
+            _record(name, time.perf_counter() - t0)
+
+
+def sku_set_param(skus):
+    """Encode a SKU collection as the single JSON-array parameter used by the json_each queries."""
+    return json.dumps(list(skus))
+
+
+# --- products ---------------------------------------------------------------
+
+PRODUCT_COLUMNS = "id, sku, name, description, price, image, stock"
+
+# LIMIT -1 means "no limit" in SQLite, so listing all and listing the first N share one statement
+PRODUCTS_LIST_SQL = f"SELECT {PRODUCT_COLUMNS} FROM products ORDER BY id LIMIT ?"
+PRODUCT_BY_SKU_SQL = f"SELECT {PRODUCT_COLUMNS} FROM products WHERE sku = ?"
+PRODUCTS_BY_SKUS_SQL = f"SELECT {PRODUCT_COLUMNS} FROM products WHERE sku IN (SELECT value FROM json_each(?))"
+PRODUCT_ID_BY_SKU_SQL = "SELECT id FROM products WHERE sku = ?"
+PRODUCT_INSERT_SQL = "INSERT INTO products (sku, name, description, price, image, stock, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)"
+# NULL parameter = leave that column unchanged (one statement for every combination of edited fields)
+PRODUCT_UPDATE_SQL = (
+    "UPDATE products SET name = COALESCE(?, name), description = COALESCE(?, description), "
+    "price = COALESCE(?, price), stock = COALESCE(?, stock), image = COALESCE(?, image) WHERE sku = ?"
+)
+PRODUCT_DELETE_SQL = "DELETE FROM products WHERE id = ?"
+# never below zero: no row back means the stock was gone
+PRODUCT_DECREMENT_STOCK_SQL = "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ? RETURNING stock"
+# PostgreSQL only: row locks on the products a stock check is about to read (in id order,
+# so two checkouts over the same products can't deadlock); SQLite's BEGIN IMMEDIATE locks everything
+PRODUCTS_LOCK_SQL = "SELECT id FROM products WHERE id IN (SELECT CAST(value AS INTEGER) FROM json_each(?)) ORDER BY id FOR UPDATE"
+PRODUCT_REFERENCE_COUNT_SQL = "SELECT COUNT(*) AS cnt FROM order_items WHERE product_id = ?"
+# bulk import: existing rows keep their id/created_at, and their image when the import has none
+PRODUCT_UPSERT_SQL = (
+    "INSERT INTO products (sku, name, description, price, image, stock, created_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(sku) DO UPDATE SET name = excluded.name, description = excluded.description, "
+    "price = excluded.price, image = COALESCE(excluded.image, products.image), stock = excluded.stock"
+)
+PRODUCT_EXPORT_COLUMNS = ["sku", "name", "description", "price", "image", "stock", "created_at"]
+PRODUCTS_EXPORT_SQL = f"SELECT {', '.join(PRODUCT_EXPORT_COLUMNS)} FROM products ORDER BY id"
+# every taken SKU a set of bases could collide with: the base itself or "<base[:24]>-<anything>"
+# (a range on the sku index, '.' being the character after '-')
+PRODUCT_SKU_COLLISIONS_SQL = (
+    "SELECT p.sku FROM json_each(?) j JOIN products p ON p.sku = j.value "
+    "UNION SELECT p.sku FROM json_each(?) j JOIN products p "
+    "ON p.sku > substr(j.value, 1, 24) || '-' AND p.sku < substr(j.value, 1, 24) || '.'"
+)
+
+
+def resolve_unique_skus(bases, taken):
+    """
+    Pick a free SKU for each base: the base itself, else "<base[:24]>-1", "-2", ...
+    `taken` is a set of SKUs already in use; SKUs picked here are added to it, so
+    duplicates within `bases` get distinct suffixes too.
+    """
+    out = []
+    for base in bases:
+        sku, suffix = base, 1
+        while sku in taken:
+            sku = f"{base[:24]}-{suffix}"
+            suffix += 1
+        taken.add(sku)
+        out.append(sku)
+    return out
+
+
+class ProductRepo(Repo):
+    def list(self, limit=None):
+        return [dict(r) for r in self._fetchall("products.list", PRODUCTS_LIST_SQL, (limit or -1,))]
+
+    def get_by_sku(self, sku):
+        row = self._fetchone("products.by_sku", PRODUCT_BY_SKU_SQL, (sku,))
+        return dict(row) if row else None
+
+    def by_skus(self, skus):
+        return self._fetchall("products.by_skus", PRODUCTS_BY_SKUS_SQL, (sku_set_param(skus),))
+
+    def id_by_sku(self, sku):
+        row = self._fetchone("products.id_by_sku", PRODUCT_ID_BY_SKU_SQL, (sku,))
+        return row["id"] if row else None
+
+    def insert(self, sku, name, description, price, image, stock, created_at):
+        return self._execute("products.insert", PRODUCT_INSERT_SQL,
+                             (sku, name, description, price, image, stock, created_at)).lastrowid
+
+    def update(self, sku, name=None, description=None, price=None, stock=None, image=None):
+        self._execute("products.update", PRODUCT_UPDATE_SQL, (name, description, price, stock, image, sku))
+
+    def delete(self, product_id):
+        self._execute("products.delete", PRODUCT_DELETE_SQL, (product_id,))
+
+    def decrement_stock(self, product_id, qty):
+        """Take `qty` units; returns False (and changes nothing) if fewer are in stock."""
+        return bool(self._fetchall("products.decrement_stock", PRODUCT_DECREMENT_STOCK_SQL, (qty, product_id, qty)))
+
+    def lock(self, product_ids):
+        """Lock these product rows until the transaction ends (PostgreSQL; a no-op on SQLite)."""
+        if self.dialect == "postgres":
+            self._fetchall("products.lock", PRODUCTS_LOCK_SQL, (json.dumps(sorted(product_ids)),))
+
+    def reference_count(self, product_id):
+        return self._fetchone("products.reference_count", PRODUCT_REFERENCE_COUNT_SQL, (product_id,))["cnt"]
+
+    def unique_skus(self, bases, reserved=()):
+        """Free SKUs for `bases` (see resolve_unique_skus), checked against the table in one query.
+        `reserved` SKUs are treated as taken even if not in the table yet."""
+        param = sku_set_param(set(bases))
+        taken = {r[0] for r in self._fetchall("products.sku_collisions", PRODUCT_SKU_COLLISIONS_SQL, (param, param))}
+        return resolve_unique_skus(bases, taken | set(reserved))
+
+    def upsert_many(self, rows):
+        """Insert-or-update (sku, name, description, price, image, stock, created_at) tuples."""
+        t0 = time.perf_counter()
+        try:
+            self.db.executemany(PRODUCT_UPSERT_SQL, rows)
+        finally:
+            _record("products.upsert_many", time.perf_counter() - t0)
+
+    def upsert(self, row):
+        self._execute("products.upsert", PRODUCT_UPSERT_SQL, row)
+
+    def iter_export(self, batch_size=1000):
+        """Yield export rows (PRODUCT_EXPORT_COLUMNS order) without loading the whole table."""
+        cur = self._execute("products.export", PRODUCTS_EXPORT_SQL)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+
+# --- stock holds (cart reservations) ------------------------------------------
+
+# stock left for `holder`: on-hand stock minus everyone else's unexpired holds
+STOCK_AVAILABLE_SQL = (
+    "SELECT p.id, p.stock - COALESCE((SELECT SUM(h.qty) FROM stock_holds h WHERE h.product_id = p.id "
+    "AND h.expires_at > ?1 AND h.holder != ?2), 0) AS available "
+    "FROM products p WHERE p.id IN (SELECT value FROM json_each(?3))"
+)
+STOCK_HOLD_UPSERT_SQL = (
+    "INSERT INTO stock_holds (holder, product_id, qty, expires_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(holder, product_id) DO UPDATE SET qty = excluded.qty, expires_at = excluded.expires_at"
+)
+STOCK_HOLD_DELETE_SQL = "DELETE FROM stock_holds WHERE holder = ? AND product_id = ?"
+STOCK_HOLDS_DELETE_HOLDER_SQL = "DELETE FROM stock_holds WHERE holder = ?"
+STOCK_HOLDS_SWEEP_SQL = (
+    "DELETE FROM stock_holds WHERE (holder, product_id) IN "
+    "(SELECT holder, product_id FROM stock_holds WHERE expires_at <= ? LIMIT ?)"
+)
+
+
+class StockHoldRepo(Repo):
+    def available(self, product_ids, holder, now):
+        """{product_id: units `holder` may still take}; missing products are left out."""
+        rows = self._fetchall("stock_holds.available", STOCK_AVAILABLE_SQL,
+                              (now, holder, json.dumps(list(product_ids))))
+        return {r["id"]: max(0, r["available"] or 0) for r in rows}
+
+    def put(self, holder, product_id, qty, expires_at):
+        self._execute("stock_holds.upsert", STOCK_HOLD_UPSERT_SQL, (holder, product_id, qty, expires_at))
+
+    def delete(self, holder, product_id):
+        self._execute("stock_holds.delete", STOCK_HOLD_DELETE_SQL, (holder, product_id))
+
+    def delete_holder(self, holder):
+        self._execute("stock_holds.delete_holder", STOCK_HOLDS_DELETE_HOLDER_SQL, (holder,))
+
+    def sweep(self, now, limit):
+        """Delete up to `limit` expired holds; returns how many went."""
+        return self._execute("stock_holds.sweep", STOCK_HOLDS_SWEEP_SQL, (now, limit)).rowcount
+
+
+# --- customers --------------------------------------------------------------
+
+CUSTOMER_BY_EMAIL_SQL = "SELECT id, name, password FROM customers WHERE email = ?"
+CUSTOMER_BY_ID_SQL = "SELECT email, name FROM customers WHERE id = ?"
+CUSTOMER_INSERT_SQL = "INSERT INTO customers (name, email, created_at, password) VALUES (?, ?, ?, ?)"
+CUSTOMER_UPDATE_NAME_SQL = "UPDATE customers SET name = ? WHERE id = ?"
+# only replaces the hash that was verified, so a concurrent password change wins
+CUSTOMER_REHASH_PASSWORD_SQL = "UPDATE customers SET password = ? WHERE id = ? AND password = ?"
+
+
+class CustomerRepo(Repo):
+    def by_email(self, email):
+        return self._fetchone("customers.by_email", CUSTOMER_BY_EMAIL_SQL, (email,))
+
+    def by_id(self, customer_id):
+        return self._fetchone("customers.by_id", CUSTOMER_BY_ID_SQL, (customer_id,))
+
+    def create(self, name, email, created_at, password=None):
+        return self._execute("customers.insert", CUSTOMER_INSERT_SQL, (name, email, created_at, password)).lastrowid
+
+    def update_name(self, customer_id, name):
+        self._execute("customers.update_name", CUSTOMER_UPDATE_NAME_SQL, (name, customer_id))
+
+    def rehash_password(self, customer_id, old_hash, new_hash):
+        self._execute("customers.rehash_password", CUSTOMER_REHASH_PASSWORD_SQL, (new_hash, customer_id, old_hash))
+
+
+# --- carts ------------------------------------------------------------------
+
+CART_LOAD_SQL = "SELECT cart FROM carts WHERE customer_id = ?"
+CART_SAVE_SQL = "INSERT INTO carts (customer_id, cart) VALUES (?, ?) ON CONFLICT(customer_id) DO UPDATE SET cart = excluded.cart"
+
+
+class CartRepo(Repo):
+    def load(self, customer_id):
+        row = self._fetchone("carts.load", CART_LOAD_SQL, (customer_id,))
+        return row["cart"] if row else None
+
+    def save(self, customer_id, data):
+        self._execute("carts.save", CART_SAVE_SQL, (customer_id, data))
+
+
+# --- orders -----------------------------------------------------------------
+
+ORDER_COLUMNS = ["customer_id", "total", "status", "created_at",
+                 "agency", "authorized_officer", "official_email", "position_clearance", "contact_number",
+                 "po_number", "contract_reference", "funding_source",
+                 "auth_doc", "vendor_id", "end_user_cert", "export_license_status",
+                 "delivery_location", "required_delivery_date", "payment_method",
+                 "declaration_agreed", "digital_signature"]
+# insert also writes the blind indexes (kept out of ORDER_COLUMNS: archives made before them lack the columns)
+ORDER_INSERT_COLUMNS = ORDER_COLUMNS + BLIND_INDEX_COLUMNS
+ORDER_INSERT_SQL = (
+    f"INSERT INTO orders ({','.join(ORDER_INSERT_COLUMNS)}) VALUES ({','.join('?' for _ in ORDER_INSERT_COLUMNS)})"
+)
+ORDER_ITEM_INSERT_SQL = (
+    "INSERT INTO order_items (order_id, product_id, quantity, unit_price, sku, product_name) VALUES (?, ?, ?, ?, ?, ?)"
+)
+ORDER_DETAIL_SQL = (
+    "SELECT o.*, c.name AS customer_name, c.email AS customer_email FROM orders o "
+    "LEFT JOIN customers c ON o.customer_id = c.id WHERE o.id = ?"
+)
+ORDER_ITEMS_SQL = (
+    "SELECT oi.quantity, oi.unit_price, oi.product_name AS name FROM order_items oi WHERE oi.order_id = ?"
+)
+ORDERS_PREVIOUS_SQL = (
+    "SELECT o.*, c.name AS customer_name FROM orders o LEFT JOIN customers c ON o.customer_id = c.id "
+    "WHERE o.status IN ('completed','shipped','cancelled') ORDER BY o.created_at DESC"
+)
+ORDERS_CURRENT_SQL = (
+    "SELECT o.*, c.name AS customer_name FROM orders o LEFT JOIN customers c ON o.customer_id = c.id "
+    "WHERE o.status NOT IN ('completed','shipped','cancelled') ORDER BY o.created_at DESC"
+)
+# exact match on any of the blind indexes (NULL parameters match nothing); each term is an
+# index lookup on its partial index, so this costs the same for 1k or 10M orders
+ORDERS_SEARCH_SQL = (
+    "SELECT o.*, c.name AS customer_name, c.email AS customer_email FROM orders o "
+    "LEFT JOIN customers c ON o.customer_id = c.id WHERE "
+    + " OR ".join(f"o.{column} = ?" for column in BLIND_INDEX_COLUMNS)
+    + " ORDER BY o.created_at DESC LIMIT ?"
+)
+ORDER_UPDATE_STATUS_SQL = "UPDATE orders SET status = ?, export_license_status = ? WHERE id = ?"
+ORDER_STATUS_SQL = "SELECT status, total, created_at FROM orders WHERE id = ?"
+# archived orders (archive.py), read through an attached `archive` schema; rows still present
+# in the hot DB (mid-archival) are skipped so nothing is listed twice
+ARCHIVED_ORDER_LIST_COLUMNS = ", ".join(["o.id"] + [f"o.{c}" for c in ORDER_COLUMNS])
+ORDERS_PREVIOUS_WITH_ARCHIVE_SQL = (
+    f"SELECT * FROM (SELECT {ARCHIVED_ORDER_LIST_COLUMNS}, c.name AS customer_name, 0 AS archived FROM main.orders o "
+    "LEFT JOIN main.customers c ON o.customer_id = c.id WHERE o.status IN ('completed','shipped','cancelled') "
+    f"UNION ALL SELECT {ARCHIVED_ORDER_LIST_COLUMNS}, c.name AS customer_name, 1 AS archived FROM archive.orders o "
+    "LEFT JOIN main.customers c ON o.customer_id = c.id WHERE o.id NOT IN (SELECT id FROM main.orders)) "
+    "ORDER BY created_at DESC"
+)
+ARCHIVED_ORDER_DETAIL_SQL = (
+    "SELECT o.*, c.name AS customer_name, c.email AS customer_email, 1 AS archived FROM archive.orders o "
+    "LEFT JOIN main.customers c ON o.customer_id = c.id WHERE o.id = ?"
+)
+ARCHIVED_ORDER_ITEMS_SQL = "SELECT quantity, unit_price, product_name AS name FROM archive.order_items WHERE order_id = ?"
+# customer order history (account.py): keyset pages over idx_orders_customer_created, newest
+# first, (created_at, id) as the cursor, so page N costs the same as page 1
+CUSTOMER_ORDER_LIST_COLUMNS = (
+    "o.id, o.created_at, o.status, o.total, o.export_license_status, "
+    "(SELECT COALESCE(SUM(oi.quantity), 0) FROM {schema}.order_items oi WHERE oi.order_id = o.id) AS units"
+)
+CUSTOMER_ORDERS_SQL = (
+    f"SELECT {CUSTOMER_ORDER_LIST_COLUMNS.format(schema='main')}, 0 AS archived FROM main.orders o "
+    "WHERE o.customer_id = ? AND (o.created_at, o.id) < (?, ?) ORDER BY o.created_at DESC, o.id DESC LIMIT ?"
+)
+# each side stops after one page on its own index, then the two pages are merged
+CUSTOMER_ORDERS_WITH_ARCHIVE_SQL = (
+    f"SELECT * FROM (SELECT {CUSTOMER_ORDER_LIST_COLUMNS.format(schema='main')}, 0 AS archived FROM main.orders o "
+    "WHERE o.customer_id = ?1 AND (o.created_at, o.id) < (?2, ?3) ORDER BY o.created_at DESC, o.id DESC LIMIT ?4) "
+    f"UNION ALL SELECT * FROM (SELECT {CUSTOMER_ORDER_LIST_COLUMNS.format(schema='archive')}, 1 AS archived "
+    "FROM archive.orders o WHERE o.customer_id = ?1 AND (o.created_at, o.id) < (?2, ?3) "
+    "AND o.id NOT IN (SELECT id FROM main.orders) ORDER BY o.created_at DESC, o.id DESC LIMIT ?4) "
+    "ORDER BY created_at DESC, id DESC LIMIT ?4"
+)
+# one order and its lines in one query (one row per line; an order without lines gives one row
+# of NULL line columns); the customer_id term is the ownership check
+CUSTOMER_ORDER_SQL = (
+    "SELECT o.id, o.created_at, o.status, o.total, o.export_license_status, o.po_number, o.contract_reference, "
+    "o.delivery_location, o.required_delivery_date, 0 AS archived, "
+    "oi.quantity, oi.unit_price, oi.sku, oi.product_name AS name FROM orders o "
+    "LEFT JOIN order_items oi ON oi.order_id = o.id "
+    "WHERE o.id = ? AND o.customer_id = ? ORDER BY oi.id"
+)
+ARCHIVED_CUSTOMER_ORDER_SQL = (
+    "SELECT o.id, o.created_at, o.status, o.total, o.export_license_status, o.po_number, o.contract_reference, "
+    "o.delivery_location, o.required_delivery_date, 1 AS archived, "
+    "oi.quantity, oi.unit_price, oi.sku, oi.product_name AS name FROM archive.orders o "
+    "LEFT JOIN archive.order_items oi ON oi.order_id = o.id "
+    "WHERE o.id = ? AND o.customer_id = ? ORDER BY oi.id"
+)
+# one row per order line (orders without items get one row of NULL item columns), in order id
+# order so consumers can regroup by order while streaming. NULL filter parameters match everything.
+ORDER_EXPORT_COLUMNS = ["order_id", "created_at", "status", "total", "customer_id", "customer_name", "customer_email",
+                        "official_email", "agency", "authorized_officer", "position_clearance", "contact_number",
+                        "po_number", "contract_reference", "funding_source", "vendor_id", "export_license_status",
+                        "delivery_location", "required_delivery_date", "payment_method",
+                        "sku", "product_name", "quantity", "unit_price"]
+ORDERS_EXPORT_SQL = (
+    "SELECT o.id, o.created_at, o.status, o.total, o.customer_id, c.name, c.email, "
+    "o.official_email, o.agency, o.authorized_officer, o.position_clearance, o.contact_number, "
+    "o.po_number, o.contract_reference, o.funding_source, o.vendor_id, o.export_license_status, "
+    "o.delivery_location, o.required_delivery_date, o.payment_method, "
+    "oi.sku, oi.product_name, oi.quantity, oi.unit_price "
+    "FROM orders o LEFT JOIN customers c ON c.id = o.customer_id "
+    "LEFT JOIN order_items oi ON oi.order_id = o.id "
+    "WHERE (?1 IS NULL OR o.created_at >= ?1) AND (?2 IS NULL OR o.created_at < ?2) "
+    "AND (?3 IS NULL OR o.status IN (SELECT value FROM json_each(?3))) "
+    "ORDER BY o.id, oi.id"
+)
+
+
+class OrderRepo(Repo):
+    def insert(self, values):
+        """Insert an order from a {column: value} dict (keys from ORDER_INSERT_COLUMNS); returns the new id."""
+        return self._execute("orders.insert", ORDER_INSERT_SQL,
+                             tuple(values.get(c) for c in ORDER_INSERT_COLUMNS)).lastrowid
+
+    def add_item(self, order_id, product_id, quantity, unit_price, sku, product_name):
+        """Add a line; sku/product_name are kept as ordered (later product edits don't change them)."""
+        self._execute("order_items.insert", ORDER_ITEM_INSERT_SQL,
+                      (order_id, product_id, quantity, unit_price, sku, product_name))
+
+    def detail(self, order_id):
+        return self._fetchone("orders.detail", ORDER_DETAIL_SQL, (order_id,))
+
+    def items(self, order_id):
+        return self._fetchall("order_items.by_order", ORDER_ITEMS_SQL, (order_id,))
+
+    def list(self, previous=False, include_archive=False):
+        """include_archive: also list archived orders (needs the archive attached, see db.attach_archive)."""
+        if previous and include_archive:
+            return self._fetchall("orders.list_previous_archive", ORDERS_PREVIOUS_WITH_ARCHIVE_SQL)
+        if previous:
+            return self._fetchall("orders.list_previous", ORDERS_PREVIOUS_SQL)
+        return self._fetchall("orders.list_current", ORDERS_CURRENT_SQL)
+
+    def search(self, hashes, limit):
+        """Orders matching any blind index; `hashes` has one value (or None) per BLIND_INDEX_COLUMNS entry."""
+        return self._fetchall("orders.search", ORDERS_SEARCH_SQL, (*hashes, limit))
+
+    def archived_detail(self, order_id):
+        return self._fetchone("orders.archived_detail", ARCHIVED_ORDER_DETAIL_SQL, (order_id,))
+
+    def archived_items(self, order_id):
+        return self._fetchall("order_items.archived_by_order", ARCHIVED_ORDER_ITEMS_SQL, (order_id,))
+
+    def customer_page(self, customer_id, before, limit, include_archive=False):
+        """
+        Up to `limit` of a customer's orders, newest first, older than the `before`
+        (created_at, id) cursor. include_archive needs the archive attached (db.attach_archive).
+        """
+        params = (customer_id, before[0], before[1], limit)
+        if include_archive:
+            return self._fetchall("orders.customer_page_archive", CUSTOMER_ORDERS_WITH_ARCHIVE_SQL, params)
+        return self._fetchall("orders.customer_page", CUSTOMER_ORDERS_SQL, params)
+
+    def customer_order(self, order_id, customer_id, archived=False):
+        """The order's rows (one per line) if it belongs to `customer_id`, else []."""
+        if archived:
+            return self._fetchall("orders.archived_customer_order", ARCHIVED_CUSTOMER_ORDER_SQL, (order_id, customer_id))
+        return self._fetchall("orders.customer_order", CUSTOMER_ORDER_SQL, (order_id, customer_id))
+
+    def update_status(self, order_id, status, export_status):
+        self._execute("orders.update_status", ORDER_UPDATE_STATUS_SQL, (status, export_status, order_id))
+
+    def status(self, order_id):
+        """(status, total, created_at) row for rollup bookkeeping, or None."""
+        return self._fetchone("orders.status", ORDER_STATUS_SQL, (order_id,))
+
+    def iter_export(self, since=None, until=None, statuses=None, batch_size=1000):
+        """Yield batches (lists) of ORDER_EXPORT_COLUMNS rows; since/until are ISO timestamps."""
+        status_param = json.dumps(list(statuses)) if statuses else None
+        cur = self._execute("orders.export", ORDERS_EXPORT_SQL, (since, until, status_param))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+
+
+# --- order read model (order_views.py) ---------------------------------------
+
+# orders in an id range with their lines (one row per line, NULL line columns for an order
+# without any), in the shape order_views.compose_stored() serialises
+ORDER_VIEW_SOURCE_SQL = (
+    "SELECT o.*, c.name AS customer_name, c.email AS customer_email, "
+    "oi.product_id, oi.quantity, oi.unit_price, oi.sku AS item_sku, oi.product_name AS item_name FROM orders o "
+    "LEFT JOIN customers c ON c.id = o.customer_id LEFT JOIN order_items oi ON oi.order_id = o.id "
+    "WHERE o.id BETWEEN ? AND ? ORDER BY o.id, oi.id"
+)
+ORDER_IDS_AFTER_SQL = "SELECT id FROM orders WHERE id > ? ORDER BY id LIMIT ?"
+ORDER_VIEW_COLUMNS = ["order_id", "customer_id", "status", "export_license_status", "summary", "sensitive", "updated_at"]
+ORDER_VIEW_UPSERT_SQL = (
+    f"INSERT OR REPLACE INTO order_views ({', '.join(ORDER_VIEW_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in ORDER_VIEW_COLUMNS)})"
+)
+ORDER_VIEW_GET_SQL = f"SELECT {', '.join(ORDER_VIEW_COLUMNS)} FROM order_views WHERE order_id = ?"
+ORDER_VIEWS_RANGE_SQL = f"SELECT {', '.join(ORDER_VIEW_COLUMNS)} FROM order_views WHERE order_id BETWEEN ? AND ?"
+ORDER_VIEW_STATUS_SQL = (
+    "UPDATE order_views SET status = ?, export_license_status = ?, updated_at = ? WHERE order_id = ?"
+)
+# views whose order is gone from the hot DB (archived or deleted)
+ORDER_VIEWS_ORPHANS_SQL = (
+    "SELECT v.order_id FROM order_views v WHERE v.order_id > ? "
+    "AND NOT EXISTS (SELECT 1 FROM orders o WHERE o.id = v.order_id) ORDER BY v.order_id LIMIT ?"
+)
+ORDER_VIEWS_DELETE_SQL = "DELETE FROM order_views WHERE order_id IN (SELECT value FROM json_each(?))"
+
+
+class OrderViewRepo(Repo):
+    def get(self, order_id):
+        return self._fetchone("order_views.get", ORDER_VIEW_GET_SQL, (order_id,))
+
+    def in_range(self, first_id, last_id):
+        return self._fetchall("order_views.range", ORDER_VIEWS_RANGE_SQL, (first_id, last_id))
+
+    def put_many(self, rows):
+        """Write (or replace) views given as ORDER_VIEW_COLUMNS tuples."""
+        self.db.executemany(ORDER_VIEW_UPSERT_SQL, rows)
+
+    def set_status(self, order_id, status, export_status, updated_at):
+        """Returns False when the order has no view yet."""
+        return self._execute("order_views.set_status", ORDER_VIEW_STATUS_SQL,
+                             (status, export_status, updated_at, order_id)).rowcount == 1
+
+    def source(self, first_id, last_id):
+        return self._fetchall("order_views.source", ORDER_VIEW_SOURCE_SQL, (first_id, last_id))
+
+    def order_ids_after(self, last_id, limit):
+        return [r[0] for r in self._fetchall("order_views.order_ids", ORDER_IDS_AFTER_SQL, (last_id, limit))]
+
+    def orphans_after(self, last_id, limit):
+        return [r[0] for r in self._fetchall("order_views.orphans", ORDER_VIEWS_ORPHANS_SQL, (last_id, limit))]
+
+    def delete(self, order_ids):
+        self._execute("order_views.delete", ORDER_VIEWS_DELETE_SQL, (json.dumps(list(order_ids)),))
+
+
+# --- upload previews (upload_previews.py) ------------------------------------
+
+UPLOAD_PREVIEW_COLUMNS = ["filename", "status", "kind", "size", "pages", "width", "height", "meta",
+                          "preview", "preview_type", "error", "created_at"]
+UPLOAD_PREVIEW_PUT_SQL = (
+    f"INSERT OR REPLACE INTO upload_previews ({', '.join(UPLOAD_PREVIEW_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in UPLOAD_PREVIEW_COLUMNS)})"
+)
+# everything but the image bytes, for the order page; length(preview) without reading the blob
+UPLOAD_PREVIEWS_INFO_SQL = (
+    "SELECT filename, status, kind, size, pages, width, height, meta, preview_type, error, created_at, "
+    "length(preview) AS preview_bytes FROM upload_previews WHERE filename IN (SELECT value FROM json_each(?))"
+)
+UPLOAD_PREVIEW_IMAGE_SQL = "SELECT preview, preview_type FROM upload_previews WHERE filename = ? AND preview IS NOT NULL"
+# order uploads that were never processed (uploads from before preprocessing existed)
+UPLOADS_UNPROCESSED_SQL = (
+    "SELECT f FROM (SELECT auth_doc AS f FROM orders UNION SELECT end_user_cert FROM orders "
+    "UNION SELECT digital_signature FROM orders) WHERE f IS NOT NULL AND f != '' "
+    "AND f NOT IN (SELECT filename FROM upload_previews) ORDER BY f"
+)
+UPLOADS_FAILED_SQL = "SELECT filename FROM upload_previews WHERE status = 'failed' ORDER BY filename"
+
+
+class UploadPreviewRepo(Repo):
+    def put(self, row):
+        """Insert or replace the result for one upload ({column: value}, missing columns NULL)."""
+        self._execute("upload_previews.put", UPLOAD_PREVIEW_PUT_SQL, tuple(row.get(c) for c in UPLOAD_PREVIEW_COLUMNS))
+
+    def many(self, filenames):
+        return self._fetchall("upload_previews.info", UPLOAD_PREVIEWS_INFO_SQL, (json.dumps(list(filenames)),))
+
+    def image(self, filename):
+        return self._fetchone("upload_previews.image", UPLOAD_PREVIEW_IMAGE_SQL, (filename,))
+
+    def unprocessed(self):
+        return [r[0] for r in self._fetchall("upload_previews.unprocessed", UPLOADS_UNPROCESSED_SQL)]
+
+    def failed(self):
+        return [r[0] for r in self._fetchall("upload_previews.failed", UPLOADS_FAILED_SQL)]
+
+
+# --- order change log (admin live feed) ---------------------------------------
+
+ORDER_EVENT_INSERT_SQL = "INSERT INTO order_events (order_id, kind, status, created_at) VALUES (?, ?, ?, ?)"
+# events after a Last-Event-ID with the order's current listing fields (NULL once archived)
+ORDER_EVENTS_SINCE_SQL = (
+    "SELECT e.id, e.order_id, e.kind, e.status, e.created_at AS event_at, o.created_at, o.total, "
+    "o.export_license_status, c.name AS customer_name, c.email AS customer_email FROM order_events e "
+    "LEFT JOIN orders o ON o.id = e.order_id LEFT JOIN customers c ON c.id = o.customer_id "
+    "WHERE e.id > ? ORDER BY e.id LIMIT ?"
+)
+ORDER_EVENTS_BOUNDS_SQL = "SELECT MIN(id), MAX(id) FROM order_events"
+ORDER_EVENTS_PRUNE_SQL = "DELETE FROM order_events WHERE id <= ?"
+# PostgreSQL only: one event-writing transaction at a time, held until it commits
+ORDER_EVENTS_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('webstore.order_events'))"
+
+
+class OrderEventRepo(Repo):
+    def lock(self):
+        """
+        Serialize event inserts until the transaction ends (PostgreSQL; a no-op on SQLite,
+        where BEGIN IMMEDIATE already does). An identity id is taken at insert, not at commit,
+        so without this a concurrent transaction could commit a lower id after a stream has
+        already moved past it, and since() would never return it.
+        """
+        if self.dialect == "postgres":
+            self._fetchall("order_events.lock", ORDER_EVENTS_LOCK_SQL)
+
+    def add(self, order_id, kind, status, created_at):
+        return self._execute("order_events.insert", ORDER_EVENT_INSERT_SQL,
+                             (order_id, kind, status, created_at)).lastrowid
+
+    def since(self, last_id, limit):
+        return self._fetchall("order_events.since", ORDER_EVENTS_SINCE_SQL, (last_id, limit))
+
+    def bounds(self):
+        """(oldest, newest) event id still in the log; (None, None) when empty."""
+        return tuple(self._fetchone("order_events.bounds", ORDER_EVENTS_BOUNDS_SQL))
+
+    def prune(self, up_to_id):
+        self._execute("order_events.prune", ORDER_EVENTS_PRUNE_SQL, (up_to_id,))
+
+
+# --- checkout submission keys ------------------------------------------------
+
+# claim a key: a new row, or take over one whose owner never finished (released rows are deleted)
+CHECKOUT_REQUEST_CLAIM_SQL = (
+    "INSERT INTO checkout_requests (customer_id, idem_key, created_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(customer_id, idem_key) DO UPDATE SET created_at = excluded.created_at "
+    "WHERE order_id IS NULL AND created_at < ?"
+)
+CHECKOUT_REQUEST_GET_SQL = "SELECT order_id, created_at FROM checkout_requests WHERE customer_id = ? AND idem_key = ?"
+CHECKOUT_REQUEST_COMPLETE_SQL = "UPDATE checkout_requests SET order_id = ? WHERE customer_id = ? AND idem_key = ?"
+CHECKOUT_REQUEST_RELEASE_SQL = (
+    "DELETE FROM checkout_requests WHERE customer_id = ? AND idem_key = ? AND order_id IS NULL"
+)
+CHECKOUT_REQUESTS_PRUNE_SQL = "DELETE FROM checkout_requests WHERE created_at < ?"
+
+
+class CheckoutRequestRepo(Repo):
+    def claim(self, customer_id, key, now, stale_before):
+        """True if this caller now owns the key (caller commits)."""
+        return self._execute("checkout_requests.claim", CHECKOUT_REQUEST_CLAIM_SQL,
+                             (customer_id, key, now, stale_before)).rowcount == 1
+
+    def get(self, customer_id, key):
+        return self._fetchone("checkout_requests.get", CHECKOUT_REQUEST_GET_SQL, (customer_id, key))
+
+    def complete(self, customer_id, key, order_id):
+        self._execute("checkout_requests.complete", CHECKOUT_REQUEST_COMPLETE_SQL, (order_id, customer_id, key))
+
+    def release(self, customer_id, key):
+        """Drop an unfinished claim so the same form can be submitted again; no-op once completed."""
+        self._execute("checkout_requests.release", CHECKOUT_REQUEST_RELEASE_SQL, (customer_id, key))
+
+    def prune(self, before):
+        return self._execute("checkout_requests.prune", CHECKOUT_REQUESTS_PRUNE_SQL, (before,)).rowcount
+
+
+# --- analytics rollups ------------------------------------------------------
+# Rows are adjusted by deltas (orders/revenue may be negative for a status moving away),
+# so one upsert statement per table covers both new orders and status changes.
+
+ROLLUP_PRODUCT_ADD_SQL = (
+    "INSERT INTO rollup_product_daily (day, product_id, orders, units, revenue) VALUES (?, ?, 1, ?, ?) "
+    "ON CONFLICT(day, product_id) DO UPDATE SET orders = orders + 1, units = units + excluded.units, "
+    "revenue = revenue + excluded.revenue"
+)
+ROLLUP_STATUS_ADD_SQL = (
+    "INSERT INTO rollup_status_daily (day, status, orders, revenue) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(day, status) DO UPDATE SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue"
+)
+ROLLUP_AGENCY_ADD_SQL = (
+    "INSERT INTO rollup_agency_daily (day, agency_hash, orders, revenue) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(day, agency_hash) DO UPDATE SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue"
+)
+# reports: range scans on the (day, ...) primary keys, independent of the number of orders
+REPORT_DAILY_SQL = (
+    "SELECT day, SUM(orders) AS orders, SUM(revenue) AS revenue FROM rollup_status_daily "
+    "WHERE day BETWEEN ? AND ? AND status != 'cancelled' GROUP BY day ORDER BY day"
+)
+REPORT_STATUS_SQL = (
+    "SELECT status, SUM(orders) AS orders, SUM(revenue) AS revenue FROM rollup_status_daily "
+    "WHERE day BETWEEN ? AND ? GROUP BY status ORDER BY revenue DESC"
+)
+REPORT_PRODUCTS_SQL = (
+    "SELECT p.sku, p.name, p.stock, SUM(r.orders) AS orders, SUM(r.units) AS units, SUM(r.revenue) AS revenue "
+    "FROM rollup_product_daily r JOIN products p ON p.id = r.product_id "
+    "WHERE r.day BETWEEN ? AND ? GROUP BY r.product_id ORDER BY revenue DESC LIMIT ?"
+)
+REPORT_AGENCIES_SQL = (
+    "SELECT agency_hash, SUM(orders) AS orders, SUM(revenue) AS revenue FROM rollup_agency_daily "
+    "WHERE day BETWEEN ? AND ? GROUP BY agency_hash ORDER BY revenue DESC LIMIT ?"
+)
+
+
+class AnalyticsRepo(Repo):
+    def add_product_lines(self, day, lines):
+        """lines: (product_id, units, revenue) for one order."""
+        t0 = time.perf_counter()
+        try:
+            self.db.executemany(ROLLUP_PRODUCT_ADD_SQL, [(day, pid, units, revenue) for pid, units, revenue in lines])
+        finally:
+            _record("rollups.add_product_lines", time.perf_counter() - t0)
+
+    def add_status(self, day, status, orders, revenue):
+        self._execute("rollups.add_status", ROLLUP_STATUS_ADD_SQL, (day, status, orders, revenue))
+
+    def add_agency(self, day, agency_hash, orders, revenue):
+        self._execute("rollups.add_agency", ROLLUP_AGENCY_ADD_SQL, (day, agency_hash, orders, revenue))
+
+    def daily(self, first_day, last_day):
+        return self._fetchall("reports.daily", REPORT_DAILY_SQL, (first_day, last_day))
+
+    def by_status(self, first_day, last_day):
+        return self._fetchall("reports.status", REPORT_STATUS_SQL, (first_day, last_day))
+
+    def top_products(self, first_day, last_day, limit=20):
+        return self._fetchall("reports.products", REPORT_PRODUCTS_SQL, (first_day, last_day, limit))
+
+    def top_agencies(self, first_day, last_day, limit=20):
+        return self._fetchall("reports.agencies", REPORT_AGENCIES_SQL, (first_day, last_day, limit))
+
+
+# --- PostgreSQL dialect -------------------------------------------------------
+# Statements whose SQLite form doesn't carry over by rewriting placeholders and json_each
+# (storage.to_postgres), keyed by the SQLite constant they stand in for. json_each values
+# arrive as text there, so id sets are cast back to integers.
+
+POSTGRES_SQL = {
+    # no LIMIT -1: NULL means no limit
+    PRODUCTS_LIST_SQL: f"SELECT {PRODUCT_COLUMNS} FROM products ORDER BY id LIMIT NULLIF(?, -1)",
+    STOCK_AVAILABLE_SQL: (
+        "SELECT p.id, p.stock - COALESCE((SELECT SUM(h.qty) FROM stock_holds h WHERE h.product_id = p.id "
+        "AND h.expires_at > ?1 AND h.holder != ?2), 0) AS available "
+        "FROM products p WHERE p.id IN (SELECT CAST(value AS BIGINT) FROM json_each(?3))"
+    ),
+    # the status read that rollup bookkeeping adjusts from: hold the row until the update commits
+    ORDER_STATUS_SQL: ORDER_STATUS_SQL + " FOR UPDATE",
+    # NULL filters need a type when nothing else in the expression gives one
+    ORDERS_EXPORT_SQL: ORDERS_EXPORT_SQL.replace("?1 IS NULL", "CAST(?1 AS TEXT) IS NULL")
+                                        .replace("?2 IS NULL", "CAST(?2 AS TEXT) IS NULL")
+                                        .replace("?3 IS NULL", "CAST(?3 AS TEXT) IS NULL"),
+    ORDER_VIEW_UPSERT_SQL: (
+        f"INSERT INTO order_views ({', '.join(ORDER_VIEW_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in ORDER_VIEW_COLUMNS)}) ON CONFLICT (order_id) DO UPDATE SET "
+        + ", ".join(f"{c} = excluded.{c}" for c in ORDER_VIEW_COLUMNS[1:])
+    ),
+    ORDER_VIEWS_DELETE_SQL: "DELETE FROM order_views WHERE order_id IN (SELECT CAST(value AS BIGINT) FROM json_each(?))",
+    UPLOAD_PREVIEW_PUT_SQL: (
+        f"INSERT INTO upload_previews ({', '.join(UPLOAD_PREVIEW_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in UPLOAD_PREVIEW_COLUMNS)}) ON CONFLICT (filename) DO UPDATE SET "
+        + ", ".join(f"{c} = excluded.{c}" for c in UPLOAD_PREVIEW_COLUMNS[1:])
+    ),
+    UPLOADS_UNPROCESSED_SQL: UPLOADS_UNPROCESSED_SQL.replace("digital_signature FROM orders)",
+                                                             "digital_signature FROM orders) u"),
+    # in ON CONFLICT DO UPDATE both the table and `excluded` are in scope: qualify the table's columns
+    CHECKOUT_REQUEST_CLAIM_SQL: CHECKOUT_REQUEST_CLAIM_SQL.replace(
+        "WHERE order_id IS NULL AND created_at < ?",
+        "WHERE checkout_requests.order_id IS NULL AND checkout_requests.created_at < ?"),
+    ROLLUP_PRODUCT_ADD_SQL: ROLLUP_PRODUCT_ADD_SQL.replace("orders = orders", "orders = rollup_product_daily.orders")
+                                                  .replace("units = units", "units = rollup_product_daily.units")
+                                                  .replace("revenue = revenue", "revenue = rollup_product_daily.revenue"),
+    ROLLUP_STATUS_ADD_SQL: ROLLUP_STATUS_ADD_SQL.replace("orders = orders", "orders = rollup_status_daily.orders")
+                                                .replace("revenue = revenue", "revenue = rollup_status_daily.revenue"),
+    ROLLUP_AGENCY_ADD_SQL: ROLLUP_AGENCY_ADD_SQL.replace("orders = orders", "orders = rollup_agency_daily.orders")
+                                                .replace("revenue = revenue", "revenue = rollup_agency_daily.revenue"),
+    # grouped by the products key, so p.sku/p.name/p.stock are functionally dependent
+    REPORT_PRODUCTS_SQL: REPORT_PRODUCTS_SQL.replace("GROUP BY r.product_id", "GROUP BY p.id"),
+}
@@ -0,0 +1,215 @@
+import re
+from datetime import datetime, timezone
+
+from flask import (Blueprint, abort, current_app, flash, jsonify, redirect, render_template,
+                   render_template_string, request, send_from_directory, session, url_for)
+
+from . import stock_holds
+from .cart import load_customer_cart, merge_carts, save_customer_cart
+from .catalogue import get_catalogue
+from .db import get_db, get_read_db
+from .passwords import HashingBusy, RateLimited, get_password_engine
+from .repos import CustomerRepo, ProductRepo
+
+bp = Blueprint("shop", __name__)
+
+
+def _throttled(template, exc):
+    """Re-render a login/register form: 429 when rate limited, 503 when the hashing pool is full."""
+    if isinstance(exc, RateLimited):
+        flash(f"Too many attempts. Please try again in {exc.retry_after} seconds.", "danger")
+        return render_template(template), 429, {"Retry-After": str(exc.retry_after)}
+    flash("The server is busy. Please try again in a moment.", "warning")
+    return render_template(template), 503, {"Retry-After": "1"}
+
+
+def get_products(limit=None, max_staleness=None):
+    """Catalogue rows as dicts; max_staleness defaults to CATALOGUE_MAX_STALENESS (see db.get_read_db)."""
+    if max_staleness is None:
+        max_staleness = current_app.config["CATALOGUE_MAX_STALENESS"]
+    return ProductRepo(get_read_db(max_staleness)).list(limit)
+
+@bp.route("/")
+def index():
+    featured = get_products(limit=3)
+    return render_template("index.html", featured=featured)
+
+@bp.route("/about")
+def about():
+    return render_template("about.html")
+
+@bp.route("/products")
+def products():
+    prods = get_products()
+    layout = get_catalogue().layout.arrange(prods)
+    return render_template("products.html", layout=layout)
+
+@bp.route("/product/<sku>")
+def product_detail(sku):
+    products_repo = ProductRepo(get_read_db(current_app.config["CATALOGUE_MAX_STALENESS"]))
+    p = products_repo.get_by_sku(sku.upper())
+    if not p:
+        return redirect(url_for("shop.products"))
+    return render_template("product_detail.html", product=p)
+
+# --- Auth routes: register / login / logout ---
+@bp.route("/register", methods=["GET", "POST"])
+def register():
+    if request.method == "GET":
+        return render_template("register.html")
+    name = (request.form.get("name") or "").strip()
+    email = (request.form.get("email") or "").strip().lower()
+    password = request.form.get("password") or ""
+
+    # password policy: >8 chars (min 9), at least 1 lower, 1 upper, and 1 digit
+    pwd_pattern = re.compile(r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d).{9,}$')
+    if not pwd_pattern.match(password):
+        flash("Password must be at greater than 8 characters and include one uppercase letter, one lowercase letter and one number.", "danger")
+        return redirect(url_for("shop.register"))
+    if not email or not password or not name:
+        flash("Name, email and password required.", "danger")
+        return redirect(url_for("shop.register"))
+    engine = get_password_engine()
+    try:
+        engine.throttle(ip=request.remote_addr)
+    except RateLimited as e:
+        return _throttled("register.html", e)
+    db = get_db()
+    customers = CustomerRepo(db)
+    if customers.by_email(email):
+        flash("Account already exists for that email.", "warning")
+        return redirect(url_for("shop.login"))
+    try:
+        pw_hash = engine.hash(password)
+    except HashingBusy as e:
+        return _throttled("register.html", e)
+    created_at = datetime.utcnow().isoformat()
+    customer_id = customers.create(name, email, created_at, pw_hash)
+    db.commit()
+    session["customer_id"] = customer_id
+    session["customer_name"] = name
+    session.permanent = False
+    session["last_active"] = datetime.now(timezone.utc).timestamp()
+    session["created_at"] = datetime.now(timezone.utc).timestamp()
+    # if there is a session cart, save it to DB
+    if session.get("cart"):
+        save_customer_cart(session["customer_id"], session["cart"])
+    return redirect(url_for("shop.products"))
+
+@bp.route("/login", methods=["GET", "POST"])
+def login():
+    if request.method == "GET":
+        return render_template("login.html")
+    email = (request.form.get("email") or "").strip().lower()
+    password = request.form.get("password") or ""
+    engine = get_password_engine()
+    try:
+        engine.throttle(email=email, ip=request.remote_addr)
+    except RateLimited as e:
+        return _throttled("login.html", e)
+    db = get_db()
+    customers = CustomerRepo(db)
+    row = customers.by_email(email)
+    if not row:
+        flash("Invalid email or password.", "danger")
+        return redirect(url_for("shop.login"))
+    if not row["password"]:
+        flash("Invalid email or password.", "danger")
+        return redirect(url_for("shop.login"))
+    try:
+        ok = engine.verify(row["password"], password)
+    except HashingBusy as e:
+        return _throttled("login.html", e)
+    if not ok:
+        flash("Invalid email or password.", "danger")
+        return redirect(url_for("shop.login"))
+    if engine.needs_rehash(row["password"]):
+        # upgrade the stored hash to PASSWORD_HASH_METHOD now that we know the password
+        try:
+            customers.rehash_password(row["id"], row["password"], engine.hash(password))
+            db.commit()
+        except HashingBusy:
+            pass  # try again on a later login
+    # login success — merge session cart with stored cart and persist
+    stored = load_customer_cart(row["id"])
+    sess_cart = session.get("cart", {}) or {}
+    merged = merge_carts(sess_cart, stored)
+    session["customer_id"] = row["id"]
+    session["customer_name"] = row["name"]
+    session.permanent = False
+    session["last_active"] = datetime.now(timezone.utc).timestamp()
+    session["created_at"] = datetime.now(timezone.utc).timestamp()
+    session["cart"] = merged
+    save_customer_cart(row["id"], merged)
+    current_app.logger.info("Customer %s logged in", row["id"])
+    flash("Logged in.", "success")
+    return redirect(url_for("shop.products"))
+
+@bp.route("/logout")
+def logout():
+    # release this session's stock holds, then fully clear session on customer logout
+    holder = session.get(stock_holds.HOLDER_SESSION_KEY)
+    if holder:
+        stock_holds.release_all(get_db(), holder)
+    session.clear()
+    flash("Logged out.", "info")
+    return redirect(url_for("shop.products"))
+
+@bp.route("/easter-egg", methods=["GET"])
+def easter_egg():
+    """
+    Hidden easter-egg: teacher can visit /easter-egg?code=<secret>
+    If the code matches TEACHER_EGG_CODE, mark session and show a small secret message.
+    Returns 404 when code is not provided or incorrect to remain hidden.
+    """
+    code = (request.args.get("code") or "").strip()
+    if not code or code != current_app.config["TEACHER_EGG_CODE"]:
+        # intentionally return 404 so the endpoint is stealthy
+        return ("", 404)
+
+    # mark found in session so pages can optionally show a badge for the teacher
+    session["found_easter_egg"] = True
+    secret_html = """
+    <!doctype html>
+    <html lang="en"><head><meta charset="utf-8"><title>Secret Found</title>
+    <style>body{font-family:system-ui,Segoe UI,Roboto,Arial;margin:48px;color:#0b3d2e} .box{border:2px dashed #9db89a;padding:24px;border-radius:8px;background:#f6fbf2}</style>
+    </head><body>
+    <div class="box">
+      <h2>🎉 Secret found!</h2>
+      <p>Nice work — the easter egg is active for this session.</p>
+      <p><strong>Teacher note:</strong> you can now see the <code>found_easter_egg</code> flag in your session.</p>
+      <p style="margin-top:12px;"><a href="/snake" style="display:inline-block;padding:8px 12px;background:#0b3d2e;color:#fff;border-radius:6px;text-decoration:none;">Play Snake</a></p>
+      <p style="font-family:monospace;background:#fff;padding:6px;border-radius:4px;display:inline-block;margin-top:8px;">Keep smiling, CS Teacher!</p>
+    </div>
+    </body></html>
+    """
+    return render_template_string(secret_html)
+
+@bp.route("/snake")
+def snake():
+    # require easter-egg flag in session
+    if not session.get("found_easter_egg"):
+        return ("", 404)
+    return render_template("snake.html")
+
+@bp.route("/about/egg", methods=["GET"])
+def about_egg():
+    """
+    Visit /about/egg to unlock the About-page easter egg for this session.
+    Sets session['found_about_egg'] = True and redirects back to /about.
+    """
+    session["found_about_egg"] = True
+    return redirect(url_for("shop.about"))
+
+@bp.route("/sw.js")
+def service_worker():
+    # serve the static service worker file at site root so its scope is '/'
+    return send_from_directory(current_app.static_folder, "sw.js", mimetype="application/javascript")
+
+@bp.route("/debug/session")
+def debug_session():
+    # dev-only: allow when app.debug or request from localhost
+    if not current_app.debug and request.remote_addr not in ("127.0.0.1", "::1"):
+        abort(403)
+    # convert session values to strings for JSON safety
+    return jsonify({k: str(v) for k, v in session.items()}), 200
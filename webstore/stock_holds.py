@@ -0,0 +1,148 @@
+"""Time-limited stock holds: adding to the cart reserves the units for STOCK_HOLD_SECONDS.
+
+Each browser session gets a holder id (kept in the session cookie). cart_add and
+the checkout page put (holder, product, qty) rows into stock_holds with an expiry;
+the stock anyone else can take is products.stock minus the other holders' live
+holds (StockHoldRepo.available), so a scarce SKU like the single B2 can only sit
+in one cart at a time. Checkout re-takes the holds before any upload or encryption
+work, so a shortage is reported up front, and then converts them into the stock
+decrement in the order's transaction. Both check and write inside one transaction
+that holds the SQLite write lock (BEGIN IMMEDIATE) or, on PostgreSQL, row locks on
+the products involved (ProductRepo.lock), so concurrent carts can't oversell.
+
+Expired holds stop counting immediately; the sweeper thread only deletes them (in
+batches of STOCK_HOLD_SWEEP_BATCH) to keep the table small. It is started by the
+first request each process serves (init_app), so scripts that only build the app
+never run it and every forked worker of a pre-fork server gets its own.
+"""
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, session
+
+from .repos import ProductRepo, StockHoldRepo
+from .storage import database_errors, get_storage
+
+HOLDER_SESSION_KEY = "hold_id"
+
+_sweeper_lock = threading.Lock()
+
+
+def holder_id():
+    """This session's holder id, created on first use."""
+    holder = session.get(HOLDER_SESSION_KEY)
+    if not holder:
+        holder = session[HOLDER_SESSION_KEY] = secrets.token_urlsafe(16)
+    return holder
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+def _expiry():
+    return (datetime.utcnow() + timedelta(seconds=current_app.config["STOCK_HOLD_SECONDS"])).isoformat()
+
+
+def hold(db, holder, wanted):
+    """
+    (Re)place holds for {product_id: qty} and commit. Each hold is capped at what is
+    available to this holder and gets a fresh expiry. Returns {product_id: granted qty}.
+    """
+    holds = StockHoldRepo(db)
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        ProductRepo(db).lock(wanted.keys())
+        available = holds.available(wanted.keys(), holder, _now())
+        expires_at = _expiry()
+        granted = {}
+        for product_id, qty in wanted.items():
+            granted[product_id] = min(qty, available.get(product_id, 0))
+            if granted[product_id] > 0:
+                holds.put(holder, product_id, granted[product_id], expires_at)
+            else:
+                holds.delete(holder, product_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return granted
+
+
+def release(db, holder, product_id):
+    StockHoldRepo(db).delete(holder, product_id)
+    db.commit()
+
+
+def release_all(db, holder):
+    StockHoldRepo(db).delete_holder(holder)
+    db.commit()
+
+
+def available_now(db, holder, product_ids):
+    """{product_id: units `holder` may take}; call inside the write transaction that takes them
+    (on PostgreSQL the product rows stay locked until it ends)."""
+    ProductRepo(db).lock(product_ids)
+    return StockHoldRepo(db).available(product_ids, holder, _now())
+
+
+def sweep_expired(storage, batch):
+    """Delete expired holds in batches of `batch` (short write transactions); returns the count."""
+    conn = storage.connect(timeout=30)
+    try:
+        holds, total = StockHoldRepo(conn), 0
+        while True:
+            removed = holds.sweep(_now(), batch)
+            conn.commit()
+            total += removed
+            if removed < batch:
+                return total
+    finally:
+        conn.close()
+
+
+def start_sweeper(app):
+    """Start the expired-hold sweeper thread (once per app per process) when STOCK_HOLD_SWEEP_SECONDS > 0."""
+    interval = app.config.get("STOCK_HOLD_SWEEP_SECONDS") or 0
+    state = app.extensions["webstore"]
+    # keyed on the pid: a thread started before fork() doesn't exist in the child
+    pid = os.getpid()
+    if interval <= 0 or state.get("stock_hold_sweeper_pid") == pid:
+        return None
+    with _sweeper_lock:
+        if state.get("stock_hold_sweeper_pid") == pid:
+            return None
+        state["stock_hold_sweeper_pid"] = pid
+    storage, batch, logger = get_storage(app), app.config["STOCK_HOLD_SWEEP_BATCH"], app.logger
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                removed = sweep_expired(storage, batch)
+                if removed:
+                    logger.debug("Swept %d expired stock holds", removed)
+            except database_errors() as e:
+                # e.g. the schema hasn't been created yet (first request not served)
+                logger.debug("Stock hold sweep skipped: %s", e)
+            except Exception:
+                logger.exception("Stock hold sweep failed")
+
+    thread = threading.Thread(target=run, name="stock-hold-sweeper", daemon=True)
+    thread.start()
+    state["stock_hold_sweeper"] = thread
+    return thread
+
+
+def init_app(app):
+    """Start the sweeper from the first request each process serves (not from create_app)."""
+    if not app.config.get("STOCK_HOLD_SWEEP_SECONDS"):
+        return
+
+    def _start_sweeper():
+        start_sweeper(app)
+
+    app.before_request(_start_sweeper)
@@ -0,0 +1,339 @@
+"""Storage backends: where get_db()/get_read_db() connections come from.
+
+SQLiteStorage is the default: one sqlite3 file (DB_PATH), a new connection per
+request, the write lock taken with BEGIN IMMEDIATE. With DATABASE_URL set
+(postgresql://...), PostgresStorage is used instead: connections come from a
+psycopg_pool.ConnectionPool per process (PG_POOL_MIN_SIZE..PG_POOL_MAX_SIZE,
+waiting up to PG_POOL_TIMEOUT seconds for a free one), so several app nodes can
+write at once and checkout serialises on the product rows it touches
+(SELECT ... FOR UPDATE) instead of on the whole database.
+
+PgConnection makes a pooled connection look like the sqlite3 connections the
+rest of the app was written against: execute()/executemany() return cursors with
+fetchone/fetchall/fetchmany/rowcount/lastrowid, rows can be read by index or
+column name, BEGIN is implicit, and set_trace_callback works (metrics). The SQL
+is the same repos.py constants, rewritten once per statement by to_postgres():
+placeholders, json_each, `main.` and lastrowid; statements that need more than
+that have a hand-written PostgreSQL version in repos.POSTGRES_SQL.
+
+Tools that work on the SQLite file itself (archive, backups, the read snapshot,
+the ASGI read pool, the rollup rebuild) stay SQLite-only.
+
+psycopg and psycopg_pool are optional: they are imported when a PostgreSQL
+backend is first used (pip install "psycopg[binary]" psycopg-pool).
+"""
+import os
+import re
+import sqlite3
+import sys
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+# tables whose INSERTs report the new row id (cursor.lastrowid) on PostgreSQL
+LASTROWID_TABLES = ("products", "customers", "orders", "order_items", "order_events")
+
+_QUOTED = re.compile(r"('(?:[^']|'')*')")
+_NUMBERED = re.compile(r"\?(\d+)")
+_JSON_EACH = re.compile(r"json_each\(([^()]*)\)(?:\s+(?!(?:WHERE|JOIN|ON|ORDER|GROUP|LIMIT|UNION)\b)(\w+))?")
+_MAIN_SCHEMA = re.compile(r"\bmain\.")
+_BEGIN = re.compile(r"\s*BEGIN(\s+(DEFERRED|IMMEDIATE|EXCLUSIVE))?\s*;?\s*$", re.IGNORECASE)
+_INSERT = re.compile(r"\s*INSERT\s+INTO\s+(\w+)", re.IGNORECASE)
+
+
+def uses_postgres(config):
+    return bool(config.get("DATABASE_URL"))
+
+
+def database_errors():
+    """Exception types a query can raise: sqlite3.Error, plus psycopg.Error once PostgreSQL is in use."""
+    psycopg = sys.modules.get("psycopg")
+    return (sqlite3.Error, psycopg.Error) if psycopg else (sqlite3.Error,)
+
+
+def storage_for(config):
+    """A new backend for a config dict (PostgreSQL when DATABASE_URL is set), e.g. for scripts."""
+    return (PostgresStorage if uses_postgres(config) else SQLiteStorage)(config)
+
+
+def get_storage(app):
+    """The app's storage backend, built on first use."""
+    state = app.extensions["webstore"]
+    storage = state.get("storage")
+    if storage is None:
+        storage = state["storage"] = storage_for(app.config)
+    return storage
+
+
+# --- SQLite -------------------------------------------------------------------
+
+class SQLiteStorage:
+    dialect = "sqlite"
+
+    def __init__(self, config):
+        self.db_path = config["DB_PATH"]
+        self.cached_statements = config.get("SQLITE_CACHED_STATEMENTS", 128)
+        self.journal_mode = config.get("SQLITE_JOURNAL_MODE")
+
+    def connect(self, timeout=5.0):
+        """A read-write connection (row factory set, foreign keys on)."""
+        conn = sqlite3.connect(self.db_path, timeout=timeout, cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON;")
+        return conn
+
+    def connect_read(self, path=None):
+        """A read-only connection to the database (or to `path`, e.g. the read snapshot)."""
+        return connect_sqlite_ro(path or self.db_path, self.cached_statements)
+
+    def ensure_schema(self):
+        from .db import ensure_schema
+        ensure_schema(self.db_path, self.journal_mode)
+
+
+def connect_sqlite_ro(path, cached_statements=128):
+    """Open a read-only connection (a stray write raises instead of taking the write lock)."""
+    conn = sqlite3.connect(f"file:{Path(path).as_posix()}?mode=ro", uri=True, cached_statements=cached_statements)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# --- PostgreSQL ---------------------------------------------------------------
+
+class PostgresStorage:
+    dialect = "postgres"
+
+    def __init__(self, config):
+        self.url = config["DATABASE_URL"]
+        self.min_size = config.get("PG_POOL_MIN_SIZE", 2)
+        self.max_size = config.get("PG_POOL_MAX_SIZE", 10)
+        self.timeout = config.get("PG_POOL_TIMEOUT", 30.0)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        # pools inherited across fork(): never closed here, that would end the parent's sessions
+        self._inherited = []
+
+    def pool(self):
+        """This process's connection pool (created on first use, and again in a forked child)."""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    from psycopg_pool import ConnectionPool
+                    if self._pool is not None:
+                        self._inherited.append(self._pool)
+                    self._pool = ConnectionPool(
+                        self.url, min_size=self.min_size, max_size=self.max_size, timeout=self.timeout,
+                        kwargs={"row_factory": _row_factory}, name=f"webstore-{pid}", open=True,
+                    )
+                    self._pid = pid
+        return self._pool
+
+    def connect(self, timeout=None):
+        return PgConnection(self.pool(), timeout=timeout)
+
+    def connect_read(self, path=None):
+        """A pooled connection in autocommit mode: every query sees the latest committed data."""
+        return PgConnection(self.pool(), autocommit=True)
+
+    def ensure_schema(self):
+        from .db import POSTGRES_SCHEMA
+        conn = self.connect()
+        try:
+            # several workers may start at once: one creates, the others wait and find it done
+            conn.execute("SELECT pg_advisory_xact_lock(hashtext('webstore.schema'))")
+            conn.raw.execute(POSTGRES_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.close()
+        self._pool = self._pid = None
+
+
+class Row:
+    """A result row readable like sqlite3.Row: row[0], row["name"], keys(), dict(row), tuple(row)."""
+
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise IndexError("No item with that key") from None
+        return self._values[key]
+
+    def keys(self):
+        return list(self._index.names)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        return isinstance(other, Row) and self._values == other._values and self._index.names == other._index.names
+
+    def __hash__(self):
+        return hash(tuple(self._values))
+
+    def __repr__(self):
+        return f"Row({dict(zip(self._index.names, self._values))!r})"
+
+
+class _ColumnIndex(dict):
+    """{column name: position} for one result shape (first position wins, like sqlite3.Row)."""
+
+    def __init__(self, names):
+        super().__init__()
+        self.names = tuple(names)
+        for i, name in enumerate(self.names):
+            self.setdefault(name, i)
+
+
+def _row_factory(cursor):
+    description = cursor.description
+    if description is None:
+        return tuple
+    index = _ColumnIndex(d.name for d in description)
+    return lambda values: Row(values, index)
+
+
+class PgCursor:
+    """The sqlite3.Cursor subset the app uses, over a psycopg cursor."""
+
+    __slots__ = ("_cur", "lastrowid")
+
+    def __init__(self, cur, lastrowid=None):
+        self._cur = cur
+        self.lastrowid = lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def fetchone(self):
+        return self._cur.fetchone() if self._cur.description else None
+
+    def fetchall(self):
+        return self._cur.fetchall() if self._cur.description else []
+
+    def fetchmany(self, size=1):
+        return self._cur.fetchmany(size) if self._cur.description else []
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cur.close()
+
+
+class PgConnection:
+    """A pooled psycopg connection with the sqlite3.Connection interface the app relies on.
+
+    Transactions start implicitly with the first statement, as in sqlite3's default
+    mode; "BEGIN [IMMEDIATE]" ends a read-only transaction left open by earlier
+    SELECTs and is otherwise a no-op. close() rolls back anything uncommitted and
+    returns the connection to the pool.
+    """
+
+    dialect = "postgres"
+
+    def __init__(self, pool, autocommit=False, timeout=None):
+        self._pool = pool
+        self.raw = pool.getconn(timeout=timeout)
+        self.raw.autocommit = autocommit
+        self._trace = None
+
+    def set_trace_callback(self, callback):
+        self._trace = callback
+
+    def execute(self, sql, params=()):
+        if _BEGIN.match(sql):
+            self._begin()
+            return PgCursor(self.raw.cursor())
+        pg_sql, numbered, returns_id = to_postgres(sql, True)
+        cur = self.raw.cursor()
+        cur.execute(pg_sql, _bind(params, numbered))
+        if self._trace is not None:
+            self._trace(pg_sql)
+        if returns_id:
+            return PgCursor(cur, cur.fetchone()[0])
+        return PgCursor(cur)
+
+    def executemany(self, sql, seq_of_params):
+        pg_sql, numbered, _ = to_postgres(sql, False)
+        cur = self.raw.cursor()
+        cur.executemany(pg_sql, [_bind(p, numbered) for p in seq_of_params])
+        if self._trace is not None:
+            self._trace(pg_sql)
+        return PgCursor(cur)
+
+    def _begin(self):
+        from psycopg.pq import TransactionStatus
+        if self.raw.info.transaction_status == TransactionStatus.INTRANS:
+            self.raw.commit()  # only SELECTs ran so far (sqlite3 wouldn't have opened a transaction)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        raw, self.raw = self.raw, None
+        if raw is None:
+            return
+        try:
+            if not raw.closed and not raw.autocommit:
+                raw.rollback()
+            raw.autocommit = False
+        finally:
+            self._pool.putconn(raw)
+
+
+def _bind(params, numbered):
+    if numbered:
+        return {f"p{i}": v for i, v in enumerate(params, 1)}
+    return tuple(params)
+
+
+def to_postgres(sql, lastrowid=True):
+    """(PostgreSQL SQL, uses numbered parameters, appends RETURNING id) for a repos.py-style statement."""
+    from .repos import POSTGRES_SQL
+    return _translate(POSTGRES_SQL.get(sql, sql), lastrowid)
+
+
+@lru_cache(maxsize=512)
+def _translate(sql, lastrowid):
+    parts = _QUOTED.split(sql.replace("%", "%%"))
+    numbered = False
+    for i in range(0, len(parts), 2):  # even parts are outside string literals
+        part = _JSON_EACH.sub(
+            lambda m: f"json_array_elements_text({m.group(1)}::json) AS {m.group(2) or 'json_each'}(value)", parts[i])
+        if _NUMBERED.search(part):
+            numbered = True
+            part = _NUMBERED.sub(r"%(p\1)s", part)
+        part = part.replace("?", "%s")
+        part = _MAIN_SCHEMA.sub("", part)
+        parts[i] = part
+    out = "".join(parts)
+    insert = _INSERT.match(out)
+    returns_id = bool(lastrowid and insert and insert.group(1).lower() in LASTROWID_TABLES
+                      and not re.search(r"\b(RETURNING|ON\s+CONFLICT)\b", out, re.IGNORECASE))
+    if returns_id:
+        out += " RETURNING id"
+    return out, numbered, returns_id
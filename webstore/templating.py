@@ -0,0 +1,43 @@
+"""Compiled-template caching, so a new worker doesn't compile every template on first use.
+
+init_app() gives the Jinja environment a FileSystemBytecodeCache in TEMPLATE_CACHE_DIR,
+shared by all workers and kept across restarts. Jinja writes entries atomically and
+checks them against the template source's checksum, so an edited template is simply
+recompiled. The async overlay in asgi.py compiles different code from the same source
+and keeps its own entries (ASYNC_CACHE_PATTERN).
+
+precompile() loads every template into an environment's in-memory cache (from the
+bytecode cache when it has them). With TEMPLATE_PRECOMPILE, create_app() does this at
+startup, so a pre-fork server (gunicorn --preload, benchmarks/serve.py) hands its
+workers compiled templates; benchmarks/template_warmup.py measures the difference.
+"""
+from pathlib import Path
+
+from jinja2 import FileSystemBytecodeCache
+
+CACHE_PATTERN = "__jinja2_%s.cache"
+ASYNC_CACHE_PATTERN = "__jinja2_async_%s.cache"
+
+
+def bytecode_cache(app, pattern=CACHE_PATTERN):
+    """A FileSystemBytecodeCache in TEMPLATE_CACHE_DIR, or None when that is unset."""
+    cache_dir = app.config.get("TEMPLATE_CACHE_DIR")
+    if not cache_dir:
+        return None
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    return FileSystemBytecodeCache(str(cache_dir), pattern)
+
+
+def precompile(env):
+    """Load every template the environment can find; returns how many."""
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def init_app(app):
+    """Install the bytecode cache; must run before anything touches app.jinja_env."""
+    cache = bytecode_cache(app)
+    if cache is not None:
+        app.jinja_options = {**app.jinja_options, "bytecode_cache": cache}
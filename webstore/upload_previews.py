@@ -0,0 +1,231 @@
+"""Background preprocessing of checkout uploads for the admin order review page.
+
+After an order commits, checkout() hands its uploaded documents (auth_doc,
+end_user_cert, digital_signature) to enqueue(). A small per-process thread pool
+(UPLOAD_PREVIEW_WORKERS; 0 = inline) then inspects each file and stores the
+results in upload_previews, keyed by the upload's filename:
+  - PDFs (read with pypdf, pure Python): page count, first-page size, document
+    info (title, author, producer, dates) and, for scanned documents, the
+    first page's JPEG image as the preview (JPEG streams are stored as they are,
+    nothing is rendered or re-encoded);
+  - JPEG/PNG: pixel size, and the image itself as the preview, or for JPEGs
+    over the size cap the EXIF thumbnail most cameras and scanners embed.
+Previews larger than PREVIEW_MAX_BYTES are not kept, so admin_order_detail
+loads a few kilobytes per document; the full file is still one click away
+(admin_download_upload). Failures (corrupt or encrypted PDFs, pypdf missing)
+are stored as status 'failed' with the reason. scripts/preprocess_uploads.py
+processes uploads from before this existed.
+"""
+import json
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from .repos import UploadPreviewRepo
+from .storage import get_storage
+
+UPLOAD_FIELDS = ("auth_doc", "end_user_cert", "digital_signature")
+PREVIEW_MAX_BYTES = 256 * 1024
+# document info entries shown to admins (pypdf DocumentInformation keys)
+PDF_META_KEYS = {"/Title": "title", "/Author": "author", "/Subject": "subject", "/Creator": "creator",
+                 "/Producer": "producer", "/CreationDate": "created", "/ModDate": "modified"}
+META_VALUE_CHARS = 200
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# --- file inspection ----------------------------------------------------------
+
+def _jpeg_size(data):
+    """(width, height) from a JPEG's SOF marker, or None."""
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def _exif_thumbnail(data):
+    """The JPEG thumbnail in a JPEG's EXIF block (IFD1), or None."""
+    i = 2
+    while i + 4 < len(data) and data[i] == 0xFF:
+        marker, length = data[i + 1], struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker == 0xE1 and data[i + 4:i + 10] == b"Exif\0\0":
+            tiff = data[i + 10:i + 2 + length]
+            endian = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+            if endian is None:
+                return None
+            try:
+                ifd0 = struct.unpack(endian + "I", tiff[4:8])[0]
+                count = struct.unpack(endian + "H", tiff[ifd0:ifd0 + 2])[0]
+                ifd1 = struct.unpack(endian + "I", tiff[ifd0 + 2 + 12 * count:ifd0 + 6 + 12 * count])[0]
+                if not ifd1:
+                    return None
+                offset = size = None
+                for n in range(struct.unpack(endian + "H", tiff[ifd1:ifd1 + 2])[0]):
+                    entry = ifd1 + 2 + 12 * n
+                    tag = struct.unpack(endian + "H", tiff[entry:entry + 2])[0]
+                    value = struct.unpack(endian + "I", tiff[entry + 8:entry + 12])[0]
+                    if tag == 0x0201:
+                        offset = value
+                    elif tag == 0x0202:
+                        size = value
+            except struct.error:
+                return None
+            thumb = tiff[offset:offset + size] if offset and size else b""
+            return thumb if thumb[:2] == b"\xff\xd8" else None
+        if marker == 0xDA:  # start of scan: no more metadata segments
+            return None
+        i += 2 + length
+    return None
+
+
+def _inspect_jpeg(data):
+    width, height = _jpeg_size(data) or (None, None)
+    preview = data if len(data) <= PREVIEW_MAX_BYTES else _exif_thumbnail(data)
+    return {"kind": "jpeg", "width": width, "height": height, "preview": preview,
+            "preview_type": "image/jpeg" if preview else None}
+
+
+def _inspect_png(data):
+    width, height = struct.unpack(">II", data[16:24]) if data[12:16] == b"IHDR" else (None, None)
+    preview = data if len(data) <= PREVIEW_MAX_BYTES else None
+    return {"kind": "png", "width": width, "height": height, "preview": preview,
+            "preview_type": "image/png" if preview else None}
+
+
+def _pdf_text(value):
+    text = str(value).strip()
+    if len(text) >= 10 and text.startswith("D:") and text[2:10].isdigit():
+        # PDF date "D:YYYYMMDDHHmmSS+hh'mm'" -> "YYYY-MM-DD HH:mm"
+        digits = (text[2:14] + "0000")[:12]
+        return f"{digits[:4]}-{digits[4:6]}-{digits[6:8]} {digits[8:10]}:{digits[10:12]}"
+    return text[:META_VALUE_CHARS] if text else None
+
+
+def _first_page_jpeg(page):
+    """The largest JPEG (DCTDecode) image on a PDF page that fits PREVIEW_MAX_BYTES, or None."""
+    best = None
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    for ref in (xobjects.get_object().values() if xobjects else ()):
+        obj = ref.get_object()
+        if obj.get("/Subtype") != "/Image":
+            continue
+        filters = obj.get("/Filter")
+        filters = [filters] if isinstance(filters, str) else list(filters or ())
+        if filters != ["/DCTDecode"]:
+            continue
+        data = obj.get_data()  # DCTDecode data is the JPEG file itself
+        if len(data) <= PREVIEW_MAX_BYTES and (best is None or len(data) > len(best)):
+            best = data
+    return best
+
+
+def _inspect_pdf(path):
+    from pypdf import PdfReader  # optional dependency: only the preprocessing worker needs it
+
+    reader = PdfReader(str(path))
+    if reader.is_encrypted:
+        raise ValueError("PDF is encrypted")
+    info = reader.metadata or {}
+    meta = {label: _pdf_text(info[key]) for key, label in PDF_META_KEYS.items() if key in info}
+    first = reader.pages[0] if len(reader.pages) else None
+    preview = None
+    if first is not None:
+        box = first.mediabox
+        meta["page_size_pt"] = f"{float(box.width):.0f} x {float(box.height):.0f}"
+        preview = _first_page_jpeg(first)
+    return {"kind": "pdf", "pages": len(reader.pages), "meta": {k: v for k, v in meta.items() if v},
+            "preview": preview, "preview_type": "image/jpeg" if preview else None}
+
+
+def inspect(path):
+    """Page count / size, metadata and preview bytes for one uploaded file (see module docstring)."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        head = f.read(32)
+    if head.startswith(b"%PDF-"):
+        result = _inspect_pdf(path)
+    elif head.startswith(b"\xff\xd8"):
+        result = _inspect_jpeg(path.read_bytes())
+    elif head.startswith(b"\x89PNG\r\n\x1a\n"):
+        result = _inspect_png(path.read_bytes())
+    else:
+        raise ValueError("not a PDF, JPEG or PNG file")
+    result["size"] = path.stat().st_size
+    return result
+
+
+# --- processing ---------------------------------------------------------------
+
+def process(conn, uploads_dir, filename):
+    """Inspect one upload and store the result (done or failed); commits. Returns the status."""
+    row = {"filename": filename, "created_at": datetime.utcnow().isoformat()}
+    try:
+        result = inspect(Path(uploads_dir) / filename)
+        row.update(result, status="done", meta=json.dumps(result.get("meta") or {}))
+    except Exception as e:  # corrupt/hostile uploads must not stop the worker
+        row.update(status="failed", error=f"{type(e).__name__}: {e}"[:500])
+    UploadPreviewRepo(conn).put(row)
+    conn.commit()
+    return row["status"]
+
+
+def _process_files(storage, uploads_dir, filenames, logger):
+    conn = storage.connect(timeout=30)
+    try:
+        for filename in filenames:
+            if process(conn, uploads_dir, filename) == "failed":
+                logger.warning("Upload preprocessing failed for %s", filename)
+    except Exception:
+        logger.exception("Upload preprocessing failed")
+    finally:
+        conn.close()
+
+
+def _executor(workers):
+    # created lazily and per process: a pool inherited across fork() has no threads
+    pid = os.getpid()
+    with _pools_lock:
+        if _pools.get("pid") != pid:
+            _pools.clear()
+            _pools.update(pid=pid, pool=ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload-preview"))
+        return _pools["pool"]
+
+
+def enqueue(app, filenames):
+    """Preprocess these uploads in the background (inline when UPLOAD_PREVIEW_WORKERS is 0)."""
+    filenames = [f for f in filenames if f]
+    if not filenames:
+        return
+    args = (get_storage(app), app.config["PRIVATE_UPLOADS"], filenames, app.logger)
+    workers = app.config["UPLOAD_PREVIEW_WORKERS"]
+    if workers <= 0:
+        _process_files(*args)
+    else:
+        _executor(workers).submit(_process_files, *args)
+
+
+def previews_for(db, filenames):
+    """{filename: preview row (without the image bytes)} for the uploads that have been processed."""
+    rows = UploadPreviewRepo(db).many([f for f in filenames if f])
+    out = {}
+    for row in rows:
+        info = dict(row)
+        info["meta"] = json.loads(info["meta"]) if info["meta"] else {}
+        out[row["filename"]] = info
+    return out